@@ -0,0 +1,130 @@
+"""Бенчмарк сборки документов фильмов из строк join фильм × персона × жанр
+
+Сравнивает assemble_films с прежней реализацией transform_data на синтетических данных.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmarks.bench_assembler [количество строк] [персон в фильме]
+"""
+import sys
+from collections.abc import Iterator
+from datetime import datetime
+from timeit import repeat
+from typing import List
+from uuid import uuid4
+
+from database.data_classes import FilmWorkElastic
+from pipeline.transform import assemble_films
+
+ROLES = ('actor', 'director', 'writer')
+
+
+def make_rows(rows: int, persons_per_film: int = 30, genres_per_film: int = 4) -> List[FilmWorkElastic]:
+    """Сгенерировать строки join: для каждого фильма — все сочетания его персон и жанров"""
+    now = datetime.now()
+    genres = [(str(uuid4()), 'genre {0}'.format(number)) for number in range(20)]
+    result = []
+    while len(result) < rows:
+        fw_id = str(uuid4())
+        persons = [
+            (str(uuid4()), 'person {0}'.format(number), ROLES[number % len(ROLES)])
+            for number in range(persons_per_film)
+        ]
+        for person_id, full_name, role in persons:
+            for g_id, name in genres[:genres_per_film]:
+                result.append(FilmWorkElastic(
+                    fw_id, 'title', now, 'description', 7.5, 'movie', now, now,
+                    role, person_id, full_name, name, g_id
+                ))
+    return result[:rows]
+
+
+def legacy_transform_data(movies_pg: Iterator[FilmWorkElastic]) -> Iterator:
+    """Прежняя реализация transform_data из main.py (для сравнения)
+
+    Args:
+        movies_pg: Фильмы из PG
+
+    Returns:
+        (List[Dict[str, Any]]): Список фильмов для Elastic
+    """
+
+    compare_fw_id = None
+    movie_es = None
+    movies_es = []
+
+    for movie in movies_pg:
+        if compare_fw_id is None or compare_fw_id != movie.fw_id:
+            if movie_es:
+                movies_es.append(movie_es)
+
+            if movie.role == 'director':
+                directors_names = [movie.full_name]
+                directors = [{"id": movie.id, "name": movie.full_name}]
+            else:
+                directors_names = []
+                directors = []
+
+            if movie.role == 'actor':
+                actors_names = [movie.full_name]
+                actors = [{"id": movie.id, "name": movie.full_name}]
+            else:
+                actors_names = []
+                actors = []
+
+            if movie.role == 'writer':
+                writers_names = [movie.full_name]
+                writers = [{"id": movie.id, "name": movie.full_name}]
+            else:
+                writers_names = []
+                writers = []
+
+            movie_es = {
+                "id": movie.fw_id,
+                "imdb_rating": movie.rating,
+                "genre": [movie.name],
+                "genres": [{"id": movie.g_id, "name": movie.name}],
+                "creation_date": movie.creation_date,
+                "title": movie.title,
+                "description": movie.description,
+                "directors_names": directors_names,
+                "actors_names": actors_names,
+                "writers_names": writers_names,
+                "directors": directors,
+                "actors": actors,
+                "writers": writers
+            }
+            compare_fw_id = movie.fw_id
+
+        elif compare_fw_id == movie.fw_id:
+            if movie.name not in movie_es['genre']:
+                movie_es['genre'].append(movie.name)
+                movie_es['genres'].append({"id": movie.g_id, "name": movie.name})
+            match movie.role:
+                case 'actor':
+                    if movie.full_name not in movie_es['directors_names']:
+                        movie_es['directors_names'].append(movie.full_name)
+                        movie_es['directors'].append({"id": movie.id, "name": movie.full_name})
+                case 'actor':
+                    if movie.full_name not in movie_es['actors_names']:
+                        movie_es['actors_names'].append(movie.full_name)
+                        movie_es['actors'].append({"id": movie.id, "name": movie.full_name})
+                case 'writer':
+                    if movie.full_name not in movie_es['writers_names']:
+                        movie_es['writers_names'].append(movie.full_name)
+                        movie_es['writers'].append({"id": movie.id, "name": movie.full_name})
+
+    movies_es.append(movie_es)
+
+    yield from movies_es
+
+
+def run(rows: int = 100_000, persons_per_film: int = 30, number: int = 5) -> None:
+    """Выполнить замеры и вывести лучшее время каждой реализации"""
+    data = make_rows(rows, persons_per_film)
+    for name, func in (('transform_data', legacy_transform_data), ('assemble_films', assemble_films)):
+        best = min(repeat(lambda: list(func(data)), number=1, repeat=number))
+        print('{0:>16}: {1:8.3f} s  ({2:,.0f} rows/s)'.format(name, best, rows / best))
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,60 @@
+"""Бенчмарк полной переиндексации: потоковый конвейер против asyncio-движка
+
+Оба движка обходят content.film_work целиком и загружают фильмы в отдельный временный индекс
+с настройками индекса movies. Выводится время и скорость в фильмах в секунду.
+Размеры пачек фиксированы (ADAPTIVE_BATCH не влияет на замер), чтобы сравнивались сами движки.
+Отпечатки и уведомления кеша API выключены: замер не должен менять отпечатки рабочих индексов
+и поколения кеша API.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmarks.bench_engines
+"""
+import asyncio
+import tempfile
+from time import perf_counter
+
+import main
+from config import base_settings, es_settings, redis_settings
+from database.elastic_loader import ElasticLoader, close_clients
+from indexes import movie_index
+from storage.storage import JsonFileStorage, State
+
+
+def _reindex_sync(target: str, state: State) -> int:
+    postgres = main.create_postgres_extractor()
+    try:
+        return main.reindex_films(postgres, main.create_elastic_loader(), target, state)
+    finally:
+        postgres.close()
+
+
+def _reindex_async(target: str, state: State) -> int:
+    return asyncio.run(main.reindex_films_async(target, state))
+
+
+def run() -> None:
+    """Выполнить замеры и вывести таблицу: движок, фильмы, время, фильмов в секунду"""
+    base_settings.adaptive_batch = False
+    base_settings.fingerprints = False
+    redis_settings.host = None
+    main.fingerprint_cache.cache_clear()
+    main.cache_notifier.cache_clear()
+    admin = ElasticLoader(es_settings.es_host)
+    print('{0:>10} {1:>10} {2:>10} {3:>12}'.format('engine', 'films', 'time, s', 'films/s'))
+    with tempfile.TemporaryDirectory() as state_dir:
+        for engine, reindex in (('threads', _reindex_sync), ('asyncio', _reindex_async)):
+            target = 'bench_movies_{0}'.format(engine)
+            admin.create_indexes(({**movie_index.movie, 'name': target},))
+            state = State(JsonFileStorage('{0}/{1}.json'.format(state_dir, engine)))
+            started = perf_counter()
+            try:
+                done = reindex(target, state)
+                elapsed = perf_counter() - started
+            finally:
+                admin.delete_index('{0}_v1'.format(target))
+            print('{0:>10} {1:>10} {2:>10.2f} {3:>12,.0f}'.format(engine, done, elapsed, done / elapsed))
+    close_clients()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,117 @@
+"""Бенчмарк представления строк join фильм × персона × жанр, прочитанных из PG
+
+Сравнивает прежний путь (DictCursor + dataclass с __dict__, создание через **row)
+с текущим (кортежи курсора + dataclass со __slots__, создание по позиции,
+интернирование роли и названия жанра). Измеряются скорость чтения в строках в секунду
+и память, которую занимают прочитанные строки пачки. Каждый замер выполняется
+в отдельном процессе.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmarks.bench_rows 10000 100000 500000
+"""
+import multiprocessing
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from time import perf_counter
+
+from config import base_settings, pg_settings
+from database.postgres_extractor import PostgresExtractor
+from pipeline.sources import film_works_from_rows
+
+# Колонки совпадают с query_film_works_elastic: на фильм приходится 120 строк
+# (30 персон × 4 жанра), роли и жанры повторяются
+QUERY = '''
+       select md5((g / 120)::text)::uuid as fw_id
+            , repeat('title ', 5) as title
+            , current_date as creation_date
+            , repeat('description ', 20) as description
+            , 7.5 as rating
+            , 'movie' as type
+            , now() as created
+            , now() as modified
+            , (array['actor', 'director', 'writer'])[(g / 4) % 3 + 1] as role
+            , md5(((g / 4) % 30)::text)::uuid as id
+            , 'person ' || (g / 4) % 30 as full_name
+            , 'genre ' || g % 4 as name
+            , md5((g % 4)::text)::uuid as g_id
+         from generate_series(1, %(rows)s) as g
+'''
+
+DEFAULT_ROWS = (10_000, 100_000, 500_000)
+
+
+@dataclass
+class LegacyFilmWorkElastic:
+    """Прежний FilmWorkElastic: dataclass без __slots__ (для сравнения)"""
+    fw_id: str
+    title: str
+    creation_date: datetime
+    description: str
+    rating: float
+    type: str
+    created: datetime
+    modified: datetime
+    role: str
+    id: str
+    full_name: str
+    name: str
+    g_id: str
+
+
+def _read(postgres: PostgresExtractor, compact: bool, rows: int) -> list:
+    """Прочитать rows строк выбранным способом"""
+    if compact:
+        return film_works_from_rows(postgres.get_tuples(QUERY, rows=rows))
+    return [LegacyFilmWorkElastic(**row) for row in postgres.get_data(QUERY, rows=rows)]
+
+
+def _measure(compact: bool, rows: int, result: multiprocessing.Queue) -> None:
+    """Замерить время чтения строк и память, которую они занимают после чтения"""
+    postgres = PostgresExtractor(
+        pg_settings,
+        base_settings.cursor_array_size,
+        server_side=base_settings.server_side_cursor,
+        itersize=base_settings.cursor_itersize
+    )
+    postgres.connect()
+
+    started = perf_counter()
+    data = _read(postgres, compact, rows)
+    elapsed = perf_counter() - started
+    count = len(data)
+    del data
+
+    # Память считается отдельным проходом: tracemalloc замедляет выделение объектов
+    tracemalloc.start()
+    data = _read(postgres, compact, rows)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+
+    postgres.close()
+    result.put((count, elapsed, memory))
+
+
+def run(rows_list=DEFAULT_ROWS) -> None:
+    """Выполнить замеры и вывести таблицу: строки, способ, rows/s, байт на строку"""
+    context = multiprocessing.get_context('spawn')
+    print('{0:>10} {1:>22} {2:>12} {3:>12}'.format('rows', 'representation', 'rows/s', 'bytes/row'))
+    for rows in rows_list:
+        for compact in (False, True):
+            result = context.Queue()
+            process = context.Process(target=_measure, args=(compact, rows, result))
+            process.start()
+            count, elapsed, memory = result.get()
+            process.join()
+            print('{0:>10} {1:>22} {2:>12,.0f} {3:>12,.0f}'.format(
+                count,
+                'tuple + slots' if compact else 'DictCursor + dataclass',
+                count / elapsed,
+                memory / count if count else 0
+            ))
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS)
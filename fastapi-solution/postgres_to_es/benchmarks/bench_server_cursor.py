@@ -0,0 +1,76 @@
+"""Бенчмарк пикового потребления памяти (RSS) при чтении данных из PG
+
+Сравнивает обычный клиентский курсор и серверный (именованный) курсор
+PostgresExtractor на синтетическом запросе, имитирующем денормализованный
+join фильм × персона × жанр. Каждый замер выполняется в отдельном процессе,
+чтобы пиковый RSS не переносился между замерами.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmarks.bench_server_cursor 10000 100000 1000000
+"""
+import multiprocessing
+import resource
+import sys
+from time import perf_counter
+
+from config import base_settings, pg_settings
+from database.postgres_extractor import PostgresExtractor
+
+QUERY = '''
+       select md5(g::text) as fw_id
+            , repeat('title ', 20) as title
+            , repeat('description ', 40) as description
+            , g as rating
+            , md5((g * 7)::text) as id
+            , repeat('name ', 6) as full_name
+            , 'actor' as role
+         from generate_series(1, %(rows)s) as g
+'''
+
+DEFAULT_ROWS = (10_000, 100_000, 500_000, 1_000_000)
+
+
+def _peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса в мегабайтах (ru_maxrss в Linux — в килобайтах)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(server_side: bool, rows: int, result: multiprocessing.Queue) -> None:
+    """Прочитать rows строк выбранным типом курсора и вернуть прирост пикового RSS"""
+    postgres = PostgresExtractor(
+        pg_settings,
+        base_settings.cursor_array_size,
+        server_side=server_side,
+        itersize=base_settings.cursor_itersize
+    )
+    postgres.connect()
+    baseline = _peak_rss_mb()
+    started = perf_counter()
+
+    count = 0
+    for _ in postgres.get_data(QUERY, rows=rows):
+        count += 1
+
+    elapsed = perf_counter() - started
+    postgres.close()
+    result.put((count, _peak_rss_mb() - baseline, elapsed))
+
+
+def run(rows_list=DEFAULT_ROWS) -> None:
+    """Выполнить замеры и вывести таблицу: строки, режим, прирост пикового RSS, время"""
+    context = multiprocessing.get_context('spawn')
+    print('{0:>10} {1:>12} {2:>14} {3:>10}'.format('rows', 'cursor', 'peak RSS, MB', 'time, s'))
+    for rows in rows_list:
+        for server_side in (False, True):
+            result = context.Queue()
+            process = context.Process(target=_measure, args=(server_side, rows, result))
+            process.start()
+            count, peak_rss, elapsed = result.get()
+            process.join()
+            print('{0:>10} {1:>12} {2:>14.1f} {3:>10.2f}'.format(
+                count, 'server-side' if server_side else 'client-side', peak_rss, elapsed
+            ))
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS)
@@ -1,5 +1,6 @@
 """Модуль с настройками"""
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -19,12 +20,49 @@ class PostgresSettings(BaseModel):
 class ElasticSettings(BaseModel):
     """Класс с настройками подключения для ES"""
     es_host: str
+    chunk_size: int
+    max_chunk_bytes: int
+    thread_count: int
+    max_retries: int
+    number_of_replicas: int
+    bulk_target_latency: float
+    connections_per_node: int
+
+
+class RedisSettings(BaseModel):
+    """Класс с настройками подключения к Redis кеша API"""
+    host: Optional[str]
+    port: int
 
 
 class BaseSettings(BaseModel):
     """Класс с базовыми настройками приложения"""
     cursor_array_size: int
     limit_count: int
+    server_side_cursor: bool
+    cursor_itersize: int
+    pipeline_queue_size: int
+    idle_timeout: float
+    change_capture: str
+    outbox_wait_timeout: float
+    aggregate_in_pg: bool
+    reindex_page_size: int
+    reindex_workers: int
+    state_backend: str
+    state_db_path: str
+    lease_ttl: int
+    etl_shards: int
+    adaptive_batch: bool
+    metrics_port: int
+    async_concurrency: int
+    pg_pool_size: int
+    pg_check_after: float
+    pg_max_idle: float
+    pg_max_lifetime: float
+    reconcile_interval: float
+    reconcile_page_size: int
+    fingerprints: bool
+    fingerprint_db_path: str
 
 
 pg_settings = PostgresSettings(
@@ -35,9 +73,47 @@ pg_settings = PostgresSettings(
     port=os.environ.get('DB_PORT')
 )
 
-es_settings = ElasticSettings(es_host=os.environ.get('ES_HOST'))
+es_settings = ElasticSettings(
+    es_host=os.environ.get('ES_HOST'),
+    chunk_size=os.environ.get('ES_CHUNK_SIZE', 500),
+    max_chunk_bytes=os.environ.get('ES_MAX_CHUNK_BYTES', 100 * 1024 * 1024),
+    thread_count=os.environ.get('ES_THREAD_COUNT', 1),
+    max_retries=os.environ.get('ES_MAX_RETRIES', 3),
+    number_of_replicas=os.environ.get('ES_NUMBER_OF_REPLICAS', 1),
+    bulk_target_latency=os.environ.get('ES_BULK_TARGET_LATENCY', 1.0),
+    connections_per_node=os.environ.get('ES_CONNECTIONS_PER_NODE', 10)
+)
 
 base_settings = BaseSettings(
     cursor_array_size=os.environ.get('CURSOR_ARRAY_SIZE'),
-    limit_count=os.environ.get('LIMIT_COUNT')
+    limit_count=os.environ.get('LIMIT_COUNT'),
+    server_side_cursor=os.environ.get('SERVER_SIDE_CURSOR', False),
+    cursor_itersize=os.environ.get('CURSOR_ITERSIZE', 2000),
+    pipeline_queue_size=os.environ.get('PIPELINE_QUEUE_SIZE', 4),
+    idle_timeout=os.environ.get('IDLE_TIMEOUT', 5),
+    change_capture=os.environ.get('CHANGE_CAPTURE', 'polling'),
+    outbox_wait_timeout=os.environ.get('OUTBOX_WAIT_TIMEOUT', 60),
+    aggregate_in_pg=os.environ.get('AGGREGATE_IN_PG', False),
+    reindex_page_size=os.environ.get('REINDEX_PAGE_SIZE', 1000),
+    reindex_workers=os.environ.get('REINDEX_WORKERS', 1),
+    state_backend=os.environ.get('STATE_BACKEND', 'json'),
+    state_db_path=os.environ.get('STATE_DB_PATH', 'storage/state.db'),
+    lease_ttl=os.environ.get('LEASE_TTL', 30),
+    etl_shards=os.environ.get('ETL_SHARDS', 1),
+    adaptive_batch=os.environ.get('ADAPTIVE_BATCH', True),
+    metrics_port=os.environ.get('METRICS_PORT', 8001),
+    async_concurrency=os.environ.get('ASYNC_CONCURRENCY', 4),
+    pg_pool_size=os.environ.get('PG_POOL_SIZE', 4),
+    pg_check_after=os.environ.get('PG_CHECK_AFTER', 30),
+    pg_max_idle=os.environ.get('PG_MAX_IDLE', 600),
+    pg_max_lifetime=os.environ.get('PG_MAX_LIFETIME', 3600),
+    reconcile_interval=os.environ.get('RECONCILE_INTERVAL', 3600),
+    reconcile_page_size=os.environ.get('RECONCILE_PAGE_SIZE', 1000),
+    fingerprints=os.environ.get('FINGERPRINTS', True),
+    fingerprint_db_path=os.environ.get('FINGERPRINT_DB_PATH', 'storage/fingerprints.db')
+)
+
+redis_settings = RedisSettings(
+    host=os.environ.get('REDIS_HOST') or None,
+    port=os.environ.get('REDIS_PORT', 6379)
 )
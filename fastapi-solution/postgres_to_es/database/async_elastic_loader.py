@@ -0,0 +1,130 @@
+"""Модуль по асинхронной загрузке данных в Elastic"""
+import asyncio
+from collections.abc import Iterable
+from datetime import datetime
+from time import perf_counter
+from typing import Any, List, Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+
+from database.elastic_loader import REJECTED_ERROR, BulkSummary, ElasticLoader, TransientBulkError
+from database.retry import TRANSIENT_STATUSES, full_jitter
+from log.logger import log
+
+
+class AsyncElasticLoader:
+    """Асинхронная загрузка данных в elastic.
+
+    Пачки загружаются независимыми корутинами; одновременно выполняется
+    не больше concurrency bulk-загрузок, остальные ждут семафор.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            chunk_size: int = 500,
+            max_chunk_bytes: int = 100 * 1024 * 1024,
+            concurrency: int = 4,
+            max_retries: int = 3,
+            retry_backoff: float = 1.0
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            host: Host:port
+            chunk_size: Количество документов в одном bulk-запросе
+            max_chunk_bytes: Максимальный размер одного bulk-запроса в байтах
+            concurrency: Максимальное количество одновременных bulk-загрузок
+            max_retries: Количество повторов для документов, не загруженных из-за временных ошибок
+            retry_backoff: Начальное время ожидания перед повтором, удваивается с каждой попыткой
+        """
+        self._host = host
+        self._elastic: Optional[AsyncElasticsearch] = None
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(self) -> None:
+        """Функция для установки соединения"""
+        await self.close()
+        self._elastic = AsyncElasticsearch(self._host)
+
+    async def close(self) -> None:
+        """Функция для закрытия соединения"""
+        if self._elastic is not None:
+            await self._elastic.close()
+        self._elastic = None
+
+    async def load_data_into_elastic(self, data: Iterable, index_name: str) -> BulkSummary:
+        """Функция по загрузке данных в elastic.
+
+        Повторно отправляются только документы, не загруженные из-за временных ошибок (429, 5xx).
+
+        Args:
+            data: Документы для загрузки в ES или готовые bulk-действия (с ключом _op_type)
+            index_name: Название индекса
+
+        Returns:
+            (BulkSummary): Итоги загрузки
+
+        Exceptions:
+            TransientBulkError: Документы не загружены из-за временных ошибок после всех повторов
+        """
+        async with self._semaphore:
+            summary = BulkSummary(index=index_name)
+            started = perf_counter()
+            actions = [ElasticLoader._to_action(item, index_name) for item in data]
+
+            for attempt in range(self.max_retries + 1):
+                failed = await self._bulk(actions, summary)
+                retryable = [action for action, status in failed if status in TRANSIENT_STATUSES]
+                summary.failed += len(failed) - len(retryable)
+                if not retryable:
+                    break
+                if attempt == self.max_retries:
+                    summary.failed += len(retryable)
+                    raise TransientBulkError(
+                        'Не загружено документов в {0}: {1}'.format(index_name, len(retryable))
+                    )
+                summary.retried += len(retryable)
+                await asyncio.sleep(full_jitter(attempt, self.retry_backoff, self.retry_backoff * 2 ** self.max_retries))
+                actions = retryable
+
+            summary.elapsed = perf_counter() - started
+            summary.latency = summary.elapsed / summary.requests if summary.requests else 0.0
+            ElasticLoader._log_summary(summary)
+            return summary
+
+    async def _bulk(self, actions: List[dict], summary: BulkSummary) -> List[Tuple[dict, Any]]:
+        """Отправить действия в ES и вернуть не загруженные вместе со статусом ошибки"""
+        summary.requests += -(-len(actions) // self.chunk_size)
+        failed = []
+        results = async_streaming_bulk(
+            self._elastic,
+            actions,
+            chunk_size=self.chunk_size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+        # Результаты приходят в том же порядке, что и действия
+        position = 0
+        async for ok, item in results:
+            action = actions[position]
+            position += 1
+            if ok:
+                summary.indexed += 1
+                continue
+            _, info = item.popitem()
+            failed.append((action, info.get('status')))
+            error = info.get('error')
+            if info.get('status') == 429 or (isinstance(error, dict) and error.get('type') == REJECTED_ERROR):
+                summary.rejected += 1
+            log.error(
+                'datetime: %s   Документ %s не загружен в %s: %s %s',
+                datetime.now(), action['_id'], action['_index'], info.get('status'), error
+            )
+        return failed
@@ -0,0 +1,101 @@
+"""Модуль по асинхронной загрузке данных из postgres (asyncpg)"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from config import PostgresSettings
+from database.retry import retry
+
+# Параметры запросов записаны в стиле psycopg2: %(name)s, а кортеж id — как "in %(ids)s"
+_PARAMETER = re.compile(r'\bin\s+%\((\w+)\)s|%\((\w+)\)s')
+
+
+def to_positional(query: str, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Переписать запрос с именованными параметрами psycopg2 в запрос с позиционными параметрами asyncpg
+
+    "in %(ids)s" с кортежем превращается в "= any($n)" с массивом,
+    повторяющиеся параметры получают один и тот же номер.
+
+    Args:
+        query: Текст запроса с параметрами %(name)s
+        params: Значения параметров
+
+    Returns:
+        (Tuple[str, List[Any]]): Текст запроса с параметрами $n и значения параметров по порядку
+    """
+    names = []
+
+    def replace(match: re.Match) -> str:
+        name = match.group(1) or match.group(2)
+        if name not in names:
+            names.append(name)
+        number = names.index(name) + 1
+        return '= any(${0})'.format(number) if match.group(1) else '${0}'.format(number)
+
+    query = _PARAMETER.sub(replace, query)
+    values = [list(params[name]) if isinstance(params[name], tuple) else params[name] for name in names]
+    return query, values
+
+
+async def _init_connection(connection: asyncpg.Connection) -> None:
+    """Декодировать uuid в str, а json в объекты Python, как это делает psycopg2"""
+    await connection.set_type_codec('uuid', encoder=str, decoder=str, schema='pg_catalog', format='text')
+    await connection.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+class AsyncPostgresExtractor:
+    """Асинхронная загрузка данных из postgres.
+
+    Результаты читаются по бинарному протоколу asyncpg из пула соединений,
+    поэтому несколько запросов могут выполняться одновременно.
+    """
+
+    def __init__(self, pg_conn: PostgresSettings, pool_size: int = 4, max_idle: float = 300) -> None:
+        """Конструктор класса.
+
+        Args:
+            pg_conn: Dataclass с параметрами для подключения к postgres
+            pool_size: Максимальное количество соединений в пуле
+            max_idle: Время простоя, после которого соединение пула закрывается, секунды
+        """
+        self.pg_conn = pg_conn
+        self.pool_size = pool_size
+        self.max_idle = max_idle
+        self._pool: Optional[asyncpg.Pool] = None
+
+    async def connect(self) -> None:
+        """Создать пул соединений"""
+        await self.close()
+        self._pool = await asyncpg.create_pool(
+            database=self.pg_conn.dbname,
+            user=self.pg_conn.user,
+            password=self.pg_conn.password,
+            host=self.pg_conn.host,
+            port=self.pg_conn.port,
+            min_size=1,
+            max_size=self.pool_size,
+            max_inactive_connection_lifetime=self.max_idle,
+            init=_init_connection
+        )
+
+    async def close(self) -> None:
+        """Закрыть пул соединений"""
+        if self._pool is not None:
+            await self._pool.close()
+        self._pool = None
+
+    @retry('postgres')
+    async def get_data(self, query: str, **kwargs) -> List[asyncpg.Record]:
+        """Функция получения данных из БД.
+
+        Args:
+            query: Текст запроса с параметрами в стиле psycopg2
+            kwargs: Параметры запроса
+
+        Returns:
+            (List[asyncpg.Record]): Строки результата; поля доступны и по имени, и по позиции
+        """
+        query, values = to_positional(query, kwargs)
+        return await self._pool.fetch(query, *values)
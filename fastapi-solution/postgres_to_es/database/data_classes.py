@@ -1,9 +1,14 @@
-"""Модуль для объявления классов с данными"""
+"""Модуль для объявления классов с данными
+
+Объекты создаются на каждую строку из PG, поэтому классы объявлены со __slots__:
+у экземпляра нет собственного __dict__. Порядок полей совпадает с порядком колонок
+в запросах, и объекты создаются из кортежей курсора по позиции.
+"""
 from dataclasses import dataclass
 from datetime import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class FilmWorkElastic:
     """Класс для загрузки данных в Elastic"""
     fw_id: str
@@ -21,7 +26,7 @@ class FilmWorkElastic:
     g_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class PersonElastic:
     """Класс для загрузки данных по персоналиям в Elastic"""
     person_id: str
@@ -29,7 +34,7 @@ class PersonElastic:
     modified: datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class GenreElastic:
     """Класс для загрузки данных по жанрам в Elastic"""
     genre_id: str
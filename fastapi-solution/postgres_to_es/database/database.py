@@ -16,3 +16,7 @@ class DatabaseAdapter:
     @abc.abstractmethod
     def close(self):
         pass
+
+    def reset(self):
+        """Сбросить соединение после ошибки; по умолчанию соединение закрывается"""
+        self.close()
@@ -1,85 +1,395 @@
 """Модуль по загрузке данных в Elastic"""
-from collections.abc import Iterator
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import islice
 from datetime import datetime
-from time import sleep
-from typing import Dict, Tuple
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Optional, Tuple
 
 from elasticsearch import Elasticsearch, helpers
 
-from storage.storage import State
-from database.backoff import backoff
+from database.retry import TRANSIENT_STATUSES, RetryLimitExceeded, full_jitter, retry
 from database.database import DatabaseAdapter
-from database.postgres_extractor import NoMoreDataInPG
 from log.logger import log
+from metrics import metrics
+from storage.cache_notifier import CacheNotifier
+from storage.fingerprints import FingerprintCache, fingerprint
+
+
+# Ошибка переполнения очереди записи на узле ES
+REJECTED_ERROR = 'es_rejected_execution_exception'
+
+
+class TransientBulkError(RetryLimitExceeded):
+    """Часть документов не загружена в ES из-за временных ошибок и после всех повторов
+
+    Не временная ошибка: документы уже повторены поштучно, а повтор всей загрузки
+    отправил бы заново загруженные документы.
+    """
+    ...
+
+
+@dataclass
+class BulkSummary:
+    """Итоги загрузки пачки документов в ES"""
+    index: str
+    indexed: int = 0
+    deleted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    retried: int = 0
+    rejected: int = 0
+    requests: int = 0
+    elapsed: float = 0.0
+    latency: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Скорость загрузки, документов в секунду"""
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def skip_ratio(self) -> float:
+        """Доля документов, не отправленных в ES, так как они не изменились"""
+        total = self.indexed + self.skipped
+        return self.skipped / total if total else 0.0
+
+
+_clients: Dict[str, Elasticsearch] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(host: str, connections_per_node: int = 10) -> Elasticsearch:
+    """Общий для процесса клиент ES для host
+
+    Все загрузчики процесса используют один транспорт с пулом HTTP keep-alive соединений:
+    соединения не открываются заново для каждого загрузчика и каждого цикла ETL.
+    Оборванные соединения и недоступные узлы транспорт переоткрывает сам.
+
+    Args:
+        host: Host:port
+        connections_per_node: Максимальное количество HTTP-соединений с одним узлом
+
+    Returns:
+        (Elasticsearch): Клиент ES
+    """
+    with _clients_lock:
+        if host not in _clients:
+            _clients[host] = Elasticsearch(host, connections_per_node=connections_per_node)
+        return _clients[host]
+
+
+def close_clients() -> None:
+    """Закрыть транспорты всех общих клиентов ES при завершении процесса"""
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client.transport.close()
+            except Exception:
+                log.info('datetime: %s   Ошибка при закрытии соединения', datetime.now())
+        _clients.clear()
 
 
 class ElasticLoader(DatabaseAdapter):
     """Класс для загрузки данных в elastic"""
-    def __init__(self, host: str) -> None:
+    def __init__(
+            self,
+            host: str,
+            chunk_size: int = 500,
+            max_chunk_bytes: int = 100 * 1024 * 1024,
+            thread_count: int = 1,
+            max_retries: int = 3,
+            retry_backoff: float = 1.0,
+            connections_per_node: int = 10,
+            fingerprints: Optional[FingerprintCache] = None,
+            notifier: Optional[CacheNotifier] = None
+    ) -> None:
         """Конструктор класса.
 
         Args:
             host: Host:port
+            chunk_size: Количество документов в одном bulk-запросе
+            max_chunk_bytes: Максимальный размер одного bulk-запроса в байтах
+            thread_count: Количество потоков для параллельной отправки bulk-запросов
+            max_retries: Количество повторов для документов, не загруженных из-за временных ошибок
+            retry_backoff: Начальное время ожидания перед повтором, удваивается с каждой попыткой
+            connections_per_node: Максимальное количество HTTP-соединений общего клиента с одним узлом
+            fingerprints: Отпечатки загруженных документов; неизменившиеся документы не отправляются в ES
+            notifier: Уведомления кеша API об изменениях индексов
         """
         self._host = host
         self._elastic = None
+        self.connections_per_node = connections_per_node
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.thread_count = thread_count
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.fingerprints = fingerprints
+        self.notifier = notifier
 
     def connected(self) -> bool:
-        """Функция для проверки соединения"""
-        return self._elastic and self._elastic.ping()
+        """Функция для проверки соединения
+
+        Клиент ES сам переустанавливает HTTP-соединения, поэтому ping не выполняется.
+        """
+        return self._elastic is not None
 
     def connect(self):
-        """Функция для установки соединения"""
-        self.close()
-        self._elastic = Elasticsearch(self._host)
+        """Функция для установки соединения с общим клиентом процесса"""
+        self._elastic = shared_client(self._host, max(self.connections_per_node, self.thread_count))
 
     def close(self):
         """Функция для закрытия соединения
 
-        Exceptions:
-            Exception: Текст ошибки
+        Общий клиент не закрывается: его соединения используют другие загрузчики процесса.
         """
-        if self.connected():
-            try:
-                self._elastic.transport.close()
-            except Exception:
-                log.info('datetime: %s   Ошибка при закрытии соединения', datetime.now())
-
         self._elastic = None
 
-    @backoff(logger=log, try_count=20, start_sleep_time=0.1, factor=2, border_sleep_time=10)
-    def load_data_into_elastic(self, data: Iterator, index_name: str, state: State) -> None:
+    def load_data_into_elastic(self, data: Iterable, index_name: str, skip_unchanged: bool = True) -> BulkSummary:
         """Функция по загрузке данных в elastic.
 
+        Документы отправляются потоково, пачками по chunk_size / max_chunk_bytes.
+        Повторно отправляются только документы, не загруженные из-за временных ошибок
+        (429, 5xx); остальные ошибки записываются в лог и считаются в failed.
+        Загрузка целиком не повторяется: data может быть однократным итератором.
+        Если заданы отпечатки, документы, совпадающие с последней загруженной версией, не отправляются.
+
         Args:
-            data: Кинопроизведения для загрузки в ES
+            data: Документы для загрузки в ES или готовые bulk-действия (с ключом _op_type)
             index_name: Название индекса
-            state: Объект класса для сохранения состояния работы программы
+            skip_unchanged: Пропускать неизменившиеся документы; False — отправить все,
+                например если документа может не быть в ES
+
+        Returns:
+            (BulkSummary): Итоги загрузки
+
+        Exceptions:
+            TransientBulkError: Документы не загружены из-за временных ошибок после всех повторов
         """
+        summary = BulkSummary(index=index_name)
+        started = perf_counter()
+        actions = (self._to_action(item, index_name) for item in data)
+        hashes: Dict[str, bytes] = {}
+        indexed: List[dict] = []
+        changed: List[str] = []
+        if self.fingerprints is not None:
+            actions = self._fingerprinted(actions, index_name, hashes, summary, skip_unchanged)
+
         try:
-            actions = [
-                {
-                    '_index': index_name,
-                    '_id': item['id'],
-                    '_source': item,
-                }
-                for item in data
-            ]
-            helpers.bulk(self._elastic, actions)
-            sleep(5)
-
-            if hasattr(state, 'modified'):
-                state.set_state('modified', state.modified)
-                del state.modified
-            if hasattr(state, 'fw_id'):
-                state.set_state('fw_id', state.fw_id)
-                del state.fw_id
-
-        except NoMoreDataInPG as e:
-            log.error('Ошибка при ЗАПИСИ В ES \n  %s', e)
-            sleep(10)
-
-    @backoff(logger=log, try_count=20, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+            for attempt in range(self.max_retries + 1):
+                failed = self._bulk(actions, summary, indexed, changed)
+                retryable = [action for action, status in failed if status in TRANSIENT_STATUSES]
+                summary.failed += len(failed) - len(retryable)
+                if not retryable:
+                    break
+                if attempt == self.max_retries:
+                    summary.failed += len(retryable)
+                    summary.elapsed = perf_counter() - started
+                    self._log_summary(summary)
+                    raise TransientBulkError(
+                        'Не загружено документов в {0}: {1}'.format(index_name, len(retryable))
+                    )
+
+                summary.retried += len(retryable)
+                sleep(full_jitter(attempt, self.retry_backoff, self.retry_backoff * 2 ** self.max_retries))
+                actions = iter(retryable)
+        finally:
+            if self.fingerprints is not None and indexed:
+                self.fingerprints.put_many(
+                    index_name, [(action['_id'], hashes[action['_id']]) for action in indexed if action['_id'] in hashes]
+                )
+            # Документы могли измениться и при ошибке загрузки части пачки
+            if changed:
+                self._notify(index_name, changed)
+
+        summary.elapsed = perf_counter() - started
+        # Время одного bulk-запроса: запросы parallel_bulk выполняются одновременно в thread_count потоках
+        summary.latency = summary.elapsed * self.thread_count / summary.requests if summary.requests else 0.0
+        self._log_summary(summary)
+        return summary
+
+    def _fingerprinted(
+            self,
+            actions: Iterator[dict],
+            index_name: str,
+            hashes: Dict[str, bytes],
+            summary: BulkSummary,
+            skip_unchanged: bool
+    ) -> Iterator[dict]:
+        """Отбросить документы, совпадающие с последней загруженной версией
+
+        Отпечатки считаются порциями по chunk_size, чтобы запрашивать их одним запросом к SQLite.
+        Для документов, которые меняются частично или удаляются, отпечатки удаляются до отправки:
+        после этого их содержимое в ES уже не совпадает с сохранённым отпечатком.
+
+        Args:
+            actions: Действия bulk API
+            index_name: Название индекса
+            hashes: Сюда записываются отпечатки отправляемых документов
+            summary: Итоги загрузки, в которые добавляется число пропущенных документов
+            skip_unchanged: Пропускать неизменившиеся документы
+
+        Yields:
+            (dict): Действия, которые нужно отправить в ES
+        """
+        while chunk := list(islice(actions, self.chunk_size)):
+            digests = {}
+            changed = []
+            for action in chunk:
+                if action.get('_op_type', 'index') == 'index':
+                    digests[action['_id']] = fingerprint(action['_source'])
+                else:
+                    changed.append(action['_id'])
+            if changed:
+                self.fingerprints.delete_many(index_name, changed)
+            known = self.fingerprints.get_many(index_name, list(digests)) if skip_unchanged else {}
+            for action in chunk:
+                digest = digests.get(action['_id'])
+                if digest is not None:
+                    if known.get(action['_id']) == digest:
+                        summary.skipped += 1
+                        continue
+                    hashes[action['_id']] = digest
+                yield action
+
+    @staticmethod
+    def _to_action(item: dict, index_name: str) -> dict:
+        """Преобразовать документ в bulk-действие index; готовые действия не меняются"""
+        if '_op_type' in item:
+            return item
+        return {
+            '_index': index_name,
+            '_id': item['id'],
+            '_source': item,
+        }
+
+    def _bulk(
+            self,
+            actions: Iterator[dict],
+            summary: BulkSummary,
+            indexed: Optional[List[dict]] = None,
+            changed: Optional[List[str]] = None
+    ) -> List[Tuple[dict, Any]]:
+        """Отправить документы в ES и вернуть не загруженные вместе со статусом ошибки
+
+        Args:
+            actions: Действия bulk API
+            summary: Итоги загрузки, в которые добавляется число загруженных документов
+            indexed: Сюда добавляются успешно выполненные действия index
+            changed: Сюда добавляются id документов, изменённых или удалённых в ES
+
+        Returns:
+            (List[Tuple[dict, Any]]): Не загруженные действия и HTTP-статусы ошибок
+        """
+        # Результаты bulk приходят в том же порядке, что и действия, в том числе у parallel_bulk
+        pending = deque()
+        sent = 0
+
+        def track(items: Iterator[dict]) -> Iterator[dict]:
+            nonlocal sent
+            for item in items:
+                pending.append(item)
+                sent += 1
+                yield item
+
+        options = dict(
+            chunk_size=self.chunk_size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+        if self.thread_count > 1:
+            results = helpers.parallel_bulk(
+                self._elastic, track(actions), thread_count=self.thread_count, **options
+            )
+        else:
+            results = helpers.streaming_bulk(self._elastic, track(actions), **options)
+
+        failed = []
+        for ok, item in results:
+            action = pending.popleft()
+            op_type, info = item.popitem()
+            if op_type == 'delete' and (ok or info.get('status') == 404):
+                # Документ уже удалён: повторное удаление не ошибка
+                summary.deleted += 1
+                if changed is not None:
+                    changed.append(action['_id'])
+                continue
+            if op_type == 'update' and not ok and info.get('status') == 404:
+                # Фильм ещё не загружен: обновлять нечего, документ соберётся целиком
+                summary.skipped += 1
+                continue
+            if ok:
+                summary.indexed += 1
+                if changed is not None:
+                    changed.append(action['_id'])
+                if indexed is not None and op_type == 'index':
+                    indexed.append(action)
+                continue
+            failed.append((action, info.get('status')))
+            error = info.get('error')
+            if info.get('status') == 429 or (isinstance(error, dict) and error.get('type') == REJECTED_ERROR):
+                summary.rejected += 1
+            log.error(
+                'datetime: %s   Документ %s не загружен в %s: %s %s',
+                datetime.now(), action['_id'], action['_index'], info.get('status'), error
+            )
+        # Оценка числа bulk-запросов: helpers делят действия на запросы по chunk_size
+        summary.requests += -(-sent // self.chunk_size)
+        return failed
+
+    def _notify(self, index_name: str, ids: Optional[List[str]] = None) -> None:
+        """Сообщить кешу API, что документы ids (None — весь индекс) изменились"""
+        if self.notifier is not None:
+            self.notifier.bump_generation(index_name, ids)
+
+    @staticmethod
+    def _log_summary(summary: BulkSummary) -> None:
+        metrics.DOCS_INDEXED.labels(summary.index).inc(summary.indexed)
+        metrics.DOCS_DELETED.labels(summary.index).inc(summary.deleted)
+        metrics.DOCS_SKIPPED.labels(summary.index).inc(summary.skipped)
+        metrics.DOCS_FAILED.labels(summary.index).inc(summary.failed)
+        metrics.BULK_RETRIED.labels(summary.index).inc(summary.retried)
+        metrics.BULK_REJECTED.labels(summary.index).inc(summary.rejected)
+        if summary.requests:
+            metrics.BULK_LATENCY.labels(summary.index).observe(summary.latency)
+        log.info(
+            'datetime: %s   Загрузка в %s: indexed=%d deleted=%d skipped=%d (%.0f%%) failed=%d retried=%d '
+            'rejected=%d, %.1f s, %.1f docs/s, bulk %.2f s',
+            datetime.now(), summary.index, summary.indexed, summary.deleted, summary.skipped,
+            summary.skip_ratio * 100, summary.failed, summary.retried, summary.rejected,
+            summary.elapsed, summary.throughput, summary.latency
+        )
+
+    @retry('elasticsearch')
+    def search_ids(self, index_name: str, size: int, after: Optional[str] = None) -> List[str]:
+        """Страница id документов индекса в порядке возрастания
+
+        Сортировка по keyword-полю id побайтовая и совпадает с порядком uuid в PG.
+
+        Args:
+            index_name: Название индекса
+            size: Количество id на странице
+            after: Последний id предыдущей страницы
+
+        Returns:
+            (List[str]): id документов после after
+        """
+        options = {'search_after': [after]} if after else {}
+        response = self._elastic.search(
+            index=index_name,
+            size=size,
+            sort=[{'id': 'asc'}],
+            source=False,
+            track_total_hits=False,
+            **options
+        )
+        return [hit['sort'][0] for hit in response['hits']['hits']]
+
+    @retry('elasticsearch')
     def create_indexes(self, indexes_es: Tuple[Dict[str, dict]]) -> None:
         """Функция создания индеков в elastic.
 
@@ -90,12 +400,119 @@ class ElasticLoader(DatabaseAdapter):
             log.info('Проверка наличия индекса:  %s', index['name'])
             if not self._elastic.indices.exists(index=index['name']):
                 log.info('Попытка создания индекса:  %s', index['name'])
+                # Индекс создаётся как первая версия за псевдонимом, чтобы его можно было
+                # переиндексировать без простоя (см. create_versioned_index)
                 self._elastic.indices.create(
-                    index=index['name'],
+                    index='{0}_v1'.format(index['name']),
                     settings=index['index']['settings'],
-                    mappings=index['index']['mappings']
+                    mappings=index['index']['mappings'],
+                    aliases={index['name']: {}}
                 )
+                if self.fingerprints is not None:
+                    self.fingerprints.clear(index['name'])
+                self._notify(index['name'])
                 log.info('Создан индекс:  %s', index['name'])
             else:
                 log.info('Индекс:  %s уже существует', index['name'])
 
+    @retry('elasticsearch')
+    def index_exists(self, index_name: str) -> bool:
+        """Функция проверки наличия индекса.
+
+        Args:
+            index_name: Название индекса или псевдонима
+        """
+        return bool(self._elastic.indices.exists(index=index_name))
+
+    @retry('elasticsearch')
+    def delete_index(self, index_name: str) -> None:
+        """Функция удаления индекса.
+
+        Args:
+            index_name: Название индекса
+        """
+        self._elastic.indices.delete(index=index_name)
+        if self.fingerprints is not None:
+            self.fingerprints.clear(index_name)
+        self._notify(index_name)
+        log.info('Удалён индекс:  %s', index_name)
+
+    @retry('elasticsearch')
+    def create_versioned_index(self, index: Dict[str, dict]) -> str:
+        """Функция создания новой версии индекса {name}_v{n} для переиндексации без простоя.
+
+        На время загрузки у новой версии отключены refresh и реплики;
+        поиск продолжает работать через псевдоним по текущей версии.
+
+        Args:
+            index: Описание индекса
+
+        Returns:
+            (str): Название созданного индекса
+        """
+        alias = index['name']
+        new_index = '{0}_v{1}'.format(alias, max(self._versions(alias).values(), default=0) + 1)
+        self._elastic.indices.create(
+            index=new_index,
+            settings={**index['index']['settings'], 'refresh_interval': '-1', 'number_of_replicas': 0},
+            mappings=index['index']['mappings']
+        )
+        # Версия с тем же номером могла остаться от прерванной переиндексации и быть удалена вручную:
+        # её отпечатки не соответствуют пустому индексу
+        if self.fingerprints is not None:
+            self.fingerprints.clear(new_index)
+        log.info('Создан индекс:  %s', new_index)
+        return new_index
+
+    @retry('elasticsearch')
+    def publish_versioned_index(self, index: Dict[str, dict], new_index: str, number_of_replicas: int) -> None:
+        """Функция переключения псевдонима на новую версию индекса.
+
+        Восстанавливает refresh_interval и реплики, объединяет сегменты и атомарно переводит
+        псевдоним на новую версию. Предыдущая версия остаётся для отката, более старые удаляются.
+
+        Args:
+            index: Описание индекса
+            new_index: Название новой версии индекса
+            number_of_replicas: Количество реплик новой версии
+        """
+        alias = index['name']
+        self._elastic.indices.put_settings(
+            index=new_index,
+            settings={
+                'refresh_interval': index['index']['settings'].get('refresh_interval', '1s'),
+                'number_of_replicas': number_of_replicas
+            }
+        )
+        self._elastic.options(request_timeout=3600).indices.forcemerge(index=new_index, max_num_segments=1)
+        self._elastic.indices.refresh(index=new_index)
+
+        actions = [{'add': {'index': new_index, 'alias': alias}}]
+        if self._elastic.indices.exists_alias(name=alias):
+            previous = [name for name in self._elastic.indices.get_alias(name=alias) if name != new_index]
+            actions.extend({'remove': {'index': name, 'alias': alias}} for name in previous)
+        else:
+            # До перехода на версии индекс был создан под именем псевдонима
+            previous = []
+            actions.append({'remove_index': {'index': alias}})
+        self._elastic.indices.update_aliases(actions=actions)
+        if self.fingerprints is not None:
+            # Отпечатки загрузки в новую версию теперь описывают документы за псевдонимом
+            self.fingerprints.move(new_index, alias)
+        self._notify(alias)
+        log.info('Псевдоним %s переключён на %s', alias, new_index)
+
+        for name in self._versions(alias):
+            if name != new_index and name not in previous:
+                self._elastic.indices.delete(index=name)
+                log.info('Удалён индекс:  %s', name)
+
+    def _versions(self, alias: str) -> Dict[str, int]:
+        """Версии индекса {alias}_v{n}: название -> номер"""
+        versions = {}
+        for name in self._elastic.indices.get(index='{0}_v*'.format(alias)):
+            _, _, version = name.rpartition('_v')
+            if version.isdigit():
+                versions[name] = int(version)
+        return versions
+
@@ -1,15 +1,17 @@
 """Модуль по загрузке данных из postgres"""
 import dataclasses
 from collections.abc import Iterator
-from datetime import datetime
+from typing import Optional, Tuple, Type
+from uuid import uuid4
 
 import psycopg2
+from psycopg2.extensions import connection, cursor
 from psycopg2.extras import DictCursor
 
 from config import PostgresSettings
-from database.backoff import backoff
+from database.retry import retry
 from database.database import DatabaseAdapter
-from log.logger import log
+from database.postgres_pool import PostgresPool
 
 
 class NoMoreDataInPG(Exception):
@@ -17,17 +19,43 @@ class NoMoreDataInPG(Exception):
 
 
 class PostgresExtractor(DatabaseAdapter):
-    """Класс для загрузки данных из postgres"""
-    def __init__(self, pg_conn: PostgresSettings, cursor_array_size: int) -> None:
+    """Класс для загрузки данных из postgres
+
+    Запросы выполняются на соединениях из пула; соединение возвращается в пул,
+    как только результат прочитан, и переиспользуется следующими запросами и циклами ETL.
+    """
+    def __init__(
+            self,
+            pg_conn: PostgresSettings,
+            cursor_array_size: int,
+            server_side: bool = False,
+            itersize: int = 2000,
+            pool_size: int = 4,
+            check_after: float = 30,
+            max_idle: float = 600,
+            max_lifetime: float = 3600
+    ) -> None:
         """Конструктор класса.
 
         Args:
             pg_conn: Dataclass с параметрами для подключения к postgres
             cursor_array_size: Размер данных в курсоре
+            server_side: Читать данные через именованный (серверный) курсор
+            itersize: Количество строк, получаемых серверным курсором за один запрос к PG
+            pool_size: Максимальное количество соединений в пуле
+            check_after: Время простоя, после которого соединение проверяется перед выдачей, секунды
+            max_idle: Время простоя, после которого лишнее соединение закрывается, секунды
+            max_lifetime: Время жизни соединения, секунды
         """
         self.pg_conn = pg_conn
-        self._connection = None
+        self._pool: Optional[PostgresPool] = None
         self.cursor_array_size = cursor_array_size
+        self.server_side = server_side
+        self.itersize = itersize
+        self.pool_size = pool_size
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
 
     @property
     def _conn(self) -> dict:
@@ -35,32 +63,43 @@ class PostgresExtractor(DatabaseAdapter):
             return self.pg_conn.dict()
 
     def connected(self) -> bool:
-        """Функция для проверки соединения"""
-        return self._connection and self._connection.closed == 0
+        """Функция для проверки соединения
+
+        Соединения проверяет и переоткрывает пул, поэтому достаточно, чтобы пул был создан.
+        """
+        return self._pool is not None
 
     def connect(self):
         """Функция для установки соединения"""
         self.close()
-        self._connection = psycopg2.connect(**self._conn, cursor_factory=DictCursor)
+        self._pool = PostgresPool(
+            lambda: psycopg2.connect(**self._conn, application_name='postgres_to_es', keepalives=1),
+            size=self.pool_size,
+            check_after=self.check_after,
+            max_idle=self.max_idle,
+            max_lifetime=self.max_lifetime
+        )
+
+    def reset(self):
+        """Закрыть свободные соединения пула после ошибки соединения"""
+        if self.connected():
+            self._pool.reset()
 
     def close(self):
         """Функция для закрытия соединения
 
-        Exceptions:
-            Exception: Текст ошибки
+        Соединения, выданные до закрытия, возвращаются в закрытый пул и закрываются им.
         """
-
         if self.connected():
-            try:
-                self._connection.close()
-            except Exception:
-                log.info('datetime: {0}   Ошибка при закрытии соединения'.format(datetime.now()))
-        self._connection = None
+            self._pool.close()
+        self._pool = None
 
-    @backoff(logger=log, try_count=20, start_sleep_time=0.1, factor=2, border_sleep_time=10)
     def get_data(self, query, **kwargs) -> Iterator:
         """Функция получения данных из БД.
 
+        В режиме server_side результат не забирается в память целиком при execute(),
+        а читается с сервера порциями по itersize строк через именованный курсор.
+
         Args:
             query: Текст запроса
             kwargs: Параметры запроса
@@ -71,9 +110,78 @@ class PostgresExtractor(DatabaseAdapter):
         Exceptions:
             Exception: Текст ошибки
         """
-        curs = self._connection.cursor()
-        curs.execute(query, kwargs)
+        yield from self._fetch(query, kwargs, DictCursor)
+
+    def get_tuples(self, query, **kwargs) -> Iterator[tuple]:
+        """Функция получения данных из БД в виде кортежей.
+
+        В отличие от get_data строка не несёт словарь имён колонок,
+        поэтому поля читаются по позиции в порядке колонок запроса.
+
+        Args:
+            query: Текст запроса
+            kwargs: Параметры запроса
+
+        Returns:
+            (Iterator[tuple]): Результат из БД
+
+        Exceptions:
+            Exception: Текст ошибки
+        """
+        yield from self._fetch(query, kwargs, cursor)
+
+    def _fetch(self, query, params: dict, cursor_factory: Type[cursor]) -> Iterator:
+        """Выполнить запрос курсором cursor_factory и читать результат порциями
+
+        Повторяется только выполнение запроса: после начала чтения повтор вернул бы строки повторно.
+        Соединение возвращается в пул, из которого взято: пул могут закрыть или заменить во время чтения.
+        """
+        pool, conn, curs = self._execute(query, params, cursor_factory)
+        try:
+            if self.server_side:
+                yield from curs
+            else:
+                while data := curs.fetchmany(self.cursor_array_size):
+                    yield from data
+        finally:
+            try:
+                curs.close()
+            except psycopg2.Error:
+                pass
+            pool.release(conn)
+
+    @retry('postgres')
+    def _execute(
+            self, query, params: dict, cursor_factory: Type[cursor]
+    ) -> Tuple[PostgresPool, connection, cursor]:
+        """Взять соединение из пула, открыть курсор и выполнить запрос"""
+        pool = self._pool
+        conn = pool.acquire()
+        try:
+            if self.server_side:
+                curs = conn.cursor(name='etl_{0}'.format(uuid4().hex), cursor_factory=cursor_factory)
+                curs.itersize = self.itersize
+            else:
+                curs = conn.cursor(cursor_factory=cursor_factory)
+            curs.execute(query, params)
+        except Exception:
+            pool.release(conn)
+            raise
+        return pool, conn, curs
+
+    @retry('postgres')
+    def execute(self, query, **kwargs) -> None:
+        """Функция выполнения изменяющего запроса с фиксацией транзакции.
 
-        while data := curs.fetchmany(self.cursor_array_size):
-            yield from data
-        curs.close()
+        Args:
+            query: Текст запроса
+            kwargs: Параметры запроса
+        """
+        pool = self._pool
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as curs:
+                curs.execute(query, kwargs)
+            conn.commit()
+        finally:
+            pool.release(conn)
@@ -0,0 +1,173 @@
+"""Модуль с блокировкой ETL на advisory lock в postgres"""
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from config import PostgresSettings
+from database.database import DatabaseAdapter
+from log.logger import log
+
+# Первый ключ advisory lock — пространство блокировок ETL, второй — номер блокировки в нём.
+# Блокировка 0 берётся разделяемой репликами непрерывного переноса и монопольной — полной переиндексацией.
+# Блокировка i + 1 монопольно закрепляет за репликой часть i диапазона id фильмов.
+LOCK_SPACE = "hashtext('etl')"
+GLOBAL_LOCK = 0
+
+
+class LeaseLost(Exception):
+    """Соединение, на котором удерживалась блокировка, потеряно"""
+
+
+class PostgresLease(DatabaseAdapter):
+    """Аренда блокировки ETL на отдельном соединении с postgres.
+
+    Session advisory lock снимается, когда завершается сессия, поэтому после падения
+    или SIGKILL процесса блокировку не нужно освобождать вручную. Если хост с ETL
+    пропадает из сети, сервер закрывает сессию по TCP keepalive примерно через ttl секунд.
+    Пульс (heartbeat) проверяет соединение чаще, чтобы реплика остановилась раньше,
+    чем блокировку получит другая реплика.
+    """
+
+    def __init__(self, pg_conn: PostgresSettings, ttl: int = 30) -> None:
+        """Конструктор класса.
+
+        Args:
+            pg_conn: Dataclass с параметрами для подключения к postgres
+            ttl: Время, через которое сервер снимает блокировку пропавшей реплики, секунды
+        """
+        self.pg_conn = pg_conn
+        self.ttl = ttl
+        self.heartbeat_interval = max(ttl / 3, 1)
+        self._connection = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def connected(self) -> bool:
+        """Функция для проверки соединения"""
+        return self._connection and self._connection.closed == 0
+
+    def connect(self):
+        """Функция для установки соединения
+
+        Соединение не переустанавливается автоматически: с новой сессией блокировки были бы потеряны.
+        """
+        self.close()
+        self._connection = psycopg2.connect(
+            **self.pg_conn.dict(),
+            application_name='postgres_to_es',
+            connect_timeout=int(self.heartbeat_interval),
+            keepalives=1,
+            keepalives_idle=int(self.heartbeat_interval),
+            keepalives_interval=max(int(self.heartbeat_interval / 3), 1),
+            keepalives_count=3,
+            tcp_user_timeout=int(self.heartbeat_interval * 1000)
+        )
+        self._connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._connection.cursor() as curs:
+            # Сервер обнаруживает пропавшего клиента за tcp_keepalives_idle + interval * count ≈ ttl
+            curs.execute('set tcp_keepalives_idle = %s', (max(self.ttl // 2, 1),))
+            curs.execute('set tcp_keepalives_interval = %s', (max(self.ttl // 6, 1),))
+            curs.execute('set tcp_keepalives_count = 3')
+
+    def close(self):
+        """Функция для закрытия соединения и снятия всех блокировок
+
+        Exceptions:
+            Exception: Текст ошибки
+        """
+        self._stop.set()
+        if self.connected():
+            try:
+                self._connection.close()
+            except Exception:
+                log.info('datetime: %s   Ошибка при закрытии соединения', datetime.now())
+        self._connection = None
+
+    def try_lock(self, number: int, shared: bool = False) -> bool:
+        """Попытаться взять блокировку без ожидания
+
+        Args:
+            number: Номер блокировки в пространстве ETL
+            shared: Взять разделяемую блокировку вместо монопольной
+
+        Returns:
+            (bool): Получена ли блокировка
+        """
+        function = 'pg_try_advisory_lock_shared' if shared else 'pg_try_advisory_lock'
+        with self._connection.cursor() as curs:
+            curs.execute('select {0}({1}, %s)'.format(function, LOCK_SPACE), (number,))
+            return curs.fetchone()[0]
+
+    def unlock_all(self) -> None:
+        """Снять все блокировки сессии"""
+        with self._connection.cursor() as curs:
+            curs.execute('select pg_advisory_unlock_all()')
+
+    def acquire_exclusive(self) -> bool:
+        """Взять монопольную блокировку ETL (полная переиндексация)
+
+        Returns:
+            (bool): Получена ли блокировка; False — работает другая реплика
+        """
+        if not self.connected():
+            self.connect()
+        return self.try_lock(GLOBAL_LOCK)
+
+    def acquire_shard(self, shards: int, retry_interval: float, stop: Optional[threading.Event] = None) -> int:
+        """Дождаться свободной части диапазона id фильмов и закрепить её за репликой
+
+        Пока все части заняты, реплика остаётся в резерве и периодически повторяет попытку:
+        при падении одной из работающих реплик её часть подхватывает резервная.
+
+        Args:
+            shards: Количество частей
+            retry_interval: Интервал между попытками, секунды
+            stop: Событие для прекращения ожидания
+
+        Returns:
+            (int): Номер полученной части
+
+        Exceptions:
+            LeaseLost: Ожидание прервано событием stop
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                if not self.connected():
+                    self.connect()
+                if self.try_lock(GLOBAL_LOCK, shared=True):
+                    for shard in range(shards):
+                        if self.try_lock(shard + 1):
+                            return shard
+                self.unlock_all()
+                log.info('datetime: %s   Все части заняты, реплика в резерве', datetime.now())
+            except psycopg2.Error as e:
+                log.info('datetime: %s   Ошибка при получении блокировки: %s', datetime.now(), e)
+                self.close()
+            stop.wait(retry_interval)
+        raise LeaseLost('Ожидание блокировки прервано')
+
+    def start_heartbeat(self, on_lost: Callable[[], None]) -> None:
+        """Запустить фоновую проверку соединения, на котором удерживаются блокировки
+
+        Args:
+            on_lost: Вызывается один раз, если соединение потеряно
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat, args=(on_lost,), name='lease_heartbeat', daemon=True)
+        self._thread.start()
+
+    def _heartbeat(self, on_lost: Callable[[], None]) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                with self._connection.cursor() as curs:
+                    curs.execute('select 1')
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                log.error('datetime: %s   Блокировка ETL потеряна: %s', datetime.now(), e)
+                on_lost()
+                return
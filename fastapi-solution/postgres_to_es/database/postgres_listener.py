@@ -0,0 +1,72 @@
+"""Модуль для ожидания уведомлений postgres (LISTEN/NOTIFY)"""
+import select
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from config import PostgresSettings
+from database.retry import retry
+from database.database import DatabaseAdapter
+from log.logger import log
+
+
+class PostgresListener(DatabaseAdapter):
+    """Класс для ожидания уведомлений из postgres на отдельном соединении"""
+    def __init__(self, pg_conn: PostgresSettings, channel: str) -> None:
+        """Конструктор класса.
+
+        Args:
+            pg_conn: Dataclass с параметрами для подключения к postgres
+            channel: Название канала уведомлений
+        """
+        self.pg_conn = pg_conn
+        self.channel = channel
+        self._connection = None
+
+    def connected(self) -> bool:
+        """Функция для проверки соединения"""
+        return self._connection and self._connection.closed == 0
+
+    def connect(self):
+        """Функция для установки соединения и подписки на канал"""
+        self.close()
+        self._connection = psycopg2.connect(**self.pg_conn.dict())
+        self._connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._connection.cursor() as curs:
+            curs.execute('listen {0};'.format(self.channel))
+
+    def close(self):
+        """Функция для закрытия соединения
+
+        Exceptions:
+            Exception: Текст ошибки
+        """
+        if self.connected():
+            try:
+                self._connection.close()
+            except Exception:
+                log.info('datetime: %s   Ошибка при закрытии соединения', datetime.now())
+        self._connection = None
+
+    @retry('postgres')
+    def wait(self, timeout: float) -> bool:
+        """Функция ожидания уведомления. Пока уведомлений нет, запросы в БД не выполняются.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+
+        Returns:
+            (bool): Пришло ли уведомление
+        """
+        if self._connection.notifies:
+            self._connection.notifies.clear()
+            return True
+
+        if select.select([self._connection], [], [], timeout) == ([], [], []):
+            return False
+
+        self._connection.poll()
+        notified = bool(self._connection.notifies)
+        self._connection.notifies.clear()
+        return notified
@@ -0,0 +1,143 @@
+"""Модуль с пулом соединений postgres"""
+import threading
+from collections import deque
+from datetime import datetime
+from time import monotonic
+from typing import Callable, Deque, Dict, Tuple
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+
+from log.logger import log
+
+
+class PostgresPool:
+    """Пул долгоживущих соединений с PG.
+
+    Соединения переиспользуются между запросами и циклами ETL, поэтому переход от простоя
+    к работе не требует нового подключения. Выдаётся последнее возвращённое соединение:
+    оно самое «тёплое». Перед выдачей соединение, простоявшее дольше check_after секунд,
+    проверяется запросом select 1. Лишние соединения, простоявшие дольше max_idle секунд,
+    закрываются; соединения старше max_lifetime секунд закрываются при возврате в пул.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], connection],
+            size: int = 4,
+            check_after: float = 30,
+            max_idle: float = 600,
+            max_lifetime: float = 3600
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            connect: Функция, открывающая новое соединение
+            size: Максимальное количество соединений; при исчерпании acquire ждёт возврата соединения
+            check_after: Время простоя, после которого соединение проверяется перед выдачей, секунды
+            max_idle: Время простоя, после которого лишнее соединение закрывается, секунды
+            max_lifetime: Время жизни соединения, секунды
+        """
+        self._connect = connect
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # Свободные соединения и время их возврата в пул, последнее возвращённое — справа
+        self._idle: Deque[Tuple[connection, float]] = deque()
+        self._created: Dict[int, float] = {}
+
+    def acquire(self) -> connection:
+        """Получить соединение из пула
+
+        Returns:
+            (connection): Проверенное соединение без открытой транзакции
+        """
+        self._slots.acquire()
+        try:
+            while True:
+                self._prune()
+                with self._lock:
+                    conn, released = self._idle.pop() if self._idle else (None, 0.0)
+                if conn is None:
+                    conn = self._connect()
+                    self._created[id(conn)] = monotonic()
+                    return conn
+                if conn.closed or (monotonic() - released > self.check_after and not self._healthy(conn)):
+                    self._discard(conn)
+                    continue
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: connection, discard: bool = False) -> None:
+        """Вернуть соединение в пул
+
+        Незавершённая транзакция откатывается: иначе соединение удерживало бы снимок
+        и мешало autovacuum, пока ETL простаивает.
+
+        Args:
+            conn: Соединение, полученное из acquire
+            discard: Закрыть соединение вместо возврата в пул (например, после ошибки)
+        """
+        try:
+            if not discard and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            expired = monotonic() - self._created.get(id(conn), 0.0) > self.max_lifetime
+            if discard or expired or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, monotonic()))
+        finally:
+            self._slots.release()
+
+    def reset(self) -> None:
+        """Закрыть все свободные соединения
+
+        Вызывается после ошибки соединения: свободные соединения, скорее всего, тоже оборваны.
+        Выданные соединения закрываются при возврате, если они оборваны.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def close(self) -> None:
+        """Закрыть пул: свободные соединения закрываются сразу, выданные — при возврате"""
+        self.reset()
+        self.max_lifetime = -1
+
+    def _prune(self) -> None:
+        """Закрыть лишние соединения, простоявшие дольше max_idle; последнее возвращённое остаётся"""
+        expired = []
+        with self._lock:
+            while len(self._idle) > 1 and monotonic() - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._discard(conn)
+
+    @staticmethod
+    def _healthy(conn: connection) -> bool:
+        """Проверить соединение запросом select 1"""
+        try:
+            with conn.cursor() as curs:
+                curs.execute('select 1')
+            conn.rollback()
+        except psycopg2.Error:
+            log.info('datetime: %s   Соединение с PG оборвано, открывается новое', datetime.now())
+            return False
+        return True
+
+    def _discard(self, conn: connection) -> None:
+        """Закрыть соединение"""
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            log.info('datetime: %s   Ошибка при закрытии соединения', datetime.now())
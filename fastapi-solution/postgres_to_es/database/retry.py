@@ -0,0 +1,256 @@
+"""Модуль с повторами вызовов после временных ошибок и автоматическим выключателем (circuit breaker)"""
+import asyncio
+import inspect
+import random
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+import asyncpg
+import psycopg2
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+from database.database import DatabaseAdapter
+from log.logger import log
+from metrics import metrics
+
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TransientError(Exception):
+    """Временная ошибка, после которой вызов имеет смысл повторить"""
+
+
+class RetryLimitExceeded(Exception):
+    """Вызов не удался после всех повторов"""
+
+
+class CircuitOpenError(Exception):
+    """Выключатель разомкнут: ресурс недоступен, вызов не выполняется"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        """Конструктор класса.
+
+        Args:
+            message: Текст ошибки
+            retry_after: Время до пробного вызова, секунды; None — пробный вызов уже выполняется
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """Временная ли ошибка: обрыв или отказ соединения, перегрузка или недоступность сервера
+
+    Ошибки в запросах и в коде не повторяются.
+
+    Args:
+        error: Исключение
+
+    Returns:
+        (bool): Вызов имеет смысл повторить
+    """
+    if isinstance(error, ApiError):
+        return error.meta.status in TRANSIENT_STATUSES
+    return isinstance(error, (
+        TransientError,
+        psycopg2.OperationalError,
+        psycopg2.InterfaceError,
+        asyncpg.PostgresConnectionError,
+        asyncpg.InterfaceError,
+        asyncpg.CannotConnectNowError,
+        ConnectionError,
+        ConnectionTimeout,
+        OSError,
+        asyncio.TimeoutError,
+    ))
+
+
+def full_jitter(attempt: int, base: float, cap: float) -> float:
+    """Время ожидания перед повтором: случайное от 0 до min(cap, base * 2^attempt)
+
+    Случайная задержка разводит во времени повторы нескольких потоков и реплик,
+    которые столкнулись с одной и той же ошибкой.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для ресурса (PG, ES).
+
+    После failure_threshold временных ошибок подряд выключатель размыкается, и вызовы
+    сразу завершаются CircuitOpenError, не нагружая недоступный ресурс. Через reset_timeout
+    пропускается один пробный вызов: при успехе выключатель замыкается, при ошибке снова размыкается.
+    """
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = 10, reset_timeout: float = 30) -> None:
+        """Конструктор класса.
+
+        Args:
+            name: Название ресурса
+            failure_threshold: Количество ошибок подряд, после которого выключатель размыкается
+            reset_timeout: Время до пробного вызова, секунды
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+        metrics.CIRCUIT_STATE.labels(name).set(self._state)
+
+    def before_call(self) -> None:
+        """Проверить, можно ли выполнить вызов
+
+        Exceptions:
+            CircuitOpenError: Выключатель разомкнут
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError('{0} недоступен, выключатель разомкнут'.format(self.name), remaining)
+                self._set_state(self.HALF_OPEN)
+            elif self._state == self.HALF_OPEN:
+                # Пробный вызов уже выполняется
+                raise CircuitOpenError('{0} недоступен, выполняется пробный вызов'.format(self.name))
+
+    def on_success(self) -> None:
+        """Учесть успешный вызов"""
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def on_failure(self) -> None:
+        """Учесть вызов, завершившийся временной ошибкой"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state: int) -> None:
+        self._state = state
+        metrics.CIRCUIT_STATE.labels(self.name).set(state)
+        log.info('datetime: %s   Выключатель %s: %s', datetime.now(), self.name, ('closed', 'open', 'half-open')[state])
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """Общий для процесса выключатель ресурса name"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def retry(
+        resource: str,
+        tries: int = 20,
+        base: float = 0.1,
+        cap: float = 10,
+        logger=log
+) -> Callable[[Callable], Callable]:
+    """Повторять вызов после временных ошибок с ожиданием full jitter
+
+    Остальные ошибки пробрасываются сразу. Пока выключатель разомкнут, попытка
+    расходуется на ожидание пробного вызова, а не завершается ошибкой: после
+    failure_threshold ошибок подряд оставшиеся попытки ждут восстановления ресурса.
+    CircuitOpenError пробрасывается, только если выключатель разомкнут на последней попытке.
+    Для методов DatabaseAdapter соединение
+    устанавливается, только если его ещё нет, и переустанавливается только после ошибки:
+    лишних проверочных запросов к ресурсу перед каждым вызовом нет.
+    Работает и с обычными функциями, и с корутинами.
+
+    Args:
+        resource: Название ресурса для общего выключателя (postgres, elasticsearch)
+        tries: Количество попыток
+        base: Начальная граница времени ожидания, секунды
+        cap: Наибольшая граница времени ожидания, секунды
+        logger: Объект логера
+
+    Returns:
+        (Callable[[Callable], Callable]): Декоратор
+    """
+    def decorator(func: Callable) -> Callable:
+        circuit = breaker(resource)
+
+        def failed(storage: object, attempt: int, error: BaseException) -> Optional[float]:
+            """Учесть ошибку и вернуть время ожидания перед повтором; None — повторять не нужно"""
+            if not is_transient(error):
+                # Ресурс ответил, ошибка не в соединении
+                circuit.on_success()
+                return None
+            circuit.on_failure()
+            metrics.BACKOFF_RETRIES.labels(func.__name__).inc()
+            if logger:
+                logger.info('Ошибка соединения. Функция: %s, попытка %d \n %s', func.__name__, attempt + 1, error)
+            if isinstance(storage, DatabaseAdapter):
+                storage.reset()
+            return full_jitter(attempt, base, cap)
+
+        def blocked(attempt: int, error: CircuitOpenError) -> float:
+            """Время ожидания пробного вызова; на последней попытке ошибка пробрасывается"""
+            if attempt == tries - 1:
+                raise error
+            if logger:
+                logger.info('%s. Функция: %s, попытка %d', error, func.__name__, attempt + 1)
+            if error.retry_after is None:
+                # Пробный вызов выполняет другой поток: ждём его результата
+                return full_jitter(attempt, base, cap)
+            return error.retry_after
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_inner(storage, *args, **kwargs):
+                for attempt in range(tries):
+                    try:
+                        circuit.before_call()
+                    except CircuitOpenError as e:
+                        await asyncio.sleep(blocked(attempt, e))
+                        continue
+                    try:
+                        result = await func(storage, *args, **kwargs)
+                    except Exception as e:
+                        delay = failed(storage, attempt, e)
+                        if delay is None:
+                            raise
+                        await asyncio.sleep(delay)
+                        continue
+                    circuit.on_success()
+                    return result
+                raise RetryLimitExceeded('{0}: превышено количество попыток'.format(func.__name__))
+
+            return async_inner
+
+        @wraps(func)
+        def inner(storage, *args, **kwargs):
+            for attempt in range(tries):
+                try:
+                    circuit.before_call()
+                except CircuitOpenError as e:
+                    time.sleep(blocked(attempt, e))
+                    continue
+                try:
+                    if isinstance(storage, DatabaseAdapter) and not storage.connected():
+                        storage.connect()
+                    result = func(storage, *args, **kwargs)
+                except Exception as e:
+                    delay = failed(storage, attempt, e)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    continue
+                circuit.on_success()
+                return result
+            raise RetryLimitExceeded('{0}: превышено количество попыток'.format(func.__name__))
+
+        return inner
+
+    return decorator
@@ -1,271 +1,614 @@
 """Основной модуль программы"""
+import _thread
+import argparse
+import asyncio
+import multiprocessing
+import threading
 from collections.abc import Iterator
-from datetime import date, datetime
-from typing import Any, Dict, List, Union
-from time import sleep
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, Callable, Optional, Sequence, Tuple
 
 from elasticsearch import ConnectionError, TransportError
 from psycopg2 import OperationalError
 
-from config import base_settings, es_settings, pg_settings
-from database.data_classes import FilmWorkElastic, PersonElastic, GenreElastic
-from database.elastic_loader import ElasticLoader
+from config import base_settings, es_settings, pg_settings, redis_settings
+from database.async_elastic_loader import AsyncElasticLoader
+from database.async_postgres_extractor import AsyncPostgresExtractor
+from database.data_classes import GenreElastic, PersonElastic
+from database.elastic_loader import BulkSummary, ElasticLoader, close_clients
 from log.logger import log
+from metrics import metrics
 from database.postgres_extractor import PostgresExtractor, NoMoreDataInPG
-from storage.storage import JsonFileStorage, State
+from database.postgres_lease import PostgresLease
+from database.postgres_listener import PostgresListener
+from database.retry import CircuitOpenError, RetryLimitExceeded
+from pipeline.adaptive import AdaptiveSize, healthy
+from pipeline.async_engine import AsyncReindex
+from pipeline.fanout import FanOut
+from pipeline.pipeline import Batch, Pipeline
+from pipeline.reconcile import RECONCILED, Reconciler
+from pipeline.reindex import ReindexProgress, ReindexSource
+from pipeline.sources import EntitySource, FilmSource, OutboxSource
+from pipeline.transform import transform_genres_data, transform_persons_data
+from storage.cache_notifier import CacheNotifier
+from storage.fingerprints import FingerprintCache
+from storage.storage import JsonFileStorage, SqliteStorage, State
 from queries import queries
 from indexes import genre_index, person_index, movie_index
 
 
-def load_films(elastic: ElasticLoader, postgres: PostgresExtractor):
-    """Метод для преобразования данных в формат для Elastic
+def open_state(name: str) -> State:
+    """Открыть состояние в хранилище, выбранном в STATE_BACKEND
 
-        Args:
-            elastic: Класс для работы с ES
-            postgres: Класс для работы с PG
+    Args:
+        name: Имя состояния: файл storage/{name}.json или пространство имён в базе SQLite
+
+    Returns:
+        (State): Объект класса для работы с состоянием
     """
-    log.info('datetime: %s   Start loading from PG', datetime.now())
-    movies = load_from_postgres(postgres)
+    if base_settings.state_backend == 'sqlite':
+        return State(SqliteStorage(name, base_settings.state_db_path))
+    return State(JsonFileStorage('storage/{0}.json'.format(name)))
+
+
+def create_postgres_extractor() -> PostgresExtractor:
+    """Создать загрузчик из PG с пулом соединений по настройкам приложения"""
+    return PostgresExtractor(
+        pg_settings,
+        base_settings.cursor_array_size,
+        server_side=base_settings.server_side_cursor,
+        itersize=base_settings.cursor_itersize,
+        pool_size=base_settings.pg_pool_size,
+        check_after=base_settings.pg_check_after,
+        max_idle=base_settings.pg_max_idle,
+        max_lifetime=base_settings.pg_max_lifetime
+    )
+
+
+@lru_cache(maxsize=None)
+def fingerprint_cache() -> Optional[FingerprintCache]:
+    """Общие для процесса отпечатки загруженных документов; None, если FINGERPRINTS выключен"""
+    if not base_settings.fingerprints:
+        return None
+    return FingerprintCache(base_settings.fingerprint_db_path)
+
+
+@lru_cache(maxsize=None)
+def cache_notifier() -> Optional[CacheNotifier]:
+    """Общие для процесса уведомления кеша API; None, если REDIS_HOST не задан"""
+    if redis_settings.host is None:
+        return None
+    return CacheNotifier(redis_settings.host, redis_settings.port)
+
+
+def create_elastic_loader() -> ElasticLoader:
+    """Создать загрузчик в ES на общем клиенте процесса по настройкам приложения"""
+    return ElasticLoader(
+        es_settings.es_host,
+        chunk_size=es_settings.chunk_size,
+        max_chunk_bytes=es_settings.max_chunk_bytes,
+        thread_count=es_settings.thread_count,
+        max_retries=es_settings.max_retries,
+        connections_per_node=es_settings.connections_per_node,
+        fingerprints=fingerprint_cache(),
+        notifier=cache_notifier()
+    )
+
+
+def extract_batches(
+        postgres: PostgresExtractor,
+        film_source: FilmSource,
+        entity_sources: Sequence[EntitySource],
+        fan_out: FanOut
+) -> Iterator[Optional[Batch]]:
+    """Бесконечный поток пачек из всех источников по очереди
+
+    За цикл читаются пачки изменённых персон и жанров, затем пачка изменённых фильмов.
+    Изменения персон и жанров применяются к уже загруженным фильмам частичными обновлениями;
+    фильмы, пересобранные в этом же цикле, не обновляются повторно.
+    Позиции чтения персон и жанров сохраняются пустыми пачками после частичных обновлений:
+    если обновления не загрузятся, изменения персон и жанров будут прочитаны повторно.
 
-    log.info('datetime: %s   Start transform data', datetime.now())
-    movies_for_elastic = transform_data(movies)
-    log.info('datetime: %s   Start loading to ES', datetime.now())
-    elastic.load_data_into_elastic(movies_for_elastic, 'movies', state)
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        film_source: Источник изменённых фильмов
+        entity_sources: Источники изменённых персон и жанров
+        fan_out: Объект для частичного обновления фильмов
 
+    Yields:
+        (Optional[Batch]): Пачка данных или None, если ни в одном источнике нет новых данных
+    """
+    while True:
+        has_data = False
+        changed = {'persons': [], 'genres': []}
+        checkpoints = []
+        for source in entity_sources:
+            try:
+                log.info('datetime: %s   Start loading from PG: %s', datetime.now(), source.index)
+                batch = source.extract(postgres)
+            except NoMoreDataInPG:
+                continue
+            has_data = True
+            changed[source.index] = batch.data
+            checkpoints.append(Batch(batch.index, [], batch.state, checkpoint=batch.checkpoint))
+            batch.checkpoint = {}
+            yield batch
+
+        film_ids = set()
+        try:
+            log.info('datetime: %s   Start loading from PG: %s', datetime.now(), film_source.index)
+            batch = film_source.extract(postgres)
+        except NoMoreDataInPG:
+            pass
+        else:
+            has_data = True
+            film_ids = set(film_source.last_ids)
+            yield batch
+
+        if changed['persons'] or changed['genres']:
+            # Позиция источника фильмов ничего не говорит о фильмах других частей:
+            # при делении на части обновляются все связанные фильмы, ещё не загруженные пропускаются (404)
+            yield from fan_out.extract(
+                postgres,
+                persons=changed['persons'],
+                genres=changed['genres'],
+                exclude=film_ids,
+                cursor=(film_source.modified, film_source.fw_id) if film_source.lower is None else None
+            )
+        yield from checkpoints
+
+        if not has_data:
+            yield None
+
+
+def extract_outbox_batches(
+        postgres: PostgresExtractor,
+        listener: PostgresListener,
+        source: OutboxSource,
+        wait_timeout: float
+) -> Iterator[Batch]:
+    """Бесконечный поток пачек из журнала изменений
 
-def load_from_postgres(postgres: PostgresExtractor) -> Iterator:
-    """Основной метод загрузки данных из Postgres
+    Пока журнал пуст, поток блокируется в ожидании NOTIFY и не нагружает PG запросами.
+    По истечении wait_timeout журнал перечитывается на случай потерянного уведомления.
 
     Args:
         postgres: Объект класса для загрузки данных из postgres
+        listener: Объект класса для ожидания уведомлений postgres
+        source: Источник изменений из журнала
+        wait_timeout: Максимальное время ожидания уведомления
+
+    Yields:
+        (Batch): Пачка данных
+    """
+    listener.connect()
+    while True:
+        try:
+            yield from source.extract(postgres)
+        except NoMoreDataInPG:
+            source.cleanup(postgres)
+            listener.wait(wait_timeout)
+
+
+def load_batch(elastic: ElasticLoader, batch: Batch, index_name: Optional[str] = None) -> Optional[BulkSummary]:
+    """Метод для загрузки пачки документов в Elastic
+
+    Args:
+        elastic: Класс для работы с ES
+        batch: Пачка документов
+        index_name: Индекс для загрузки вместо batch.index
 
     Returns:
-        (Iterator): Список фильмов для Elastic
+        (Optional[BulkSummary]): Итоги загрузки; None, если пачка пустая
     """
-    modified = state.get_state('modified') or date(1970, 7, 1)
-    fw_id = state.get_state('fw_id')
+    if not batch.data:
+        return None
+    index_name = index_name or batch.index
+    log.info('datetime: %s   Start loading to ES: %s', datetime.now(), index_name)
+    return elastic.load_data_into_elastic(batch.data, index_name)
 
-    if fw_id:
-        query_film_works_id = queries.query_template_film_works_id\
-            .format(base_settings.limit_count)\
-            .replace('<**>', 'and fw.id > %(fw_id)s')
-    else:
-        query_film_works_id = queries.query_template_film_works_id\
-            .format(base_settings.limit_count)\
-            .replace('<**>', '')
 
-    try:
-        film_works_id = postgres.get_data(query_film_works_id, modified=modified, fw_id=fw_id)
-        ids = [row[0] for row in film_works_id]
+def adaptive_sizes(
+        elastic: ElasticLoader,
+        sources: Sequence[Any],
+        attribute: str = 'limit_count'
+) -> Callable[[Optional[BulkSummary]], None]:
+    """Подстройка размера bulk-запроса и пачки, читаемой из PG, по итогам загрузки в ES
 
-        if ids:
-            film_works_for_elastic = postgres.get_data(queries.query_film_works_elastic, ids=tuple(ids))
-            film_works = [FilmWorkElastic(**movie) for movie in film_works_for_elastic]
-        else:
-            raise NoMoreDataInPG('Отсутствуют новые данные в PG')
+    Размеры растут, пока bulk-запросы укладываются в ES_BULK_TARGET_LATENCY без отказов,
+    и уменьшаются вдвое при отказах (429) или медленных ответах. Границы — от 1/10 до 10
+    начальных значений ES_CHUNK_SIZE и LIMIT_COUNT / REINDEX_PAGE_SIZE.
 
-        state.modified = film_works[-1].modified.isoformat()
-        state.fw_id = ids[-1]
+    Args:
+        elastic: Класс для работы с ES
+        sources: Источники, читающие из PG пачки размером attribute
+        attribute: Атрибут источников с размером пачки
 
-        yield from film_works
+    Returns:
+        (Callable[[Optional[BulkSummary]], None]): Функция, которой передаются итоги каждой загрузки
+    """
+    if not base_settings.adaptive_batch:
+        return lambda summary: None
 
-    finally:
-        log.info('datetime: %s   Close PG connection', datetime.now())
+    initial = getattr(sources[0], attribute)
+    chunk_size = AdaptiveSize('ES_CHUNK_SIZE', elastic.chunk_size, elastic.chunk_size // 10, elastic.chunk_size * 10)
+    batch_size = AdaptiveSize(attribute.upper(), initial, initial // 10, initial * 10)
 
+    def update(summary: Optional[BulkSummary]) -> None:
+        # Пустая пачка или пачка, все документы которой не изменились, ничего не говорит о нагрузке на ES:
+        # иначе при простое размеры росли бы до максимума
+        if summary is None or not summary.requests:
+            return
+        ok = healthy(summary, es_settings.bulk_target_latency)
+        elastic.chunk_size = chunk_size.update(ok)
+        size = batch_size.update(ok)
+        for source in sources:
+            setattr(source, attribute, size)
 
-def transform_data(movies_pg: Iterator[FilmWorkElastic]) -> Iterator:
-    """Метод для преобразования данных в формат для Elastic
+    return update
+
+
+def reconcile(postgres: PostgresExtractor, elastic: ElasticLoader) -> None:
+    """Сверка индексов фильмов, персон и жанров с PG
+
+    Загружает документы, которых нет в ES, и удаляет документы записей, удалённых из PG.
+    Нужна в режиме polling: по modified удаления не видны.
 
     Args:
-        movies_pg: Фильмы из PG
+        postgres: Объект класса для загрузки данных из postgres
+        elastic: Класс для работы с ES
+    """
+    reconciler = Reconciler(
+        postgres, elastic, base_settings.reconcile_page_size, aggregate=base_settings.aggregate_in_pg
+    )
+    for index in RECONCILED:
+        reconciler.run(index)
 
-    Returns:
-        (List[Dict[str, Any]]): Список фильмов для Elastic
+
+def reconcile_periodically(postgres: PostgresExtractor, stop: threading.Event) -> None:
+    """Сверять индексы с PG раз в RECONCILE_INTERVAL секунд, пока не установлено событие stop
+
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        stop: Событие остановки
     """
+    # Отдельный загрузчик: размер bulk-запросов основного подстраивается под загрузку изменений
+    elastic = create_elastic_loader()
+    while not stop.wait(base_settings.reconcile_interval):
+        try:
+            reconcile(postgres, elastic)
+        except Exception as e:
+            log.error('datetime: %s   Ошибка при сверке с PG: %s', datetime.now(), e)
 
-    compare_fw_id = None
-    movie_es = None
-    movies_es = []
 
-    for movie in movies_pg:
-        if compare_fw_id is None or compare_fw_id != movie.fw_id:
-            if movie_es:
-                movies_es.append(movie_es)
+def install_outbox(postgres: PostgresExtractor) -> None:
+    """Установить журнал изменений и триггеры для CHANGE_CAPTURE=outbox
 
-            if movie.role == 'director':
-                directors_names = [movie.full_name]
-                directors = [{"id": movie.id, "name": movie.full_name}]
-            else:
-                directors_names = []
-                directors = []
+    Выполняется один раз, а не при каждом старте ETL: пересоздание триггеров
+    блокирует таблицы content и требует прав владельца.
 
-            if movie.role == 'actor':
-                actors_names = [movie.full_name]
-                actors = [{"id": movie.id, "name": movie.full_name}]
-            else:
-                actors_names = []
-                actors = []
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+    """
+    with open('queries/outbox.sql') as outbox_ddl:
+        postgres.execute(outbox_ddl.read())
+    log.info('datetime: %s   Журнал изменений установлен', datetime.now())
 
-            if movie.role == 'writer':
-                writers_names = [movie.full_name]
-                writers = [{"id": movie.id, "name": movie.full_name}]
-            else:
-                writers_names = []
-                writers = []
-
-            movie_es = {
-                "id": movie.fw_id,
-                "imdb_rating": movie.rating,
-                "genre": [movie.name],
-                "genres": [{"id": movie.g_id, "name": movie.name}],
-                "creation_date": movie.creation_date,
-                "title": movie.title,
-                "description": movie.description,
-                "directors_names": directors_names,
-                "actors_names": actors_names,
-                "writers_names": writers_names,
-                "directors": directors,
-                "actors": actors,
-                "writers": writers
-            }
-            compare_fw_id = movie.fw_id
-
-        elif compare_fw_id == movie.fw_id:
-            if movie.name not in movie_es['genre']:
-                movie_es['genre'].append(movie.name)
-                movie_es['genres'].append({"id": movie.g_id, "name": movie.name})
-            match movie.role:
-                case 'actor':
-                    if movie.full_name not in movie_es['directors_names']:
-                        movie_es['directors_names'].append(movie.full_name)
-                        movie_es['directors'].append({"id": movie.id, "name": movie.full_name})
-                case 'actor':
-                    if movie.full_name not in movie_es['actors_names']:
-                        movie_es['actors_names'].append(movie.full_name)
-                        movie_es['actors'].append({"id": movie.id, "name": movie.full_name})
-                case 'writer':
-                    if movie.full_name not in movie_es['writers_names']:
-                        movie_es['writers_names'].append(movie.full_name)
-                        movie_es['writers'].append({"id": movie.id, "name": movie.full_name})
-
-    movies_es.append(movie_es)
-
-    yield from movies_es
-
-    log.info('datetime: %s   Transform ending', datetime.now())
-
-
-def load_persons(elastic: ElasticLoader, postgres: PostgresExtractor):
-    """Метод для преобразования данных в формат для Elastic
-
-        Args:
-            elastic: Класс для работы с ES
-            postgres: Класс для работы с PG
+
+def run_incremental(postgres: PostgresExtractor, elastic: ElasticLoader, shard: Tuple[int, int] = (0, 1)) -> None:
+    """Непрерывный перенос изменений из PG в ES
+
+    Если частей несколько, реплика переносит только фильмы из своей части диапазона id
+    и хранит позиции чтения отдельно от других частей. Персоны и жанры переносит только
+    реплика первой части: она же применяет их изменения к фильмам всех частей.
+    При RECONCILE_INTERVAL > 0 реплика первой части периодически сверяет индексы с PG.
+
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        elastic: Класс для работы с ES
+        shard: Номер части, закреплённой за репликой, и количество частей
     """
-    state_persons = State(JsonFileStorage('storage/PersonsStorage.json'))
-    persons = load_data_from_postgres(postgres, state_persons, queries.query_persons, PersonElastic)
-    persons_for_elastic = transform_persons_data(persons)
-    elastic.load_data_into_elastic(persons_for_elastic, 'persons', state_persons)
+    partition = shard if shard[1] > 1 else None
+    suffix = '_{0}of{1}'.format(shard[0] + 1, shard[1]) if partition else ''
+    state = open_state('FileStorage' + suffix)
+    persons_state = open_state('PersonsStorage' + suffix)
+    genres_state = open_state('GenresStorage' + suffix)
+    listener = PostgresListener(pg_settings, 'etl_outbox')
+    # Изменения персон и жанров применяет одна реплика ко всем частям, иначе каждая загружала бы их заново
+    fan_out = FanOut(state, base_settings.limit_count)
+
+    if base_settings.change_capture == 'outbox':
+        if partition:
+            raise ValueError('CHANGE_CAPTURE=outbox не поддерживает ETL_SHARDS > 1')
+        (installed,), = postgres.get_tuples(queries.query_outbox_installed)
+        if not installed:
+            raise ValueError('Журнал изменений не установлен: выполните python main.py install-outbox')
+        outbox_source = OutboxSource(
+            open_state('OutboxStorage'),
+            state,
+            persons_state,
+            genres_state,
+            fan_out,
+            base_settings.limit_count,
+            aggregate=base_settings.aggregate_in_pg
+        )
+        sources = (outbox_source, fan_out)
+        batches = extract_outbox_batches(postgres, listener, outbox_source, base_settings.outbox_wait_timeout)
+    else:
+        film_source = FilmSource(
+            state, base_settings.limit_count, aggregate=base_settings.aggregate_in_pg, partition=partition
+        )
+        entity_sources = (
+            EntitySource(
+                'persons', persons_state, queries.query_persons, PersonElastic,
+                transform_persons_data, base_settings.limit_count
+            ),
+            EntitySource(
+                'genres', genres_state, queries.query_genres, GenreElastic,
+                transform_genres_data, base_settings.limit_count
+            ),
+        ) if shard[0] == 0 else ()
+        sources = (film_source, *entity_sources, fan_out)
+        batches = extract_batches(postgres, film_source, entity_sources, fan_out)
+
+    update_sizes = adaptive_sizes(elastic, sources)
+    pipeline = Pipeline(
+        extract=batches,
+        load=lambda batch: update_sizes(load_batch(elastic, batch)),
+        queue_size=base_settings.pipeline_queue_size,
+        idle_timeout=base_settings.idle_timeout
+    )
+    stop = threading.Event()
+    if base_settings.reconcile_interval and shard[0] == 0:
+        threading.Thread(
+            target=reconcile_periodically, args=(postgres, stop), name='reconcile', daemon=True
+        ).start()
+    try:
+        pipeline.run()
+    finally:
+        stop.set()
+        listener.close()
 
 
-def load_data_from_postgres(
+def reindex_films(
         postgres: PostgresExtractor,
-        state_obj: State,
-        query: str,
-        class_name: GenreElastic or PersonElastic
-) -> Iterator:
-    """Основной метод загрузки данных из Postgres
+        elastic: ElasticLoader,
+        target: str,
+        state: State,
+        partition: Optional[Tuple[int, int]] = None
+) -> int:
+    """Обход фильмов с сохранённой позиции и загрузка их в индекс target
 
     Args:
         postgres: Объект класса для загрузки данных из postgres
-        state_obj: Объект класса для работы с состоянием
-        query: Текст запроса к БД
-        class_name: Датакласса для вывода данных
+        elastic: Класс для работы с ES
+        target: Индекс для загрузки фильмов
+        state: Объект класса для хранения позиции обхода
+        partition: Номер части и количество частей диапазона id фильмов; None — все фильмы
 
-    Yields:
-        (Iterator): Список данных для Elastic
+    Returns:
+        (int): Количество загруженных фильмов
     """
-    modified = state_obj.get_state('modified') or date(1970, 7, 1)
-    data_for_elastic = postgres.get_data(query, modified=modified)
-    objects = [class_name(**obj) for obj in data_for_elastic]
-    state_obj.modified = objects[-1].modified.isoformat()
+    source = ReindexSource(
+        state, base_settings.reindex_page_size, aggregate=base_settings.aggregate_in_pg, partition=partition
+    )
+    label = 'Переиндексация {0} / {1}'.format(partition[0] + 1, partition[1]) if partition else 'Переиндексация'
+    progress = ReindexProgress(source.remaining(postgres), label=label)
+    log.info('datetime: %s   %s: start into %s, %d films', datetime.now(), label, target, progress.total)
+
+    update_sizes = adaptive_sizes(elastic, (source,), attribute='page_size')
+
+    def load(batch: Batch) -> None:
+        update_sizes(load_batch(elastic, batch, target))
+        progress.advance(len(batch.data))
+
+    Pipeline(
+        extract=source.batches(postgres),
+        load=load,
+        queue_size=base_settings.pipeline_queue_size,
+        idle_timeout=base_settings.idle_timeout
+    ).run()
 
-    yield from objects
+    # Следующий запуск полной переиндексации начнётся с начала таблицы
+    state.set_states({'modified': None, 'fw_id': None})
+    return progress.done
 
 
-def transform_persons_data(persons_pg: Iterator[PersonElastic]) -> Iterator:
-    """Метод для преобразования данных по персонам в формат для Elastic
+async def reindex_films_async(target: str, state: State) -> int:
+    """Обход фильмов с сохранённой позиции на asyncio: несколько страниц читаются из PG
+    и загружаются в ES одновременно (ASYNC_CONCURRENCY)
 
     Args:
-        persons_pg: Персоны из PG
+        target: Индекс для загрузки фильмов
+        state: Объект класса для хранения позиции обхода
 
-    Yields:
-        (Iterator): Список персон для Elastic
+    Returns:
+        (int): Количество загруженных фильмов
     """
-    persons_es = [{"id": person.person_id, "full_name": person.full_name} for person in persons_pg]
+    concurrency = base_settings.async_concurrency
+    if fingerprint_cache() is not None:
+        # asyncio-движок не ведёт отпечатки: после него сохранённые отпечатки target устарели
+        fingerprint_cache().clear(target)
+    postgres = AsyncPostgresExtractor(pg_settings, pool_size=concurrency + 1, max_idle=base_settings.pg_max_idle)
+    elastic = AsyncElasticLoader(
+        es_settings.es_host,
+        chunk_size=es_settings.chunk_size,
+        max_chunk_bytes=es_settings.max_chunk_bytes,
+        concurrency=concurrency,
+        max_retries=es_settings.max_retries
+    )
+    await postgres.connect()
+    await elastic.connect()
+    try:
+        reindex = AsyncReindex(
+            postgres, elastic, state, base_settings.reindex_page_size, concurrency,
+            aggregate=base_settings.aggregate_in_pg
+        )
+        progress = ReindexProgress(await reindex.remaining(), label='Переиндексация (asyncio)')
+        log.info('datetime: %s   %s: start into %s, %d films', datetime.now(), progress.label, target, progress.total)
+        await reindex.run(target, progress, adaptive_sizes(elastic, (reindex,), attribute='page_size'))
+    finally:
+        await postgres.close()
+        await elastic.close()
 
-    yield from persons_es
+    if cache_notifier() is not None:
+        # asyncio-движок загружает документы мимо ElasticLoader
+        cache_notifier().bump_generation(target)
+    state.set_states({'modified': None, 'fw_id': None})
+    return progress.done
 
 
-def load_genres(elastic: ElasticLoader, postgres: PostgresExtractor):
-    """Метод для перекладывания данных о жанрах из PG в Elastic
+def reindex_partition(target: str, partition: int, partitions: int) -> int:
+    """Переиндексация одной части фильмов в отдельном процессе
 
-        Args:
-            elastic: Класс для работы с ES
-            postgres: Класс для работы с PG
+    Соединения с PG и ES не передаются между процессами, поэтому процесс открывает свои.
+    Позиция обхода хранится в отдельном файле для каждой части.
+
+    Args:
+        target: Индекс для загрузки фильмов
+        partition: Номер части, от 0 до partitions - 1
+        partitions: Количество частей
+
+    Returns:
+        (int): Количество загруженных фильмов
     """
-    state_genres = State(JsonFileStorage('storage/GenresStorage.json'))
-    genres = load_data_from_postgres(postgres, state_genres, queries.query_genres, GenreElastic)
-    genres_for_elastic = transform_genres_data(genres)
-    elastic.load_data_into_elastic(genres_for_elastic, 'genres', state_genres)
+    state = open_state('ReindexStorage_{0}_{1}of{2}'.format(target, partition + 1, partitions))
+    elastic = create_elastic_loader()
+    postgres = create_postgres_extractor()
+    try:
+        return reindex_films(postgres, elastic, target, state, partition=(partition, partitions))
+    finally:
+        postgres.close()
+        close_clients()
 
 
-def transform_genres_data(genres_pg: Iterator[GenreElastic]) -> Iterator:
-    """Метод для преобразования данных по жанрам в формат для Elastic
+def run_full_reindex(
+        postgres: PostgresExtractor,
+        elastic: ElasticLoader,
+        blue_green: bool = False,
+        workers: int = 1,
+        use_async: bool = False
+) -> None:
+    """Полная переиндексация фильмов с продолжением с сохранённой позиции
+
+    В режиме blue_green фильмы загружаются в новую версию индекса movies_v{n},
+    а псевдоним movies переключается на неё только после окончания загрузки.
+    При workers > 1 диапазон id фильмов делится на workers частей,
+    и каждая часть переиндексируется в отдельном процессе.
 
     Args:
-        genres_pg: Жанры из PG
-
-    Yields:
-        (Iterator): Список жанров для Elastic
+        postgres: Объект класса для загрузки данных из postgres
+        elastic: Класс для работы с ES
+        blue_green: Загружать в новую версию индекса с переключением псевдонима
+        workers: Количество процессов
+        use_async: Переиндексировать на asyncio (asyncpg + AsyncElasticsearch) в одном процессе
     """
-    genres_es = [{"id": genre.genre_id, "name": genre.name, "description": genre.description} for genre in genres_pg]
+    reindex_state = open_state('ReindexStorage')
+    target = movie_index.movie['name']
+    if blue_green:
+        target = reindex_state.get_state('index')
+        if not target or not elastic.index_exists(target):
+            target = elastic.create_versioned_index(movie_index.movie)
+            reindex_state.set_states({'index': target, 'modified': None, 'fw_id': None})
+
+    started = datetime.now()
+    log.info('datetime: %s   Start full reindex into %s, workers: %d', started, target, workers)
+    if use_async:
+        done = asyncio.run(reindex_films_async(target, reindex_state))
+    elif workers > 1:
+        # spawn: дочерние процессы не наследуют открытые соединения и потоки родителя
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            done = sum(executor.map(reindex_partition, repeat(target), range(workers), repeat(workers)))
+    else:
+        done = reindex_films(postgres, elastic, target, reindex_state)
 
-    yield from genres_es
+    if blue_green:
+        elastic.publish_versioned_index(movie_index.movie, target, es_settings.number_of_replicas)
+        reindex_state.set_state('index', None)
 
+    elapsed = (datetime.now() - started).total_seconds()
+    log.info(
+        'datetime: %s   Full reindex finished: %d films, %.1f rows/s',
+        datetime.now(), done, done / elapsed if elapsed else 0.0
+    )
 
-if __name__ == '__main__':
-    log.info('Start datetime: %s', datetime.now())
 
-    state = State(JsonFileStorage())
-    is_run = state.get_state('is_run')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ETL из PG в ES')
+    parser.add_argument(
+        'command', nargs='?', default='run', choices=('run', 'full-reindex', 'reconcile', 'install-outbox'),
+        help='run — непрерывный перенос изменений, full-reindex — полная переиндексация фильмов, '
+             'reconcile — сверка индексов с PG, install-outbox — установка журнала изменений'
+    )
+    parser.add_argument(
+        '--blue-green', action='store_true',
+        help='для full-reindex: загрузить фильмы в новую версию индекса и переключить на неё псевдоним'
+    )
+    parser.add_argument(
+        '--async', dest='use_async', action='store_true',
+        help='для full-reindex: asyncio-движок (asyncpg + AsyncElasticsearch) вместо потоков'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=base_settings.reindex_workers,
+        help='для full-reindex: количество процессов, между которыми делится диапазон id фильмов'
+    )
+    args = parser.parse_args()
+    if args.use_async and args.workers > 1:
+        parser.error('--async и --workers > 1 несовместимы')
 
-    if is_run == 'False' or is_run is None:
-        state.set_state('is_run', 'True')
-    else:
-        exit()
+    log.info('Start datetime: %s', datetime.now())
+    metrics.start_server(base_settings.metrics_port)
+
+    lease = PostgresLease(pg_settings, ttl=base_settings.lease_ttl)
+    shard = None
+    if args.command == 'full-reindex':
+        if not lease.acquire_exclusive():
+            log.info('datetime: %s   ETL уже запущен другой репликой', datetime.now())
+            lease.close()
+            exit()
+    elif args.command == 'run':
+        shard = lease.acquire_shard(base_settings.etl_shards, lease.heartbeat_interval)
+        log.info('datetime: %s   Реплика получила часть %d / %d', datetime.now(), shard + 1, base_settings.etl_shards)
+    # Без блокировки продолжать нельзя: её уже может удерживать другая реплика.
+    # Сверке блокировка не нужна: удаление проверяется по PG, а загрузка документов идемпотентна
+    if lease.connected():
+        lease.start_heartbeat(on_lost=_thread.interrupt_main)
 
     try:
-        sleep(7)
-        indexes_es = (genre_index.genre, person_index.person, movie_index.movie)
-        elastic_index_creator = ElasticLoader(es_settings.es_host)
-        elastic_index_creator.create_indexes(indexes_es)
-        elastic_index_creator.close()
-        while True:
-            elastic_loader = ElasticLoader(es_settings.es_host)
-            postgres_extractor = PostgresExtractor(pg_settings, base_settings.cursor_array_size)
-            
-            load_films(elastic_loader, postgres_extractor)
-            load_persons(elastic_loader, postgres_extractor)
-            load_genres(elastic_loader, postgres_extractor)
-
+        # Пул соединений PG и клиент ES живут всё время работы процесса
+        elastic_loader = create_elastic_loader()
+        postgres_extractor = create_postgres_extractor()
+        try:
+            if args.command != 'install-outbox':
+                elastic_loader.create_indexes((genre_index.genre, person_index.person, movie_index.movie))
+            if args.command == 'install-outbox':
+                install_outbox(postgres_extractor)
+            elif args.command == 'full-reindex':
+                run_full_reindex(
+                    postgres_extractor,
+                    elastic_loader,
+                    blue_green=args.blue_green,
+                    workers=args.workers,
+                    use_async=args.use_async
+                )
+            elif args.command == 'reconcile':
+                reconcile(postgres_extractor, elastic_loader)
+            else:
+                run_incremental(postgres_extractor, elastic_loader, shard=(shard, base_settings.etl_shards))
+        finally:
             postgres_extractor.close()
-            elastic_loader.close()
+            close_clients()
     except OperationalError as e:
         log.error('datetime: %s   Ошибка при работе с PG', datetime.now())
 
     except (TransportError, ConnectionError):
         log.error('datetime: %s   Ошибка при работе с ES', datetime.now())
 
+    except (RetryLimitExceeded, CircuitOpenError) as e:
+        log.error('datetime: %s   Ресурс недоступен: %s', datetime.now(), e)
+
     finally:
-        state.set_state('is_run', 'False')
+        lease.close()
@@ -0,0 +1,56 @@
+"""Модуль с метриками ETL в формате Prometheus"""
+from datetime import datetime
+from typing import Any, Dict
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from log.logger import log
+
+# Границы корзин для времени стадий и bulk-запросов: от 5 мс до 1 минуты
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+ROWS_EXTRACTED = Counter('etl_rows_extracted', 'Записи, прочитанные из PG', ['index'])
+DOCS_INDEXED = Counter('etl_docs_indexed', 'Документы, загруженные в ES', ['index'])
+DOCS_DELETED = Counter('etl_docs_deleted', 'Документы, удалённые из ES', ['index'])
+DOCS_SKIPPED = Counter('etl_docs_skipped', 'Документы, не отправленные в ES, так как они не изменились', ['index'])
+DOCS_FAILED = Counter('etl_docs_failed', 'Документы, не загруженные в ES', ['index'])
+BULK_RETRIED = Counter('etl_bulk_retried', 'Документы, повторно отправленные в ES после временных ошибок', ['index'])
+BULK_REJECTED = Counter('etl_bulk_rejected', 'Документы, отклонённые ES из-за перегрузки (429)', ['index'])
+BACKOFF_RETRIES = Counter('etl_backoff_retries', 'Повторы вызовов после временных ошибок', ['function'])
+
+STAGE_SECONDS = Histogram(
+    'etl_stage_seconds', 'Время обработки пачки стадией конвейера', ['stage', 'index'], buckets=LATENCY_BUCKETS
+)
+BULK_LATENCY = Histogram(
+    'etl_bulk_latency_seconds', 'Среднее время одного bulk-запроса при загрузке пачки', ['index'],
+    buckets=LATENCY_BUCKETS
+)
+
+CHECKPOINT_LAG = Gauge('etl_checkpoint_lag_seconds', 'Отставание сохранённой позиции modified от текущего времени', ['index'])
+BATCH_SIZE = Gauge('etl_batch_size', 'Текущий размер пачки', ['name'])
+CIRCUIT_STATE = Gauge('etl_circuit_state', 'Состояние выключателя: 0 — замкнут, 1 — разомкнут, 2 — пробный вызов', ['resource'])
+
+
+def start_server(port: int) -> None:
+    """Запустить HTTP-сервер с метриками в фоновом потоке
+
+    Args:
+        port: Порт сервера; 0 — не запускать
+    """
+    if port:
+        start_http_server(port)
+        log.info('datetime: %s   Метрики доступны на порту %d: /metrics', datetime.now(), port)
+
+
+def observe_checkpoint(index: str, checkpoint: Dict[str, Any]) -> None:
+    """Обновить отставание позиции источника после сохранения checkpoint
+
+    Args:
+        index: Название индекса ES
+        checkpoint: Сохранённые значения состояния
+    """
+    modified = checkpoint.get('modified')
+    if not modified:
+        return
+    modified = datetime.fromisoformat(modified)
+    CHECKPOINT_LAG.labels(index).set((datetime.now(modified.tzinfo) - modified).total_seconds())
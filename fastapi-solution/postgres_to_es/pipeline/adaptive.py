@@ -0,0 +1,65 @@
+"""Модуль с подстройкой размера пачек под нагрузку на ES"""
+from datetime import datetime
+
+from database.elastic_loader import BulkSummary
+from log.logger import log
+from metrics import metrics
+
+
+class AdaptiveSize:
+    """Размер пачки, подстраиваемый по принципу AIMD (additive increase / multiplicative decrease).
+
+    Пока ES отвечает быстро и без отказов, размер растёт на постоянный шаг;
+    при отказе или медленном ответе он сразу уменьшается в несколько раз.
+    Так размер держится около наибольшего значения, которое выдерживает кластер.
+    """
+
+    def __init__(self, name: str, initial: int, minimum: int, maximum: int, decrease: float = 0.5) -> None:
+        """Конструктор класса.
+
+        Args:
+            name: Название размера для лога
+            initial: Начальный размер
+            minimum: Минимальный размер
+            maximum: Максимальный размер
+            decrease: Множитель уменьшения размера
+        """
+        self.name = name
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.value = min(max(initial, self.minimum), self.maximum)
+        self.step = max(initial // 10, 1)
+        self.decrease = decrease
+        metrics.BATCH_SIZE.labels(name).set(self.value)
+
+    def update(self, healthy: bool) -> int:
+        """Изменить размер по результату последней загрузки
+
+        Args:
+            healthy: ES справился с загрузкой без отказов и в пределах целевой задержки
+
+        Returns:
+            (int): Новый размер
+        """
+        previous = self.value
+        if healthy:
+            self.value = min(self.value + self.step, self.maximum)
+        else:
+            self.value = max(int(self.value * self.decrease), self.minimum)
+        if self.value != previous:
+            metrics.BATCH_SIZE.labels(self.name).set(self.value)
+            log.info('datetime: %s   %s: %d -> %d', datetime.now(), self.name, previous, self.value)
+        return self.value
+
+
+def healthy(summary: BulkSummary, target_latency: float) -> bool:
+    """Справился ли ES с загрузкой пачки
+
+    Args:
+        summary: Итоги загрузки пачки
+        target_latency: Целевое время одного bulk-запроса, секунды
+
+    Returns:
+        (bool): Отказов (429 / es_rejected_execution_exception) нет и bulk-запросы не медленнее целевого времени
+    """
+    return summary.rejected == 0 and summary.latency <= target_latency
@@ -0,0 +1,134 @@
+"""Модуль с асинхронной полной переиндексацией фильмов"""
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from database.async_elastic_loader import AsyncElasticLoader
+from database.async_postgres_extractor import AsyncPostgresExtractor
+from database.elastic_loader import BulkSummary
+from pipeline.partition import partition_bounds
+from pipeline.reindex import ReindexProgress
+from pipeline.sources import film_works_from_rows
+from pipeline.transform import assemble_films
+from queries import queries
+from storage.storage import State
+
+
+class AsyncReindex:
+    """Полный обход content.film_work по ключу (modified, id) на asyncio.
+
+    Страницы id читаются по очереди (следующая страница начинается после последнего ключа предыдущей),
+    а чтение строк страницы, сборка документов и bulk-загрузка выполняются одновременно
+    для нескольких страниц. Позиция сохраняется по порядку страниц: страница фиксируется
+    только после того, как загружены все предыдущие.
+    """
+    index = 'movies'
+
+    def __init__(
+            self,
+            postgres: AsyncPostgresExtractor,
+            elastic: AsyncElasticLoader,
+            state: State,
+            page_size: int,
+            concurrency: int,
+            aggregate: bool = False,
+            partition: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            postgres: Объект класса для асинхронной загрузки данных из postgres
+            elastic: Класс для асинхронной загрузки данных в ES
+            state: Объект класса для хранения позиции обхода
+            page_size: Количество фильмов на странице
+            concurrency: Максимальное количество страниц, обрабатываемых одновременно
+            aggregate: Собирать документы в PG (json_agg) вместо сборки из строк join
+            partition: Номер части и количество частей, на которые делится диапазон id фильмов
+        """
+        self.postgres = postgres
+        self.elastic = elastic
+        self.state = state
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.aggregate = aggregate
+        modified = state.get_state('modified')
+        # datetime.min asyncpg передаёт в PG как -infinity
+        self.modified = datetime.fromisoformat(modified) if modified else datetime.min
+        self.fw_id = state.get_state('fw_id')
+        self.lower, self.upper = partition_bounds(*partition) if partition else (None, None)
+        self.condition = queries.film_works_partition_condition if partition else ''
+
+    async def remaining(self) -> int:
+        """Количество фильмов, которые ещё предстоит обойти
+
+        Returns:
+            (int): Количество фильмов после текущей позиции
+        """
+        rows = await self.postgres.get_data(
+            queries.query_film_works_count.replace('<**>', self.condition),
+            modified=self.modified,
+            fw_id=self.fw_id,
+            lower=self.lower,
+            upper=self.upper
+        )
+        return rows[0][0]
+
+    async def run(
+            self,
+            target: str,
+            progress: ReindexProgress,
+            on_loaded: Callable[[Optional[BulkSummary]], None] = lambda summary: None
+    ) -> None:
+        """Обойти фильмы от сохранённой позиции до конца таблицы и загрузить их в индекс target
+
+        Args:
+            target: Индекс для загрузки фильмов
+            progress: Подсчёт скорости и оставшегося времени
+            on_loaded: Вызывается с итогами загрузки каждой страницы
+        """
+        query = queries.query_template_film_works_id.replace('<**>', self.condition)
+        pending: Deque[Tuple[asyncio.Task, Dict[str, Any]]] = deque()
+        try:
+            while rows := await self.postgres.get_data(
+                    query.format(self.page_size),
+                    modified=self.modified,
+                    fw_id=self.fw_id,
+                    lower=self.lower,
+                    upper=self.upper
+            ):
+                self.modified, self.fw_id = rows[-1]['modified'], rows[-1]['id']
+                task = asyncio.create_task(self._load_page([row['id'] for row in rows], target))
+                pending.append((task, {'modified': self.modified.isoformat(), 'fw_id': self.fw_id}))
+                while len(pending) >= self.concurrency or (pending and pending[0][0].done()):
+                    await self._commit(pending.popleft(), progress, on_loaded)
+            while pending:
+                await self._commit(pending.popleft(), progress, on_loaded)
+        finally:
+            for task, _ in pending:
+                task.cancel()
+
+    async def _commit(
+            self,
+            page: Tuple[asyncio.Task, Dict[str, Any]],
+            progress: ReindexProgress,
+            on_loaded: Callable[[Optional[BulkSummary]], None]
+    ) -> None:
+        """Дождаться загрузки страницы и сохранить позицию после неё"""
+        task, checkpoint = page
+        count, summary = await task
+        self.state.set_states(checkpoint)
+        progress.advance(count)
+        on_loaded(summary)
+
+    async def _load_page(self, ids: list, target: str) -> Tuple[int, Optional[BulkSummary]]:
+        """Прочитать строки страницы, собрать документы и загрузить их в ES"""
+        if self.aggregate:
+            rows = await self.postgres.get_data(queries.query_film_works_documents, ids=tuple(ids))
+            documents = [row['document'] for row in rows]
+        else:
+            rows = await self.postgres.get_data(queries.query_film_works_elastic, ids=tuple(ids))
+            documents = list(assemble_films(film_works_from_rows(rows)))
+        if not documents:
+            return 0, None
+        return len(documents), await self.elastic.load_data_into_elastic(documents, target)
@@ -0,0 +1,197 @@
+"""Модуль для частичного обновления фильмов при изменении связанных персон и жанров"""
+from collections import defaultdict
+from typing import Iterable, List, Optional, Set, Tuple
+
+from database.data_classes import GenreElastic, PersonElastic
+from database.postgres_extractor import PostgresExtractor
+from pipeline.partition import partition_bounds
+from pipeline.pipeline import Batch
+from queries import queries
+from storage.storage import State
+
+# Приводит вложенных персон и жанров, изменённых в цикле, к их связям в PG: обновляет имена,
+# добавляет новые связи (params.roles, params.genre_ids), убирает удалённые персоны и жанры (params.removed)
+# и связи, которых больше нет; затем пересобирает *_names / genre в порядке имён, как при полной сборке.
+# Если документ не изменился, он не перезаписывается (ctx.op = 'none').
+UPDATE_SCRIPT = '''
+boolean changed = false;
+for (String role : ['actors', 'writers', 'directors']) {
+  List items = ctx._source[role] == null ? new ArrayList() : ctx._source[role];
+  List linked = params.roles.containsKey(role) ? params.roles[role] : new ArrayList();
+  List kept = new ArrayList();
+  Set ids = new HashSet();
+  for (Map item : items) {
+    if (params.removed.contains(item.id)) {
+      changed = true;
+      continue;
+    }
+    if (params.persons.containsKey(item.id)) {
+      if (!linked.contains(item.id)) {
+        changed = true;
+        continue;
+      }
+      if (item.name != params.persons[item.id]) {
+        item.name = params.persons[item.id];
+        changed = true;
+      }
+    }
+    kept.add(item);
+    ids.add(item.id);
+  }
+  for (String id : linked) {
+    if (!ids.contains(id)) {
+      kept.add(['id': id, 'name': params.persons[id]]);
+      changed = true;
+    }
+  }
+  kept.sort((a, b) -> a.name.compareTo(b.name));
+  List names = new ArrayList();
+  for (Map item : kept) { names.add(item.name); }
+  ctx._source[role] = kept;
+  ctx._source[role + '_names'] = names;
+}
+List genres = ctx._source.genres == null ? new ArrayList() : ctx._source.genres;
+List kept = new ArrayList();
+Set ids = new HashSet();
+for (Map item : genres) {
+  if (params.removed.contains(item.id)) {
+    changed = true;
+    continue;
+  }
+  if (params.genres.containsKey(item.id) && item.name != params.genres[item.id]) {
+    item.name = params.genres[item.id];
+    changed = true;
+  }
+  kept.add(item);
+  ids.add(item.id);
+}
+for (String id : params.genre_ids) {
+  if (!ids.contains(id)) {
+    kept.add(['id': id, 'name': params.genres[id]]);
+    changed = true;
+  }
+}
+kept.sort((a, b) -> a.name.compareTo(b.name));
+List names = new ArrayList();
+for (Map item : kept) { names.add(item.name); }
+ctx._source.genres = kept;
+ctx._source.genre = names;
+if (!changed) { ctx.op = 'none'; }
+'''
+
+
+class FanOut:
+    """Разворачивает изменения персон и жанров в частичные обновления документов фильмов.
+
+    Вместо полной пересборки документов фильмов их вложенные actors / writers / directors / genres
+    обновляются bulk-действиями update, а удалённые персоны и жанры убираются из них.
+    Связи изменённых персон и жанров берутся из PG, поэтому новая связь с уже загруженным
+    фильмом тоже попадает в его документ.
+    Фильм, затронутый несколькими изменениями за цикл, получает одно действие.
+    """
+    index = 'movies'
+
+    def __init__(self, state: State, limit_count: int, partition: Optional[Tuple[int, int]] = None) -> None:
+        """Конструктор класса.
+
+        Args:
+            state: Состояние индекса фильмов
+            limit_count: Количество id в одном запросе к PG и фильмов в одной пачке
+            partition: Номер части и количество частей диапазона id; обновляются только фильмы этой части
+        """
+        self.state = state
+        self.limit_count = limit_count
+        self.lower, self.upper = partition_bounds(*partition) if partition else (None, None)
+        self.condition = queries.film_works_partition_condition if partition else ''
+
+    def extract(
+            self,
+            postgres: PostgresExtractor,
+            persons: Iterable[PersonElastic],
+            genres: Iterable[GenreElastic],
+            exclude: Iterable[str] = (),
+            cursor: Optional[Tuple] = None,
+            removed: Iterable[str] = ()
+    ) -> List[Batch]:
+        """Собрать пачки частичных обновлений фильмов
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+            persons: Изменённые персоны
+            genres: Изменённые жанры
+            exclude: id фильмов, документы которых уже пересобраны в этом цикле
+            cursor: Позиция (modified, fw_id) источника фильмов; фильмы после неё
+                ещё не загружены и будут собраны целиком, поэтому не обновляются
+            removed: id удалённых персон и жанров; фильмы, ещё связанные с ними в PG, теряют их
+
+        Returns:
+            (List[Batch]): Пачки bulk-действий update
+        """
+        persons = {person.person_id: person.full_name for person in persons}
+        genres = {genre.genre_id: genre.name for genre in genres}
+        removed = set(removed)
+        films = defaultdict(lambda: {
+            'persons': {}, 'roles': defaultdict(list), 'genres': {}, 'genre_ids': [], 'removed': []
+        })
+        for film_id, person_id, role in self._film_works_id(
+                postgres, queries.query_person_film_works_links, [*persons, *removed], cursor
+        ):
+            if person_id in removed:
+                films[film_id]['removed'].append(person_id)
+            else:
+                films[film_id]['persons'][person_id] = persons[person_id]
+                films[film_id]['roles'][role + 's'].append(person_id)
+        for film_id, genre_id in self._film_works_id(
+                postgres, queries.query_genre_film_works_links, [*genres, *removed], cursor
+        ):
+            if genre_id in removed:
+                films[film_id]['removed'].append(genre_id)
+            else:
+                films[film_id]['genres'][genre_id] = genres[genre_id]
+                films[film_id]['genre_ids'].append(genre_id)
+
+        exclude: Set[str] = set(exclude)
+        actions = [
+            {
+                '_op_type': 'update',
+                '_index': self.index,
+                '_id': film_id,
+                'script': {'source': UPDATE_SCRIPT, 'lang': 'painless', 'params': params},
+            }
+            for film_id, params in films.items()
+            if film_id not in exclude
+        ]
+        return [
+            Batch(self.index, actions[start:start + self.limit_count], self.state)
+            for start in range(0, len(actions), self.limit_count)
+        ]
+
+    def _film_works_id(
+            self,
+            postgres: PostgresExtractor,
+            query: str,
+            ids: Iterable[str],
+            cursor: Optional[Tuple]
+    ) -> Iterable[tuple]:
+        """Найти связи фильмов с изменёнными персонами или жанрами, запрашивая id пачками
+
+        Строка — id фильма, id персоны или жанра и, для персон, роль.
+        """
+        if cursor:
+            query = query.replace('<**>', '{0} {1}'.format(queries.film_works_cursor_condition, self.condition))
+            modified, fw_id = cursor
+        else:
+            query = query.replace('<**>', self.condition)
+            modified, fw_id = None, None
+
+        ids = list(ids)
+        for start in range(0, len(ids), self.limit_count):
+            for row in postgres.get_tuples(
+                    query,
+                    ids=tuple(ids[start:start + self.limit_count]),
+                    modified=modified,
+                    fw_id=fw_id,
+                    lower=self.lower,
+                    upper=self.upper
+            ):
+                yield tuple(row)
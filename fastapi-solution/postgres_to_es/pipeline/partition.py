@@ -0,0 +1,22 @@
+"""Модуль с разбиением диапазона id фильмов на части"""
+from typing import Tuple
+from uuid import UUID
+
+
+def partition_bounds(partition: int, partitions: int) -> Tuple[str, str]:
+    """Границы диапазона id фильмов для одной из partitions частей
+
+    Id фильмов — случайные uuid4, поэтому равные диапазоны пространства uuid
+    содержат примерно одинаковое количество фильмов.
+
+    Args:
+        partition: Номер части, от 0 до partitions - 1
+        partitions: Количество частей
+
+    Returns:
+        (Tuple[str, str]): Нижняя и верхняя границы id включительно
+    """
+    size = 2 ** 128 // partitions
+    lower = partition * size
+    upper = 2 ** 128 - 1 if partition == partitions - 1 else lower + size - 1
+    return str(UUID(int=lower)), str(UUID(int=upper))
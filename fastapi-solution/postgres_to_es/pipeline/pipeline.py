@@ -0,0 +1,157 @@
+"""Модуль с конвейером ETL: извлечение, преобразование и загрузка в отдельных потоках"""
+import threading
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from queue import Empty, Full, Queue
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from log.logger import log
+from metrics import metrics
+from storage.storage import State
+
+_STOP = object()
+_QUEUE_TIMEOUT = 0.5
+
+
+@dataclass
+class Batch:
+    """Пачка данных, передаваемая между стадиями конвейера
+
+    Attributes:
+        index: Название индекса ES
+        data: Данные пачки (строки из PG, после преобразования — документы для ES)
+        state: Объект для сохранения состояния источника
+        checkpoint: Значения состояния, которые сохраняются после успешной загрузки пачки в ES
+        transform: Функция преобразования данных в документы для ES
+    """
+    index: str
+    data: List[Any]
+    state: State
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    transform: Optional[Callable[[Iterable], Iterable]] = None
+
+
+class Pipeline:
+    """Конвейер из трёх стадий, связанных ограниченными очередями.
+
+    Пока очередная пачка загружается в ES, следующая уже читается из PG и преобразуется.
+    Если загрузка отстаёт, очереди заполняются и чтение из PG приостанавливается,
+    поэтому скорость определяется самой медленной стадией, а не суммой всех стадий.
+    """
+
+    def __init__(
+            self,
+            extract: Iterator[Optional[Batch]],
+            load: Callable[[Batch], None],
+            queue_size: int,
+            idle_timeout: float
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            extract: Итератор пачек из PG; None означает, что новых данных пока нет
+            load: Функция загрузки пачки в ES
+            queue_size: Максимальное число пачек в очереди между стадиями
+            idle_timeout: Время ожидания перед повторным опросом PG, если новых данных нет
+        """
+        self._extract = extract
+        self._load = load
+        self._idle_timeout = idle_timeout
+        self._transformed = Queue(maxsize=queue_size)
+        self._extracted = Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        """Запустить стадии и дождаться их завершения.
+
+        Exceptions:
+            Exception: Ошибка, из-за которой остановилась одна из стадий
+        """
+        threads = [
+            threading.Thread(target=self._stage, args=(stage,), name=stage.__name__, daemon=True)
+            for stage in (self._extract_stage, self._transform_stage, self._load_stage)
+        ]
+        for thread in threads:
+            thread.start()
+        # Стадия извлечения может быть заблокирована ожиданием данных из PG,
+        # поэтому конвейер завершается вместе со стадиями преобразования и загрузки
+        try:
+            for thread in threads[1:]:
+                while thread.is_alive():
+                    thread.join(_QUEUE_TIMEOUT)
+        finally:
+            self.stop()
+
+        if self._error:
+            raise self._error
+
+    def stop(self) -> None:
+        """Остановить все стадии конвейера"""
+        self._stop.set()
+
+    def _stage(self, target: Callable[[], None]) -> None:
+        """Выполнить стадию; при ошибке сохранить её и остановить остальные стадии"""
+        try:
+            target()
+        except BaseException as e:
+            log.error('datetime: %s   Ошибка в стадии %s: %s', datetime.now(), target.__name__, e)
+            if self._error is None:
+                self._error = e
+            self.stop()
+
+    def _put(self, queue: Queue, item: Any) -> bool:
+        """Положить элемент в очередь, ожидая свободного места (backpressure)"""
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=_QUEUE_TIMEOUT)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _get(self, queue: Queue) -> Any:
+        """Взять элемент из очереди, ожидая его появления"""
+        while not self._stop.is_set():
+            try:
+                return queue.get(timeout=_QUEUE_TIMEOUT)
+            except Empty:
+                continue
+        return _STOP
+
+    def _extract_stage(self) -> None:
+        started = perf_counter()
+        for batch in self._extract:
+            if self._stop.is_set():
+                return
+            if batch is None:
+                self._stop.wait(self._idle_timeout)
+                started = perf_counter()
+                continue
+            metrics.STAGE_SECONDS.labels('extract', batch.index).observe(perf_counter() - started)
+            metrics.ROWS_EXTRACTED.labels(batch.index).inc(len(batch.data))
+            if not self._put(self._extracted, batch):
+                return
+            started = perf_counter()
+        self._put(self._extracted, _STOP)
+
+    def _transform_stage(self) -> None:
+        while (batch := self._get(self._extracted)) is not _STOP:
+            if batch.transform:
+                started = perf_counter()
+                batch.data = list(batch.transform(batch.data))
+                metrics.STAGE_SECONDS.labels('transform', batch.index).observe(perf_counter() - started)
+            if not self._put(self._transformed, batch):
+                return
+        self._put(self._transformed, _STOP)
+
+    def _load_stage(self) -> None:
+        while (batch := self._get(self._transformed)) is not _STOP:
+            started = perf_counter()
+            self._load(batch)
+            metrics.STAGE_SECONDS.labels('load', batch.index).observe(perf_counter() - started)
+            if batch.checkpoint:
+                batch.state.set_states(batch.checkpoint)
+                metrics.observe_checkpoint(batch.index, batch.checkpoint)
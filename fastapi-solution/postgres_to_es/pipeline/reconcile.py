@@ -0,0 +1,134 @@
+"""Модуль со сверкой документов в ES с записями в PG"""
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from database.data_classes import GenreElastic, PersonElastic
+from database.elastic_loader import ElasticLoader
+from database.postgres_extractor import PostgresExtractor
+from log.logger import log
+from pipeline.sources import extract_film_documents, extract_film_works
+from pipeline.transform import assemble_films, delete_actions, transform_genres_data, transform_persons_data
+from queries import queries
+
+# Индекс ES -> таблица PG, записи которой в нём хранятся
+RECONCILED = {'movies': 'film_work', 'persons': 'person', 'genres': 'genre'}
+
+
+class Reconciler:
+    """Сверка множеств id индекса ES и таблицы PG.
+
+    id читаются из обоих хранилищ страницами по возрастанию и сливаются как два отсортированных
+    потока, поэтому в памяти находятся только текущие страницы, а не множества целиком.
+    Порядок совпадает: uuid в PG сравниваются побайтово, как и keyword-строки в ES.
+    Документы, которых нет в ES, загружаются, а документы удалённых из PG записей удаляются.
+    """
+
+    def __init__(
+            self,
+            postgres: PostgresExtractor,
+            elastic: ElasticLoader,
+            page_size: int,
+            aggregate: bool = False
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+            elastic: Класс для работы с ES
+            page_size: Количество id в одной странице чтения и в одной пачке исправлений
+            aggregate: Собирать документы фильмов в PG (json_agg) вместо сборки из строк join
+        """
+        self.postgres = postgres
+        self.elastic = elastic
+        self.page_size = page_size
+        self.aggregate = aggregate
+
+    def run(self, index: str) -> Tuple[int, int]:
+        """Сверить индекс с таблицей PG и исправить расхождения
+
+        Args:
+            index: Название индекса из RECONCILED
+
+        Returns:
+            (Tuple[int, int]): Количество загруженных и удалённых документов
+        """
+        table = RECONCILED[index]
+        loaded = deleted = 0
+        for missing, stale in self.diff(index, table):
+            if missing:
+                # Отпечаток документа может остаться, хотя самого документа в ES уже нет
+                loaded += self.elastic.load_data_into_elastic(
+                    self.documents(index, missing), index, skip_unchanged=False
+                ).indexed
+            # Запись могла появиться в PG и попасть в ES уже после чтения её страницы из PG
+            stale = self.absent(table, stale)
+            if stale:
+                deleted += self.elastic.load_data_into_elastic(delete_actions(stale, index), index).deleted
+        log.info('datetime: %s   Сверка %s: загружено %d, удалено %d', datetime.now(), index, loaded, deleted)
+        return loaded, deleted
+
+    def diff(self, index: str, table: str) -> Iterator[Tuple[List[str], List[str]]]:
+        """Расхождения между индексом и таблицей порциями не больше page_size
+
+        Args:
+            index: Название индекса
+            table: Таблица PG в схеме content
+
+        Yields:
+            (Tuple[List[str], List[str]]): id, которых нет в ES, и id, которых нет в PG
+        """
+        pg, es = self.pg_ids(table), self.es_ids(index)
+        pg_id, es_id = next(pg, None), next(es, None)
+        missing, stale = [], []
+        while pg_id is not None or es_id is not None:
+            if es_id is None or (pg_id is not None and pg_id < es_id):
+                missing.append(pg_id)
+                pg_id = next(pg, None)
+            elif pg_id is None or es_id < pg_id:
+                stale.append(es_id)
+                es_id = next(es, None)
+            else:
+                pg_id, es_id = next(pg, None), next(es, None)
+            if len(missing) >= self.page_size or len(stale) >= self.page_size:
+                yield missing, stale
+                missing, stale = [], []
+        if missing or stale:
+            yield missing, stale
+
+    def pg_ids(self, table: str) -> Iterator[str]:
+        """id записей таблицы по возрастанию, страницами по page_size"""
+        query = queries.query_ids_after.format(table=table, limit=self.page_size)
+        after = None
+        while page := [row[0] for row in self.postgres.get_tuples(query, after=after)]:
+            yield from page
+            after = page[-1]
+
+    def es_ids(self, index: str) -> Iterator[str]:
+        """id документов индекса по возрастанию, страницами по page_size"""
+        after = None
+        while page := self.elastic.search_ids(index, self.page_size, after):
+            yield from page
+            after = page[-1]
+
+    def absent(self, table: str, ids: List[str]) -> List[str]:
+        """id из ids, которых нет в таблице PG"""
+        if not ids:
+            return []
+        existing = {
+            row[0]
+            for row in self.postgres.get_tuples(queries.query_existing_ids.format(table=table), ids=tuple(ids))
+        }
+        return [_id for _id in ids if _id not in existing]
+
+    def documents(self, index: str, ids: List[str]) -> List[Dict[str, Any]]:
+        """Собрать документы для ES по id записей"""
+        if index == 'movies':
+            if self.aggregate:
+                return [row['document'] for row in extract_film_documents(self.postgres, ids)]
+            return list(assemble_films(extract_film_works(self.postgres, ids)))
+        if index == 'persons':
+            rows = self.postgres.get_tuples(queries.query_persons_by_id, ids=tuple(ids))
+            return list(transform_persons_data(PersonElastic(*obj) for obj in rows))
+        rows = self.postgres.get_tuples(queries.query_genres_by_id, ids=tuple(ids))
+        return list(transform_genres_data(GenreElastic(*obj) for obj in rows))
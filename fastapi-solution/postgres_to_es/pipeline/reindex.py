@@ -0,0 +1,134 @@
+"""Модуль для полной переиндексации фильмов"""
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Optional, Tuple
+
+from database.postgres_extractor import PostgresExtractor
+from log.logger import log
+from pipeline.partition import partition_bounds
+from pipeline.pipeline import Batch
+from pipeline.sources import film_batch
+from queries import queries
+from storage.storage import State
+
+
+class ReindexSource:
+    """Полный обход content.film_work по ключу (modified, id) большими страницами.
+
+    Позиция сохраняется после загрузки каждой страницы в ES,
+    поэтому после сбоя обход продолжается с того же ключа.
+    При заданной части (partition) обходятся только фильмы из её диапазона id.
+    """
+    index = 'movies'
+
+    def __init__(
+            self,
+            state: State,
+            page_size: int,
+            aggregate: bool = False,
+            partition: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            state: Объект класса для хранения позиции обхода
+            page_size: Количество фильмов на странице
+            aggregate: Собирать документы в PG (json_agg) вместо сборки из строк join
+            partition: Номер части и количество частей, на которые делится диапазон id фильмов
+        """
+        self.state = state
+        self.page_size = page_size
+        self.aggregate = aggregate
+        self.modified = state.get_state('modified') or '-infinity'
+        self.fw_id = state.get_state('fw_id')
+        self.lower, self.upper = partition_bounds(*partition) if partition else (None, None)
+        self.condition = queries.film_works_partition_condition if partition else ''
+
+    def remaining(self, postgres: PostgresExtractor) -> int:
+        """Количество фильмов, которые ещё предстоит обойти
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+
+        Returns:
+            (int): Количество фильмов после текущей позиции
+        """
+        rows = list(postgres.get_tuples(
+            queries.query_film_works_count.replace('<**>', self.condition),
+            modified=self.modified,
+            fw_id=self.fw_id,
+            lower=self.lower,
+            upper=self.upper
+        ))
+        return rows[0][0]
+
+    def batches(self, postgres: PostgresExtractor) -> Iterator[Batch]:
+        """Страницы фильмов от сохранённой позиции до конца таблицы
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+
+        Yields:
+            (Batch): Страница фильмов
+        """
+        # Размер страницы может меняться между страницами (AdaptiveSize)
+        query = queries.query_template_film_works_id.replace('<**>', self.condition)
+        while rows := list(postgres.get_tuples(
+                query.format(self.page_size),
+                modified=self.modified,
+                fw_id=self.fw_id,
+                lower=self.lower,
+                upper=self.upper
+        )):
+            batch = film_batch(postgres, [row[0] for row in rows], self.state, self.aggregate)
+            self.modified = rows[-1][1].isoformat()
+            self.fw_id = rows[-1][0]
+            batch.checkpoint = {'modified': self.modified, 'fw_id': self.fw_id}
+            yield batch
+
+
+class ReindexProgress:
+    """Подсчёт скорости и оставшегося времени переиндексации"""
+
+    def __init__(self, total: int, log_interval: float = 10, label: str = 'Переиндексация') -> None:
+        """Конструктор класса.
+
+        Args:
+            total: Общее количество фильмов для обхода
+            log_interval: Минимальный интервал между записями в лог, секунды
+            label: Подпись прогресса в логе
+        """
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.log_interval = log_interval
+        self._started = monotonic()
+        self._logged = self._started
+
+    @property
+    def rate(self) -> float:
+        """Скорость переиндексации, фильмов в секунду"""
+        elapsed = monotonic() - self._started
+        return self.done / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self) -> timedelta:
+        """Оставшееся время переиндексации"""
+        rate = self.rate
+        return timedelta(seconds=round((self.total - self.done) / rate)) if rate else timedelta.max
+
+    def advance(self, count: int) -> None:
+        """Учесть загруженные в ES фильмы и периодически записать прогресс в лог
+
+        Args:
+            count: Количество загруженных фильмов
+        """
+        self.done += count
+        now = monotonic()
+        if now - self._logged >= self.log_interval or self.done >= self.total:
+            self._logged = now
+            log.info(
+                'datetime: %s   %s: %d / %d, %.1f rows/s, ETA %s',
+                datetime.now(), self.label, self.done, self.total, self.rate, self.eta
+            )
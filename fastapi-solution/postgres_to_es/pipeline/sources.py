@@ -0,0 +1,352 @@
+"""Модуль с источниками данных для конвейера ETL"""
+import sys
+from collections.abc import Iterable
+from datetime import date
+from typing import Callable, List, Optional, Tuple, Type, Union
+
+from psycopg2.extras import DictRow
+
+from database.data_classes import FilmWorkElastic, GenreElastic, PersonElastic
+from database.postgres_extractor import NoMoreDataInPG, PostgresExtractor
+from pipeline.fanout import FanOut
+from pipeline.partition import partition_bounds
+from pipeline.pipeline import Batch
+from pipeline.transform import assemble_films, delete_actions, transform_genres_data, transform_persons_data
+from queries import queries
+from storage.storage import State
+
+
+def film_works_from_rows(rows: Iterable[tuple]) -> List[FilmWorkElastic]:
+    """Создать строки кинопроизведений из кортежей курсора
+
+    Args:
+        rows: Кортежи с колонками запроса query_film_works_elastic
+
+    Returns:
+        (List[FilmWorkElastic]): Строки join фильм × персона × жанр
+    """
+    # Роль и название жанра повторяются в каждой строке join: после интернирования
+    # все строки пачки ссылаются на один объект str вместо отдельной копии
+    intern = sys.intern
+    return [
+        FilmWorkElastic(
+            fw_id, title, creation_date, description, rating, type_, created, modified,
+            role and intern(role), person_id, full_name, name and intern(name), g_id
+        )
+        for (
+            fw_id, title, creation_date, description, rating, type_, created, modified,
+            role, person_id, full_name, name, g_id
+        ) in rows
+    ]
+
+
+def extract_film_works(postgres: PostgresExtractor, ids: List[str]) -> List[FilmWorkElastic]:
+    """Прочитать строки кинопроизведений для ES по списку id
+
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        ids: Идентификаторы кинопроизведений
+
+    Returns:
+        (List[FilmWorkElastic]): Строки join фильм × персона × жанр
+    """
+    return film_works_from_rows(postgres.get_tuples(queries.query_film_works_elastic, ids=tuple(ids)))
+
+
+def extract_film_documents(postgres: PostgresExtractor, ids: List[str]) -> List[DictRow]:
+    """Прочитать готовые документы кинопроизведений для ES по списку id
+
+    Документ собирается в PG через json_agg, поэтому на каждый фильм приходится одна строка.
+
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        ids: Идентификаторы кинопроизведений
+
+    Returns:
+        (List[DictRow]): Строки с документом фильма (document) и датой изменения (modified)
+    """
+    return list(postgres.get_data(queries.query_film_works_documents, ids=tuple(ids)))
+
+
+def film_batch(postgres: PostgresExtractor, ids: List[str], state: State, aggregate: bool) -> Batch:
+    """Собрать пачку кинопроизведений по списку id
+
+    Args:
+        postgres: Объект класса для загрузки данных из postgres
+        ids: Идентификаторы кинопроизведений
+        state: Состояние индекса фильмов
+        aggregate: Собирать документы в PG (json_agg) вместо сборки из строк join
+
+    Returns:
+        (Batch): Пачка строк или готовых документов
+    """
+    if aggregate:
+        return Batch('movies', [row['document'] for row in extract_film_documents(postgres, ids)], state)
+    return Batch('movies', extract_film_works(postgres, ids), state, transform=assemble_films)
+
+
+class FilmSource:
+    """Источник изменённых кинопроизведений.
+
+    Позиция чтения (modified, fw_id) хранится в памяти и сдвигается сразу после чтения пачки,
+    чтобы следующую пачку можно было читать, не дожидаясь загрузки предыдущей в ES.
+    В State позиция попадает только после успешной загрузки пачки.
+    При заданной части (partition) читаются только фильмы из её диапазона id.
+    """
+    index = 'movies'
+
+    def __init__(
+            self,
+            state: State,
+            limit_count: int,
+            aggregate: bool = False,
+            partition: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            state: Объект класса для работы с состоянием
+            limit_count: Количество кинопроизведений в одной пачке
+            aggregate: Собирать документы в PG (json_agg) вместо сборки из строк join
+            partition: Номер части и количество частей, на которые делится диапазон id фильмов
+        """
+        self.state = state
+        self.limit_count = limit_count
+        self.aggregate = aggregate
+        self.modified = state.get_state('modified') or date(1970, 7, 1)
+        self.fw_id = state.get_state('fw_id')
+        self.last_ids = []
+        self.lower, self.upper = partition_bounds(*partition) if partition else (None, None)
+        self.query = queries.query_template_film_works_id.replace(
+            '<**>', queries.film_works_partition_condition if partition else ''
+        )
+
+    def extract(self, postgres: PostgresExtractor) -> Batch:
+        """Прочитать следующую пачку кинопроизведений из PG
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+
+        Returns:
+            (Batch): Пачка строк для преобразования
+
+        Exceptions:
+            NoMoreDataInPG: Новых данных нет
+        """
+        film_works_id = postgres.get_tuples(
+            self.query.format(self.limit_count),
+            modified=self.modified,
+            fw_id=self.fw_id,
+            lower=self.lower,
+            upper=self.upper
+        )
+        rows = list(film_works_id)
+        if not rows:
+            raise NoMoreDataInPG('Отсутствуют новые данные в PG')
+
+        self.last_ids = [row[0] for row in rows]
+        batch = film_batch(postgres, self.last_ids, self.state, self.aggregate)
+        self.modified = rows[-1][1].isoformat()
+        self.fw_id = rows[-1][0]
+        batch.checkpoint = {'modified': self.modified, 'fw_id': self.fw_id}
+        return batch
+
+
+class EntitySource:
+    """Источник изменённых персон или жанров.
+
+    Записи читаются пачками по limit_count с позиции (modified, id).
+    """
+
+    def __init__(
+            self,
+            index: str,
+            state: State,
+            query: str,
+            class_name: Type[Union[GenreElastic, PersonElastic]],
+            transform: Callable[[Iterable], Iterable],
+            limit_count: int
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            index: Название индекса ES
+            state: Объект класса для работы с состоянием
+            query: Шаблон запроса к БД
+            class_name: Датакласс для вывода данных
+            transform: Функция преобразования данных в документы для ES
+            limit_count: Количество записей в одной пачке
+        """
+        self.index = index
+        self.state = state
+        self.query = query
+        self.limit_count = limit_count
+        self.class_name = class_name
+        self.transform = transform
+        self.modified = state.get_state('modified') or date(1970, 7, 1)
+        self.id = state.get_state('id')
+
+    def extract(self, postgres: PostgresExtractor) -> Batch:
+        """Прочитать изменённые записи из PG
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+
+        Returns:
+            (Batch): Пачка строк для преобразования
+
+        Exceptions:
+            NoMoreDataInPG: Новых данных нет
+        """
+        rows = list(postgres.get_tuples(self.query.format(self.limit_count), modified=self.modified, id=self.id))
+        if not rows:
+            raise NoMoreDataInPG('Отсутствуют новые данные в PG')
+
+        objects = [self.class_name(*obj) for obj in rows]
+        self.modified = objects[-1].modified.isoformat()
+        self.id = rows[-1][0]
+
+        return Batch(
+            index=self.index,
+            data=objects,
+            state=self.state,
+            checkpoint={'modified': self.modified, 'id': self.id},
+            transform=self.transform
+        )
+
+
+class OutboxSource:
+    """Источник изменений из журнала content.etl_outbox, который заполняют триггеры.
+
+    Читаются только id изменённых записей. Документы изменённых фильмов собираются заново,
+    а изменения персон и жанров применяются к связанным фильмам частичными обновлениями.
+    Записи из журнала, которых уже нет в PG, удалены: их документы удаляются из ES,
+    а удалённые персоны и жанры убираются из фильмов.
+    """
+
+    def __init__(
+            self,
+            state: State,
+            film_state: State,
+            persons_state: State,
+            genres_state: State,
+            fan_out: FanOut,
+            limit_count: int,
+            aggregate: bool = False
+    ) -> None:
+        """Конструктор класса.
+
+        Args:
+            state: Объект класса для хранения позиции в журнале изменений
+            film_state: Состояние индекса фильмов
+            persons_state: Состояние индекса персон
+            genres_state: Состояние индекса жанров
+            fan_out: Объект для частичного обновления фильмов по изменениям персон и жанров
+            limit_count: Количество записей журнала и фильмов в одной пачке
+            aggregate: Собирать документы в PG (json_agg) вместо сборки из строк join
+        """
+        self.state = state
+        self.film_state = film_state
+        self.persons_state = persons_state
+        self.genres_state = genres_state
+        self.fan_out = fan_out
+        self.limit_count = limit_count
+        self.aggregate = aggregate
+        self.outbox_id = state.get_state('outbox_id') or 0
+        # Позиция в журнале — пара (txid, id): порядок id не совпадает с порядком фиксации
+        self.outbox_txid = state.get_state('outbox_txid') or '0'
+
+    def extract(self, postgres: PostgresExtractor) -> List[Batch]:
+        """Прочитать следующую порцию журнала изменений и собрать пачки для ES
+
+        Конвейер загружает пачки по порядку, поэтому позиция в журнале
+        фиксируется только после загрузки в ES всех пачек порции.
+        Читаются только записи завершённых транзакций (старше xmin снимка),
+        поэтому запись, зафиксированная позже, не окажется позади сохранённой позиции.
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+
+        Returns:
+            (List[Batch]): Пачки строк для преобразования
+
+        Exceptions:
+            NoMoreDataInPG: Журнал изменений пуст
+        """
+        changes = list(postgres.get_data(
+            queries.query_outbox.format(self.limit_count), txid=self.outbox_txid, outbox_id=self.outbox_id
+        ))
+        if not changes:
+            raise NoMoreDataInPG('Отсутствуют новые данные в PG')
+
+        ids = {'film_work': set(), 'person': set(), 'genre': set()}
+        for change in changes:
+            ids[change['entity']].add(change['entity_id'])
+
+        batches = []
+        film_ids = sorted(ids['film_work'])
+        deleted_films = []
+        for start in range(0, len(film_ids), self.limit_count):
+            chunk = film_ids[start:start + self.limit_count]
+            batch = film_batch(postgres, chunk, self.film_state, self.aggregate)
+            # Фильмы, которых уже нет в PG, удалены: их документы удаляются из ES
+            if batch.transform:
+                found = {row.fw_id for row in batch.data}
+            else:
+                found = {document['id'] for document in batch.data}
+            deleted_films.extend(film_id for film_id in chunk if film_id not in found)
+            if batch.data:
+                batches.append(batch)
+        if deleted_films:
+            batches.append(Batch('movies', delete_actions(deleted_films, 'movies'), self.film_state))
+
+        persons, genres, removed = [], [], []
+        if ids['person']:
+            persons = [
+                PersonElastic(*obj)
+                for obj in postgres.get_tuples(queries.query_persons_by_id, ids=tuple(ids['person']))
+            ]
+            if persons:
+                batches.append(Batch('persons', persons, self.persons_state, transform=transform_persons_data))
+            deleted = sorted(ids['person'] - {person.person_id for person in persons})
+            if deleted:
+                batches.append(Batch('persons', delete_actions(deleted, 'persons'), self.persons_state))
+                removed.extend(deleted)
+        if ids['genre']:
+            genres = [
+                GenreElastic(*obj)
+                for obj in postgres.get_tuples(queries.query_genres_by_id, ids=tuple(ids['genre']))
+            ]
+            if genres:
+                batches.append(Batch('genres', genres, self.genres_state, transform=transform_genres_data))
+            deleted = sorted(ids['genre'] - {genre.genre_id for genre in genres})
+            if deleted:
+                batches.append(Batch('genres', delete_actions(deleted, 'genres'), self.genres_state))
+                removed.extend(deleted)
+        if persons or genres or removed:
+            batches.extend(self.fan_out.extract(
+                postgres,
+                persons=persons,
+                genres=genres,
+                exclude=film_ids,
+                removed=removed
+            ))
+
+        # Пустая пачка в конце фиксирует позицию в журнале после загрузки всех предыдущих
+        self.outbox_txid, self.outbox_id = changes[-1]['txid'], changes[-1]['id']
+        batches.append(Batch(
+            'outbox', [], self.state, checkpoint={'outbox_txid': self.outbox_txid, 'outbox_id': self.outbox_id}
+        ))
+        return batches
+
+    def cleanup(self, postgres: PostgresExtractor) -> None:
+        """Удалить из журнала записи, уже загруженные в ES
+
+        Args:
+            postgres: Объект класса для загрузки данных из postgres
+        """
+        committed = self.state.get_state('outbox_txid')
+        if committed:
+            postgres.execute(
+                queries.query_outbox_cleanup, txid=committed, outbox_id=self.state.get_state('outbox_id')
+            )
@@ -0,0 +1,117 @@
+"""Модуль с преобразованием данных из PG в документы для Elastic"""
+from collections.abc import Iterable, Iterator
+from typing import Any, Dict, List
+
+from database.data_classes import FilmWorkElastic, GenreElastic, PersonElastic
+
+
+# Роль персоны -> поля документа со списком персон и списком их имён
+ROLE_FIELDS = {
+    'director': ('directors', 'directors_names'),
+    'actor': ('actors', 'actors_names'),
+    'writer': ('writers', 'writers_names'),
+}
+
+
+def assemble_films(movies_pg: Iterable[FilmWorkElastic]) -> Iterator[Dict[str, Any]]:
+    """Метод для сборки документов фильмов для Elastic из строк join фильм × персона × жанр
+
+    Строки одного фильма идут подряд (запрос упорядочен по fw.modified, fw.id), поэтому документ
+    отдаётся сразу, как только начинаются строки следующего фильма. Повторы персон и жанров
+    отсекаются по множествам id, а не поиском по спискам.
+
+    Args:
+        movies_pg: Строки фильмов из PG
+
+    Yields:
+        (Dict[str, Any]): Документ фильма для Elastic
+    """
+    movie_es = None
+    fw_id = None
+    seen = set()
+
+    for movie in movies_pg:
+        if movie.fw_id != fw_id:
+            if movie_es is not None:
+                yield movie_es
+
+            fw_id = movie.fw_id
+            seen = set()
+            movie_es = {
+                "id": fw_id,
+                "imdb_rating": movie.rating,
+                "genre": [],
+                "genres": [],
+                "creation_date": movie.creation_date,
+                "title": movie.title,
+                "description": movie.description,
+                "directors_names": [],
+                "actors_names": [],
+                "writers_names": [],
+                "directors": [],
+                "actors": [],
+                "writers": []
+            }
+
+        # Жанры отмечаются по id, персоны — по паре (роль, id):
+        # одна персона может быть в фильме и актёром, и режиссёром
+        g_id = movie.g_id
+        if g_id not in seen and g_id is not None:
+            seen.add(g_id)
+            movie_es['genre'].append(movie.name)
+            movie_es['genres'].append({"id": g_id, "name": movie.name})
+
+        fields = ROLE_FIELDS.get(movie.role)
+        if fields is not None:
+            key = (movie.role, movie.id)
+            if key not in seen:
+                seen.add(key)
+                persons_field, names_field = fields
+                movie_es[persons_field].append({"id": movie.id, "name": movie.full_name})
+                movie_es[names_field].append(movie.full_name)
+
+    if movie_es is not None:
+        yield movie_es
+
+
+def transform_persons_data(persons_pg: Iterator[PersonElastic]) -> Iterator:
+    """Метод для преобразования данных по персонам в формат для Elastic
+
+    Args:
+        persons_pg: Персоны из PG
+
+    Yields:
+        (Iterator): Список персон для Elastic
+    """
+    persons_es = [{"id": person.person_id, "full_name": person.full_name} for person in persons_pg]
+
+    yield from persons_es
+
+
+def transform_genres_data(genres_pg: Iterator[GenreElastic]) -> Iterator:
+    """Метод для преобразования данных по жанрам в формат для Elastic
+
+    Args:
+        genres_pg: Жанры из PG
+
+    Yields:
+        (Iterator): Список жанров для Elastic
+    """
+    genres_es = [{"id": genre.genre_id, "name": genre.name, "description": genre.description} for genre in genres_pg]
+
+    yield from genres_es
+
+
+def delete_actions(ids: Iterable[str], index_name: str) -> List[Dict[str, Any]]:
+    """Метод для сборки bulk-действий delete по id удалённых записей
+
+    Удаление идемпотентно: отсутствующий в ES документ не считается ошибкой загрузки.
+
+    Args:
+        ids: Идентификаторы удалённых записей
+        index_name: Название индекса
+
+    Returns:
+        (List[Dict[str, Any]]): Действия bulk API
+    """
+    return [{'_op_type': 'delete', '_index': index_name, '_id': _id} for _id in ids]
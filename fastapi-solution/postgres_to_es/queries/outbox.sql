@@ -0,0 +1,68 @@
+-- Журнал изменений (outbox) для ETL в режиме CHANGE_CAPTURE=outbox.
+-- Триггеры записывают id изменённых записей в content.etl_outbox и будят ETL через NOTIFY.
+-- Скрипт идемпотентен и выполняется один раз командой `python main.py install-outbox`
+-- от имени владельца таблиц: пересоздание триггеров берёт ACCESS EXCLUSIVE блокировки.
+--
+-- id назначается при вставке, а видна запись становится при фиксации транзакции, поэтому
+-- записи с меньшим id могут появиться после уже прочитанных. ETL читает журнал по (txid, id)
+-- и только записи транзакций старше xmin текущего снимка: все они уже завершены,
+-- и записей с меньшим (txid, id) больше не появится.
+
+create table if not exists content.etl_outbox (
+    id bigserial primary key,
+    entity text not null,
+    entity_id uuid not null,
+    operation text not null,
+    created timestamp with time zone not null default now()
+);
+
+alter table content.etl_outbox
+    add column if not exists txid xid8 not null default pg_current_xact_id();
+
+create index if not exists etl_outbox_txid_id on content.etl_outbox (txid, id);
+
+create or replace function content.etl_outbox_capture() returns trigger as $$
+begin
+    if TG_TABLE_NAME in ('person_film_work', 'genre_film_work') then
+        -- Изменение связи меняет документ фильма
+        if TG_OP in ('UPDATE', 'DELETE') then
+            insert into content.etl_outbox (entity, entity_id, operation)
+            values ('film_work', OLD.film_work_id, 'UPDATE');
+        end if;
+        if TG_OP in ('INSERT', 'UPDATE') then
+            insert into content.etl_outbox (entity, entity_id, operation)
+            values ('film_work', NEW.film_work_id, 'UPDATE');
+        end if;
+    elsif TG_OP = 'DELETE' then
+        insert into content.etl_outbox (entity, entity_id, operation)
+        values (TG_TABLE_NAME, OLD.id, TG_OP);
+    else
+        insert into content.etl_outbox (entity, entity_id, operation)
+        values (TG_TABLE_NAME, NEW.id, TG_OP);
+    end if;
+
+    -- Одинаковые уведомления в рамках транзакции схлопываются в одно
+    perform pg_notify('etl_outbox', '');
+    return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists etl_outbox_capture on content.film_work;
+create trigger etl_outbox_capture after insert or update or delete on content.film_work
+    for each row execute function content.etl_outbox_capture();
+
+drop trigger if exists etl_outbox_capture on content.person;
+create trigger etl_outbox_capture after insert or update or delete on content.person
+    for each row execute function content.etl_outbox_capture();
+
+drop trigger if exists etl_outbox_capture on content.genre;
+create trigger etl_outbox_capture after insert or update or delete on content.genre
+    for each row execute function content.etl_outbox_capture();
+
+drop trigger if exists etl_outbox_capture on content.person_film_work;
+create trigger etl_outbox_capture after insert or update or delete on content.person_film_work
+    for each row execute function content.etl_outbox_capture();
+
+drop trigger if exists etl_outbox_capture on content.genre_film_work;
+create trigger etl_outbox_capture after insert or update or delete on content.genre_film_work
+    for each row execute function content.etl_outbox_capture();
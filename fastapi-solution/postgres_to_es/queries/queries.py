@@ -1,26 +1,8 @@
 query_template_film_works_id = \
-    '''select un.id
-         from(
-       select fw.id, fw.modified
+    '''select fw.id, fw.modified
          from content.film_work fw
-        inner join content.person_film_work pfw
-           on pfw.film_work_id = fw.id
-        inner join content.person as p
-           on p.id = pfw.person_id
-        where p.modified > %(modified)s or (p.modified = %(modified)s <**>)
-       union
-       select fw.id, fw.modified
-         from content.film_work fw
-        inner join content.genre_film_work jfw
-           on jfw.film_work_id = fw.id
-        inner join content.genre as j
-           on j.id = jfw.genre_id
-        where j.modified > %(modified)s or (j.modified = %(modified)s <**>)
-       union
-       select fw.id, fw.modified
-         from content.film_work fw
-        where fw.modified > %(modified)s or (fw.modified = %(modified)s <**>)) as un
-        order by un.modified, un.id
+        where (fw.modified > %(modified)s or (fw.modified = %(modified)s and fw.id > %(fw_id)s)) <**>
+        order by fw.modified, fw.id
         limit {0};'''
 
 
@@ -52,12 +34,123 @@ query_film_works_elastic = \
         order by fw.modified, fw.id;'''
 
 query_persons = '''
-       select distinct id as person_id, full_name, modified
+       select id as person_id, full_name, modified
          from content.person
-        where modified > %(modified)s
+        where modified > %(modified)s or (modified = %(modified)s and id > %(id)s)
+        order by modified, id
+        limit {0}
 '''
 query_genres = '''
-       select distinct id as genre_id, name, description, modified
+       select id as genre_id, name, description, modified
          from content.genre
-        where modified > %(modified)s
-'''
\ No newline at end of file
+        where modified > %(modified)s or (modified = %(modified)s and id > %(id)s)
+        order by modified, id
+        limit {0}
+'''
+query_outbox = '''
+       select id, entity, entity_id, operation, txid::text as txid
+         from content.etl_outbox
+        where txid < pg_snapshot_xmin(pg_current_snapshot())
+          and (txid, id) > (%(txid)s::xid8, %(outbox_id)s)
+        order by txid, id
+        limit {0}
+'''
+query_outbox_cleanup = '''
+       delete from content.etl_outbox
+        where (txid, id) <= (%(txid)s::xid8, %(outbox_id)s)
+'''
+query_outbox_installed = '''
+       select exists(
+              select 1
+                from information_schema.columns
+               where table_schema = 'content' and table_name = 'etl_outbox' and column_name = 'txid'
+       )
+'''
+film_works_cursor_condition = \
+    'and (fw.modified < %(modified)s or (fw.modified = %(modified)s and fw.id <= %(fw_id)s))'
+query_person_film_works_links = '''
+       select pfw.film_work_id, pfw.person_id, pfw.role
+         from content.person_film_work pfw
+        inner join content.film_work fw
+           on fw.id = pfw.film_work_id
+        where pfw.person_id in %(ids)s <**>
+'''
+query_genre_film_works_links = '''
+       select gfw.film_work_id, gfw.genre_id
+         from content.genre_film_work gfw
+        inner join content.film_work fw
+           on fw.id = gfw.film_work_id
+        where gfw.genre_id in %(ids)s <**>
+'''
+query_persons_by_id = '''
+       select id as person_id, full_name, modified
+         from content.person
+        where id in %(ids)s
+'''
+query_genres_by_id = '''
+       select id as genre_id, name, description, modified
+         from content.genre
+        where id in %(ids)s
+'''
+query_film_works_documents = '''
+       select json_build_object(
+                  'id', fw.id,
+                  'imdb_rating', fw.rating,
+                  'genre', coalesce(g.names, '[]'::json),
+                  'genres', coalesce(g.genres, '[]'::json),
+                  'creation_date', fw.creation_date,
+                  'title', fw.title,
+                  'description', fw.description,
+                  'directors_names', coalesce(p.directors_names, '[]'::json),
+                  'actors_names', coalesce(p.actors_names, '[]'::json),
+                  'writers_names', coalesce(p.writers_names, '[]'::json),
+                  'directors', coalesce(p.directors, '[]'::json),
+                  'actors', coalesce(p.actors, '[]'::json),
+                  'writers', coalesce(p.writers, '[]'::json)
+              ) as document
+            , fw.modified
+         from content.film_work fw
+         left join lateral (
+              select json_agg(p.full_name order by p.full_name) filter (where pfw.role = 'director') as directors_names
+                   , json_agg(p.full_name order by p.full_name) filter (where pfw.role = 'actor') as actors_names
+                   , json_agg(p.full_name order by p.full_name) filter (where pfw.role = 'writer') as writers_names
+                   , json_agg(json_build_object('id', p.id, 'name', p.full_name) order by p.full_name)
+                         filter (where pfw.role = 'director') as directors
+                   , json_agg(json_build_object('id', p.id, 'name', p.full_name) order by p.full_name)
+                         filter (where pfw.role = 'actor') as actors
+                   , json_agg(json_build_object('id', p.id, 'name', p.full_name) order by p.full_name)
+                         filter (where pfw.role = 'writer') as writers
+                from content.person_film_work pfw
+               inner join content.person p
+                  on p.id = pfw.person_id
+               where pfw.film_work_id = fw.id
+         ) p on true
+         left join lateral (
+              select json_agg(g.name order by g.name) as names
+                   , json_agg(json_build_object('id', g.id, 'name', g.name) order by g.name) as genres
+                from content.genre_film_work gfw
+               inner join content.genre g
+                  on g.id = gfw.genre_id
+               where gfw.film_work_id = fw.id
+         ) g on true
+        where fw.id in %(ids)s
+        order by fw.modified, fw.id
+'''
+query_film_works_count = '''
+       select count(*)
+         from content.film_work fw
+        where (fw.modified > %(modified)s or (fw.modified = %(modified)s and fw.id > %(fw_id)s)) <**>
+'''
+film_works_partition_condition = 'and fw.id between %(lower)s and %(upper)s'
+query_ids_after = '''
+       select id
+         from content.{table}
+        where %(after)s::uuid is null or id > %(after)s
+        order by id
+        limit {limit}
+'''
+query_existing_ids = '''
+       select id
+         from content.{table}
+        where id in %(ids)s
+'''
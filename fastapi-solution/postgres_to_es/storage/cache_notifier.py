@@ -0,0 +1,57 @@
+"""Модуль с уведомлениями кеша API об изменениях индексов ES"""
+import json
+from datetime import datetime
+from typing import Iterable, Optional
+
+import redis
+
+from log.logger import log
+
+# Ключ Redis с поколением индекса; API включает поколение в ключи кеша списков и поиска
+GENERATION_KEY = 'generation:{0}'
+# Канал Redis pub/sub, в который публикуются изменения индексов
+CHANGES_CHANNEL = 'cache:changes'
+
+
+class CacheNotifier:
+    """Уведомления кеша API в Redis об изменениях индексов.
+
+    После каждой загрузки, изменившей индекс, увеличивается поколение индекса:
+    ключи кеша API с прежним поколением больше не читаются и истекают по TTL.
+    Поколение и id изменённых документов публикуются в канал: API удаляет из кеша
+    документы по этим id и заново прогревает популярные списки.
+    Ошибки Redis только записываются в лог: ES остаётся источником данных,
+    а без уведомления кеш API устаревает лишь на время жизни записей.
+    """
+
+    def __init__(self, host: str, port: int = 6379, channel: str = CHANGES_CHANNEL) -> None:
+        """Конструктор класса.
+
+        Args:
+            host: Хост Redis
+            port: Порт Redis
+            channel: Канал Redis pub/sub для изменений индексов
+        """
+        self.channel = channel
+        self._redis = redis.Redis(host=host, port=port, socket_timeout=5, socket_connect_timeout=5)
+
+    def bump_generation(self, index_name: str, ids: Optional[Iterable[str]] = None) -> None:
+        """Увеличить поколение индекса и опубликовать изменение
+
+        Args:
+            index_name: Название индекса или псевдонима, под которым его читает API
+            ids: id изменённых и удалённых документов; None — изменился весь индекс
+        """
+        try:
+            generation = self._redis.incr(GENERATION_KEY.format(index_name))
+            self._redis.publish(self.channel, json.dumps({
+                'index': index_name,
+                'generation': generation,
+                'ids': list(ids) if ids is not None else None
+            }))
+        except redis.RedisError as e:
+            log.warning('datetime: %s   Поколение %s не обновлено в Redis: %s', datetime.now(), index_name, e)
+
+    def close(self) -> None:
+        """Закрыть соединения с Redis"""
+        self._redis.close()
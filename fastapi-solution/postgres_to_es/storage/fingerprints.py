@@ -0,0 +1,125 @@
+"""Модуль с отпечатками документов, загруженных в ES"""
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Ограничение SQLite на число параметров запроса в старых версиях — 999
+_MAX_PARAMETERS = 900
+
+
+def fingerprint(document: Dict[str, Any]) -> bytes:
+    """Отпечаток документа: хеш его JSON с отсортированными ключами
+
+    Args:
+        document: _source документа
+
+    Returns:
+        (bytes): 16 байт blake2b
+    """
+    payload = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+
+class FingerprintCache:
+    """Отпечатки последних загруженных в ES версий документов по (индекс, id) в файле SQLite.
+
+    Файл общий для потоков и процессов ETL; запись защищена блокировкой файла SQLite (WAL),
+    а внутри процесса — threading.Lock, так как соединение общее для потоков.
+    """
+
+    def __init__(self, db_path: str = 'storage/fingerprints.db') -> None:
+        """Конструктор класса.
+
+        Args:
+            db_path: Путь к файлу базы SQLite
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute('pragma journal_mode=wal')
+        # Потеря последних отпечатков при сбое означает лишь повторную отправку документов
+        self._connection.execute('pragma synchronous=normal')
+        self._connection.execute(
+            'create table if not exists fingerprints '
+            '(index_name text, id text, hash blob, primary key (index_name, id)) without rowid'
+        )
+
+    def get_many(self, index_name: str, ids: List[str]) -> Dict[str, bytes]:
+        """Отпечатки документов индекса по списку id
+
+        Args:
+            index_name: Название индекса
+            ids: Идентификаторы документов
+
+        Returns:
+            (Dict[str, bytes]): Отпечатки найденных документов по id
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMETERS):
+                chunk = ids[start:start + _MAX_PARAMETERS]
+                rows = self._connection.execute(
+                    'select id, hash from fingerprints where index_name = ? and id in ({0})'.format(
+                        ','.join('?' * len(chunk))
+                    ),
+                    (index_name, *chunk)
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, index_name: str, hashes: Iterable[Tuple[str, bytes]]) -> None:
+        """Сохранить отпечатки загруженных документов
+
+        Args:
+            index_name: Название индекса
+            hashes: Пары (id, отпечаток)
+        """
+        with self._lock, self._connection:
+            self._connection.execute('begin immediate')
+            self._connection.executemany(
+                'insert or replace into fingerprints (index_name, id, hash) values (?, ?, ?)',
+                [(index_name, _id, digest) for _id, digest in hashes]
+            )
+
+    def delete_many(self, index_name: str, ids: Iterable[str]) -> None:
+        """Удалить отпечатки удалённых или частично обновлённых документов
+
+        Args:
+            index_name: Название индекса
+            ids: Идентификаторы документов
+        """
+        with self._lock, self._connection:
+            self._connection.execute('begin immediate')
+            self._connection.executemany(
+                'delete from fingerprints where index_name = ? and id = ?',
+                [(index_name, _id) for _id in ids]
+            )
+
+    def clear(self, index_name: str) -> None:
+        """Удалить все отпечатки индекса (индекс создан заново)
+
+        Args:
+            index_name: Название индекса
+        """
+        with self._lock, self._connection:
+            self._connection.execute('delete from fingerprints where index_name = ?', (index_name,))
+
+    def move(self, source: str, target: str) -> None:
+        """Перенести отпечатки индекса source на target, заменив отпечатки target
+
+        Args:
+            source: Название индекса, в который загружались документы
+            target: Название псевдонима, который теперь указывает на source
+        """
+        with self._lock, self._connection:
+            self._connection.execute('begin immediate')
+            self._connection.execute('delete from fingerprints where index_name = ?', (target,))
+            self._connection.execute(
+                'update fingerprints set index_name = ? where index_name = ?', (target, source)
+            )
+
+    def close(self) -> None:
+        """Закрыть соединение с базой"""
+        self._connection.close()
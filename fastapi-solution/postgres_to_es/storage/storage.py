@@ -2,8 +2,14 @@
 import abc
 import json
 import os
+import sqlite3
+import threading
 from json import JSONDecodeError
-from typing import Any, Optional
+from typing import Any, Dict, Optional
+
+
+class CorruptedState(Exception):
+    """Сохранённое состояние не удаётся прочитать"""
 
 
 class BaseStorage:
@@ -23,40 +29,123 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: dict) -> None:
-        """Сохранить состояние в постоянное хранилище"""
-        with open(self.file_path, "w") as write_file:
+        """Сохранить состояние в постоянное хранилище
+
+        Состояние пишется во временный файл, который после fsync атомарно заменяет прежний,
+        поэтому при сбое посреди записи на диске остаётся предыдущее целое состояние.
+        """
+        tmp_path = '{0}.tmp'.format(self.file_path)
+        with open(tmp_path, "w") as write_file:
             json.dump(state, write_file)
+            write_file.flush()
+            os.fsync(write_file.fileno())
+        os.replace(tmp_path, self.file_path)
+
+        # Переименование сохраняется на диске вместе с записью каталога
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.file_path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def retrieve_state(self) -> dict:
+        """Загрузить состояние локально из постоянного хранилища
+
+        Exceptions:
+            CorruptedState: Файл состояния повреждён
+        """
+        if not os.path.exists(self.file_path):
+            return {}
+
+        with open(self.file_path, "r") as read_file:
+            try:
+                return json.load(read_file)
+            except JSONDecodeError as e:
+                # Пустое состояние означало бы перечитывание всех данных с начала
+                raise CorruptedState('Файл состояния {0} повреждён: {1}'.format(self.file_path, e))
+
+
+class SqliteStorage(BaseStorage):
+    """Хранение состояния в SQLite: каждое состояние — набор ключей в своём пространстве имён.
+
+    Состояние создаётся в основном потоке, а сохраняется из потока загрузки конвейера,
+    поэтому соединение общее для потоков и защищено threading.Lock.
+    """
+
+    def __init__(self, namespace: str, db_path: str = 'storage/state.db'):
+        """Конструктор класса.
+
+        Args:
+            namespace: Имя состояния, например FileStorage или PersonsStorage
+            db_path: Путь к файлу базы SQLite
+        """
+        self.namespace = namespace
+        self.db_path = db_path
+        # Соединение открыто с check_same_thread=False и общее для потоков процесса: запросы выполняются по очереди
+        self._lock = threading.Lock()
+        # Из файла читают и пишут несколько процессов (параллельная переиндексация): timeout — ожидание блокировки файла
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute('pragma journal_mode=wal')
+        self._connection.execute('pragma synchronous=full')
+        self._connection.execute(
+            'create table if not exists state (namespace text, key text, value text, primary key (namespace, key))'
+        )
+
+    def save_state(self, state: dict) -> None:
+        """Сохранить состояние в постоянное хранилище одной транзакцией"""
+        with self._lock, self._connection:
+            self._connection.execute('begin immediate')
+            self._connection.execute('delete from state where namespace = ?', (self.namespace,))
+            self._connection.executemany(
+                'insert into state (namespace, key, value) values (?, ?, ?)',
+                [(self.namespace, key, json.dumps(value)) for key, value in state.items()]
+            )
 
     def retrieve_state(self) -> dict:
         """Загрузить состояние локально из постоянного хранилища"""
-        if os.path.exists(self.file_path):
-            with open(self.file_path, "r") as read_file:
-                try:
-                    state = json.load(read_file)
-                except JSONDecodeError:
-                    state = {}
-        else:
-            state = {}
+        with self._lock:
+            rows = self._connection.execute(
+                'select key, value from state where namespace = ?', (self.namespace,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
 
-        return state
+    def close(self) -> None:
+        """Закрыть соединение с базой"""
+        with self._lock:
+            self._connection.close()
 
 
 class State:
     """
     Класс для хранения состояния при работе с данными, чтобы постоянно не перечитывать данные с начала.
-    Здесь представлена реализация с сохранением состояния в файл.
-    В целом ничего не мешает поменять это поведение на работу с БД или распределённым хранилищем.
+    Состояние читается из хранилища один раз и дальше хранится в памяти;
+    каждое изменение сразу записывается в хранилище (write-through).
     """
 
     def __init__(self, storage: BaseStorage):
         self.storage = storage
+        self._state: Optional[Dict[str, Any]] = None
+
+    @property
+    def _data(self) -> Dict[str, Any]:
+        if self._state is None:
+            self._state = self.storage.retrieve_state()
+        return self._state
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа"""
-        data = self.storage.retrieve_state()
-        data[key] = value
+        self.set_states({key: value})
+
+    def set_states(self, values: Dict[str, Any]) -> None:
+        """Установить состояние для нескольких ключей одной записью в хранилище
+
+        Ключи, которые должны меняться вместе (например modified и fw_id),
+        сохраняются все или ни один.
+        """
+        data = {**self._data, **values}
         self.storage.save_state(data)
+        self._state = data
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
-        return self.storage.retrieve_state().get(key, None)
+        return self._data.get(key, None)
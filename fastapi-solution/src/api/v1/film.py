@@ -1,7 +1,7 @@
 from http import HTTPStatus
 from typing import Optional
 
-from api.v1.utils import FilmQueryParams
+from api.v1.utils import FilmQueryParams, cursor_query
 from fastapi import APIRouter, Depends, HTTPException
 from models.film import DetailResponseFilm, ESFilm, FilmPagination
 from models.genre import FilmGenre
@@ -24,6 +24,7 @@ async def search_film_list(
     film_service: FilmService = Depends(get_film_service),
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = cursor_query(),
 ) -> FilmPagination:
     films: Optional[dict] = await film_service.get_all_films(
         sorting=params.sort,
@@ -31,6 +32,7 @@ async def search_film_list(
         page_size=page_size,
         query=params.query,
         genre=params.genre_filter,
+        cursor=cursor,
     )
     if not films:
         """Если жанры не найдены, отдаём 404 статус"""
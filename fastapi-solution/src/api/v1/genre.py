@@ -1,6 +1,7 @@
 from http import HTTPStatus
 from typing import Optional
 
+from api.v1.utils import cursor_query
 from fastapi import APIRouter, Depends, HTTPException
 from models.genre import DetailResponseGenre, ElasticGenre, GenrePagination
 from services.genre import GenreService, get_genre_service
@@ -20,9 +21,10 @@ async def genres_list(
     genre_service: GenreService = Depends(get_genre_service),
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = cursor_query(),
 ) -> GenrePagination:
     genres: Optional[dict] = await genre_service.get_genres_list(
-        page=page, page_size=page_size
+        page=page, page_size=page_size, cursor=cursor
     )
     if not genres:
         """Если жанры не найдены, отдаём 404 статус"""
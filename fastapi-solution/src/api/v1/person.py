@@ -1,7 +1,7 @@
 from http import HTTPStatus
 from typing import Optional
 
-from api.v1.utils import PersonSearchParam
+from api.v1.utils import PersonSearchParam, cursor_query
 from fastapi import APIRouter, Depends, HTTPException
 from models.film import FilmPagination
 from models.person import ElasticPerson, PersonPagination
@@ -69,9 +69,10 @@ async def all_person_films(
     person_service: PersonService = Depends(get_person_service),
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = cursor_query(),
 ) -> FilmPagination:
     person_films = await person_service.get_person_films(
-        person_id=person_id, page=page, page_size=page_size
+        person_id=person_id, page=page, page_size=page_size, cursor=cursor
     )
     if not person_films:
         """Если персона не найдена, отдаём 404 статус"""
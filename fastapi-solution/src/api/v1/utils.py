@@ -35,6 +35,15 @@ class FilmQueryParams:
         self.query = query
 
 
+def cursor_query() -> Optional[str]:
+    return Query(
+        None,
+        title="Курсор",
+        description="Курсор следующей страницы из next_cursor предыдущего ответа;"
+        " в отличие от page, стоимость запроса не зависит от глубины страницы",
+    )
+
+
 class PersonSearchParam:
     """
     Класс задает параметры для поиска персоны по имени
@@ -27,5 +27,38 @@ ELASTIC_PORT = int(os.getenv("ELASTIC_PORT", 9200))
 
 CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 
+# Время жизни кеша в Redis по индексам ES: жанры меняются редко
+CACHE_TTL = {
+    "movies": CACHE_EXPIRE_IN_SECONDS,
+    "persons": CACHE_EXPIRE_IN_SECONDS,
+    "genres": 60 * 60,
+}
+# Время жизни кеша в памяти процесса: короче, чем в Redis,
+# так как инвалидация между воркерами через pub/sub не гарантирует доставку
+LOCAL_CACHE_TTL = {
+    "movies": int(os.getenv("LOCAL_CACHE_TTL", 60)),
+    "persons": int(os.getenv("LOCAL_CACHE_TTL", 60)),
+    "genres": 60 * 10,
+}
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 10000))
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+# Сколько секунд устаревшее значение ещё отдаётся, пока обновляется в фоне
+CACHE_STALE_IN_SECONDS = int(os.getenv("CACHE_STALE_IN_SECONDS", 60))
+# Множитель раннего вероятностного обновления (XFetch): 0 — отключить
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", 1.0))
+# Схлопывать промахи между воркерами блокировкой в Redis, а не только внутри воркера
+CACHE_REDIS_LOCK = os.getenv("CACHE_REDIS_LOCK", "False").lower() in ("true", "1")
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 5))
+# Как долго поколение индекса из Redis (generation:<индекс>, его увеличивает ETL) берётся из памяти
+CACHE_GENERATION_TTL = float(os.getenv("CACHE_GENERATION_TTL", 1))
+# Канал, в который ETL публикует новые поколения индексов и id изменённых документов
+CACHE_CHANGES_CHANNEL = "cache:changes"
+# Сколько самых частых запросов списков прогревать после загрузки ETL: 0 — не прогревать
+CACHE_WARM_SIZE = int(os.getenv("CACHE_WARM_SIZE", 20))
+CACHE_WARM_DELAY = float(os.getenv("CACHE_WARM_DELAY", 1))
+
+# Сколько живёт снимок индекса (point in time) между переходами по курсору
+CURSOR_KEEP_ALIVE = os.getenv("CURSOR_KEEP_ALIVE", "1m")
+
 # Корень проекта
 BASE_DIR = Path(__file__).resolve().parent.parent
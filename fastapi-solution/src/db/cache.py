@@ -0,0 +1,10 @@
+from typing import Optional
+
+from services.cache import TwoTierCache
+
+cache: Optional[TwoTierCache] = None
+
+
+# Функция понадобится при внедрении зависимостей
+async def get_cache() -> TwoTierCache:
+    return cache
@@ -1,11 +1,14 @@
+import asyncio
+
 import aioredis
 import uvicorn
 from api.v1 import film, genre, person
 from core import config
-from db import elastic, redis
+from db import cache, elastic, redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
+from services.cache import TwoTierCache
 
 app = FastAPI(
     title=config.PROJECT_NAME,  # Конфигурируем название проекта
@@ -25,6 +28,12 @@ async def root():
     return {"service": config.PROJECT_NAME, "version": config.VERSION}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Попадания и промахи кеша по уровням в этом воркере"""
+    return cache.cache.stats()
+
+
 @app.on_event("startup")
 async def startup():
     """Подключаемся к базам при старте сервера"""
@@ -34,11 +43,31 @@ async def startup():
     elastic.es = AsyncElasticsearch(
         hosts=[f"{config.ELASTIC_HOST}:{config.ELASTIC_PORT}"]
     )
+    cache.cache = TwoTierCache(
+        redis=redis.redis,
+        ttl=config.CACHE_TTL,
+        local_ttl=config.LOCAL_CACHE_TTL,
+        local_size=config.LOCAL_CACHE_SIZE,
+        channel=config.CACHE_INVALIDATION_CHANNEL,
+        stale=config.CACHE_STALE_IN_SECONDS,
+        beta=config.CACHE_XFETCH_BETA,
+        redis_lock=config.CACHE_REDIS_LOCK,
+        lock_timeout=config.CACHE_LOCK_TIMEOUT,
+        generation_ttl=config.CACHE_GENERATION_TTL,
+        changes_channel=config.CACHE_CHANGES_CHANNEL,
+        warm_size=config.CACHE_WARM_SIZE,
+        warm_delay=config.CACHE_WARM_DELAY,
+    )
+    """Слушаем инвалидации кеша от других воркеров и изменения индексов от ETL"""
+    app.state.cache_listener = asyncio.create_task(
+        cache.cache.listen((config.REDIS_HOST, config.REDIS_PORT))
+    )
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """Отключаемся от баз при выключении сервера"""
+    app.state.cache_listener.cancel()
     await redis.redis.close()
     await elastic.es.close()
 
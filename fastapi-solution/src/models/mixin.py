@@ -38,6 +38,8 @@ class PaginationMixin(BaseModel):
         previous page of achievements
     available_pages: int
         available pages
+    next_cursor: Optional[str], default = None
+        opaque cursor of the next page, cost does not depend on page depth
     """
 
     total: int
@@ -46,3 +48,4 @@ class PaginationMixin(BaseModel):
     next_page: Optional[int] = None
     previous_page: Optional[int] = None
     available_pages: int
+    next_cursor: Optional[str] = None
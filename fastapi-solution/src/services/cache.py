@@ -0,0 +1,472 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+from uuid import uuid4
+
+import aioredis
+import orjson
+from aioredis import Redis
+from aioredis.pubsub import Receiver
+
+logger = logging.getLogger(__name__)
+
+# Ключ Redis с поколением индекса, которое ETL увеличивает после каждой загрузки
+GENERATION_KEY = "generation:{0}"
+
+# Запросы, выполняемые при прогреве, не считаются в популярности
+_warming: ContextVar[bool] = ContextVar("warming", default=False)
+
+# Снимаем блокировку, только если она всё ещё наша
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LocalCache:
+    """
+    Кеш в памяти процесса: ограниченный размер, время жизни записей и вытеснение
+    давно не использованных записей (LRU).
+    Хранит уже разобранные объекты, поэтому попадание не требует ни сети, ни валидации pydantic.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[(namespace, key)]
+            return None
+        self._data.move_to_end((namespace, key))
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        self._data[(namespace, key)] = (time.monotonic() + ttl, value)
+        self._data.move_to_end((namespace, key))
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._data.pop((namespace, key), None)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Удаляем все записи пространства имён или весь кеш"""
+        if namespace is None:
+            self._data.clear()
+            return
+        for cache_key in [
+            cache_key for cache_key in self._data if cache_key[0] == namespace
+        ]:
+            del self._data[cache_key]
+
+
+class TwoTierCache:
+    """
+    Двухуровневый кеш: L1 в памяти процесса перед общим для воркеров API L2 в Redis.
+    Чтение идёт сначала в L1, при промахе — в Redis, и найденное значение попадает в L1.
+    Время жизни задаётся отдельно для каждого пространства имён (индекса ES) и уровня;
+    L1 живёт меньше, так как инвалидация между воркерами приходит через pub/sub без гарантий доставки.
+
+    Промахи по одному ключу схлопываются (single-flight): запрос к ES выполняет одна корутина
+    воркера, остальные ждут её результат; с redis_lock — один воркер из всех.
+    В Redis вместе со значением хранится момент его устаревания и время его вычисления.
+    Устаревшее значение ещё stale секунд отдаётся сразу, а обновляется в фоне;
+    незадолго до устаревания значение обновляется заранее с вероятностью,
+    растущей к моменту устаревания (XFetch), чтобы ключ не истекал у всех одновременно.
+
+    ETL публикует в changes_channel новое поколение индекса и id изменённых документов:
+    документы по этим id удаляются из обоих уровней, а warm_size самых частых запросов
+    списков по индексу выполняются заново в фоне, чтобы пользователи не попадали на промах.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: dict[str, int],
+        local_ttl: dict[str, int],
+        local_size: int,
+        channel: str,
+        stale: int = 60,
+        beta: float = 1.0,
+        redis_lock: bool = False,
+        lock_timeout: float = 5.0,
+        generation_ttl: float = 1.0,
+        changes_channel: Optional[str] = None,
+        warm_size: int = 20,
+        warm_delay: float = 1.0,
+        tracked_size: int = 1000,
+    ):
+        """
+        :param redis: пул соединений Redis
+        :param ttl: время жизни записей в Redis по пространствам имён, секунды
+        :param local_ttl: время жизни записей в памяти процесса по пространствам имён, секунды
+        :param local_size: максимальное число записей в памяти процесса
+        :param channel: канал Redis pub/sub для инвалидации
+        :param stale: сколько секунд после устаревания значение ещё отдаётся, пока обновляется в фоне
+        :param beta: множитель XFetch: чем больше, тем раньше обновление
+        :param redis_lock: схлопывать промахи между воркерами блокировкой в Redis
+        :param lock_timeout: время жизни блокировки и ожидания чужого результата, секунды
+        :param generation_ttl: как долго поколение индекса берётся из памяти процесса, секунды
+        :param changes_channel: канал Redis pub/sub, в который ETL публикует изменения индексов
+        :param warm_size: сколько самых частых запросов списков прогревать после изменения индекса
+        :param warm_delay: пауза перед прогревом, чтобы собрать изменения подряд идущих загрузок, секунды
+        :param tracked_size: сколько разных запросов списков учитывать в популярности
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.channel = channel
+        self.stale = stale
+        self.beta = beta
+        self.redis_lock = redis_lock
+        self.lock_timeout = lock_timeout
+        self.local = LocalCache(max_size=local_size)
+        self.generation_ttl = generation_ttl
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+        self._generations: dict[str, tuple[float, int]] = {}
+        self.changes_channel = changes_channel
+        self.warm_size = warm_size
+        self.warm_delay = warm_delay
+        self.tracked_size = tracked_size
+        self._popularity: Counter = Counter()
+        self._requests: dict[tuple, tuple[str, ...]] = {}
+        self._warm_pending: set[str] = set()
+        self.counters: dict[str, dict[str, int]] = {
+            "local": {"hits": 0, "misses": 0},
+            "redis": {"hits": 0, "misses": 0},
+            "coalesced": {"hits": 0, "misses": 0},
+        }
+        self.warmed = 0
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        dumps: Callable[[Any], Union[bytes, str]],
+        loads: Callable[[bytes], Any],
+    ) -> Optional[Any]:
+        """
+        Читаем значение из кеша, а при промахе, устаревании или раннем обновлении вызываем load
+        :param namespace: пространство имён (индекс ES)
+        :param key: ключ кеша
+        :param load: получает значение из Elasticsearch; None не кешируется
+        :param dumps: сериализует значение для Redis
+        :param loads: разбирает значение из Redis
+        :return: значение или None
+        """
+        value = self._get_local(namespace, key)
+        if value is not None:
+            return value
+
+        entry = await self._get_redis(key)
+        if entry is None:
+            return await self._load_once(namespace, key, load, dumps, loads, wait=True)
+
+        expiry, delta, data = entry
+        value = loads(data)
+        now = time.time()
+        if now >= expiry:
+            """Значение устарело: отдаём его и обновляем в фоне"""
+            self._refresh(namespace, key, load, dumps, loads)
+        elif now - delta * self.beta * math.log(random.random() or 1e-12) >= expiry:
+            """XFetch: обновляем заранее, вероятность растёт к моменту устаревания"""
+            self._refresh(namespace, key, load, dumps, loads)
+            self.local.set(namespace, key, value, self._local_ttl(namespace))
+        else:
+            self.local.set(namespace, key, value, self._local_ttl(namespace))
+        return value
+
+    async def set(
+        self,
+        namespace: str,
+        key: str,
+        data: Union[bytes, str],
+        value: Any,
+        delta: float = 0.0,
+    ) -> None:
+        """
+        :param namespace: пространство имён (индекс ES)
+        :param key: ключ кеша
+        :param data: сериализованное значение для Redis
+        :param value: объект для L1
+        :param delta: время вычисления значения, секунды
+        """
+        ttl = self.ttl.get(namespace, min(self.ttl.values()))
+        if isinstance(data, str):
+            data = data.encode()
+        envelope = b"%.3f %.4f " % (time.time() + ttl, delta) + data
+        await self.redis.set(key, envelope, expire=ttl + self.stale)
+        self.local.set(namespace, key, value, self._local_ttl(namespace))
+
+    async def generation(self, index: str) -> int:
+        """
+        Поколение индекса: ETL увеличивает его после каждой загрузки, и ключи списков
+        с прежним поколением больше не читаются. Из Redis читается не чаще раза в generation_ttl
+        :param index: индекс ES
+        """
+        cached = self._generations.get(index)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        value = int(await self.redis.get(GENERATION_KEY.format(index)) or 0)
+        self._generations[index] = (time.monotonic() + self.generation_ttl, value)
+        return value
+
+    async def invalidate(
+        self, namespace: str, keys: Optional[Iterable[str]] = None
+    ) -> None:
+        """
+        Удаляем ключи (или всё пространство имён из L1) во всех воркерах API
+        :param namespace: пространство имён (индекс ES)
+        :param keys: ключи кеша; None — сбросить L1 пространства имён
+        """
+        keys = list(keys) if keys is not None else None
+        if keys:
+            await self.redis.delete(*keys)
+        self._evict(namespace, keys)
+        await self.redis.publish(
+            self.channel, orjson.dumps({"namespace": namespace, "keys": keys})
+        )
+
+    async def listen(self, address: tuple[str, int]) -> None:
+        """
+        Применяем инвалидации других воркеров и изменения от ETL, пока задача не отменена.
+        После переподключения L1 сбрасывается целиком: сообщения за время обрыва потеряны
+        :param address: хост и порт Redis
+        """
+        channels = [self.channel]
+        if self.changes_channel:
+            channels.append(self.changes_channel)
+        while True:
+            try:
+                connection = await aioredis.create_redis(address)
+                receiver = Receiver()
+                try:
+                    await connection.subscribe(*map(receiver.channel, channels))
+                    self.local.clear()
+                    async for channel, message in receiver.iter():
+                        message = orjson.loads(message)
+                        if channel.name.decode() == self.channel:
+                            self._evict(message["namespace"], message["keys"])
+                        else:
+                            await self._apply_changes(message)
+                finally:
+                    receiver.stop()
+                    connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation channel lost: %s", e)
+                await asyncio.sleep(1)
+
+    def track(
+        self,
+        indexes: tuple[str, ...],
+        method: Callable[..., Awaitable[Any]],
+        params: dict[str, Any],
+    ) -> None:
+        """
+        Учитываем запрос списка в популярности, чтобы прогревать его после изменения индексов
+        :param indexes: индексы, из которых собраны данные
+        :param method: метод сервиса, выполняющий запрос
+        :param params: аргументы метода
+        """
+        if _warming.get():
+            return
+        request = (method, tuple(sorted(params.items())))
+        self._requests[request] = indexes
+        self._popularity[request] += 1
+        if len(self._popularity) > self.tracked_size:
+            """Оставляем половину самых частых запросов, а их счётчики уменьшаем, чтобы учитывать свежие"""
+            self._popularity = Counter(
+                {
+                    request: (count + 1) // 2
+                    for request, count in self._popularity.most_common(
+                        self.tracked_size // 2
+                    )
+                }
+            )
+            self._requests = {
+                request: self._requests[request] for request in self._popularity
+            }
+
+    def stats(self) -> dict[str, dict[str, Union[int, float]]]:
+        """Счётчики попаданий и промахов по уровням, доля попаданий и прогрев"""
+        return {
+            **{
+                tier: {
+                    **counters,
+                    "hit_ratio": counters["hits"]
+                    / (counters["hits"] + counters["misses"])
+                    if counters["hits"] + counters["misses"]
+                    else 0.0,
+                }
+                for tier, counters in self.counters.items()
+            },
+            "warm": {"warmed": self.warmed, "tracked": len(self._popularity)},
+        }
+
+    async def _apply_changes(self, message: dict) -> None:
+        """Новое поколение индекса от ETL: удаляем изменённые документы и прогреваем списки"""
+        index, ids = message["index"], message["ids"]
+        cached = self._generations.get(index)
+        generation = max(message["generation"], cached[1] if cached else 0)
+        self._generations[index] = (time.monotonic() + self.generation_ttl, generation)
+        if ids is None:
+            self.local.clear(index)
+        elif ids:
+            await self.redis.delete(*ids)
+            self._evict(index, ids)
+        if index not in self._warm_pending:
+            self._warm_pending.add(index)
+            asyncio.ensure_future(self._warm(index)).add_done_callback(_log_task_error)
+
+    async def _warm(self, index: str) -> None:
+        """Заново выполняем самые частые запросы списков по индексу"""
+        await asyncio.sleep(self.warm_delay)
+        self._warm_pending.discard(index)
+        _warming.set(True)
+        requests = [
+            request
+            for request, _ in self._popularity.most_common()
+            if index in self._requests[request]
+        ][: self.warm_size]
+        for method, params in requests:
+            try:
+                await method(**dict(params))
+                self.warmed += 1
+            except Exception as e:
+                logger.warning("Cache warm-up of %s failed: %s", method.__name__, e)
+
+    def _get_local(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.local.get(namespace, key)
+        self.counters["local"]["hits" if value is not None else "misses"] += 1
+        return value
+
+    async def _get_redis(self, key: str) -> Optional[tuple[float, float, bytes]]:
+        """Значение из Redis: момент устаревания, время вычисления и данные"""
+        entry = await self.redis.get(key)
+        self.counters["redis"]["hits" if entry else "misses"] += 1
+        if not entry:
+            return None
+        expiry, delta, data = entry.split(b" ", 2)
+        return float(expiry), float(delta), data
+
+    async def _load_once(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        dumps: Callable[[Any], Union[bytes, str]],
+        loads: Callable[[bytes], Any],
+        wait: bool,
+    ) -> Optional[Any]:
+        """Single-flight: одновременные вызовы по одному ключу ждут одну загрузку"""
+        flight_key = (namespace, key)
+        future = self._inflight.get(flight_key)
+        if future is None:
+            self.counters["coalesced"]["misses"] += 1
+            future = asyncio.ensure_future(
+                self._load(namespace, key, load, dumps, loads, wait)
+            )
+            self._inflight[flight_key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        else:
+            self.counters["coalesced"]["hits"] += 1
+        """Отмена одного запроса не должна отменять загрузку, которую ждут другие"""
+        return await asyncio.shield(future)
+
+    def _refresh(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        dumps: Callable[[Any], Union[bytes, str]],
+        loads: Callable[[bytes], Any],
+    ) -> None:
+        """Обновляем значение в фоне, не задерживая ответ"""
+        if (namespace, key) in self._inflight:
+            return
+        task = asyncio.ensure_future(
+            self._load_once(namespace, key, load, dumps, loads, wait=False)
+        )
+        task.add_done_callback(_log_task_error)
+
+    async def _load(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        dumps: Callable[[Any], Union[bytes, str]],
+        loads: Callable[[bytes], Any],
+        wait: bool,
+    ) -> Optional[Any]:
+        lock_key, token = f"lock:{key}", uuid4().hex
+        locked = True
+        if self.redis_lock:
+            locked = await self.redis.set(
+                lock_key,
+                token,
+                pexpire=int(self.lock_timeout * 1000),
+                exist=self.redis.SET_IF_NOT_EXIST,
+            )
+            if not locked:
+                """Значение вычисляет другой воркер: при промахе ждём его результат в Redis"""
+                if not wait:
+                    return None
+                value = await self._wait_for(key, loads)
+                if value is not None:
+                    return value
+        try:
+            started = time.monotonic()
+            value = await load()
+            if value is not None:
+                await self.set(
+                    namespace,
+                    key,
+                    dumps(value),
+                    value,
+                    delta=time.monotonic() - started,
+                )
+            return value
+        finally:
+            if self.redis_lock and locked:
+                await self.redis.eval(
+                    RELEASE_LOCK_SCRIPT, keys=[lock_key], args=[token]
+                )
+
+    async def _wait_for(self, key: str, loads: Callable[[bytes], Any]) -> Optional[Any]:
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self.redis.get(key)
+            if entry:
+                return loads(entry.split(b" ", 2)[2])
+        return None
+
+    def _evict(self, namespace: str, keys: Optional[list[str]]) -> None:
+        if keys is None:
+            self.local.clear(namespace)
+            return
+        for key in keys:
+            self.local.delete(namespace, key)
+
+    def _local_ttl(self, namespace: str) -> int:
+        return self.local_ttl.get(namespace, min(self.local_ttl.values()))
+
+
+def _log_task_error(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception():
+        logger.warning("Background cache task failed: %s", task.exception())
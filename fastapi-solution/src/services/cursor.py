@@ -0,0 +1,82 @@
+import base64
+import binascii
+import json
+from http import HTTPStatus
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def encode_cursor(
+    after: list, page: int, params: str, pit: Optional[str] = None
+) -> str:
+    """
+    Непрозрачный курсор следующей страницы.
+    json, а не orjson: значения сортировки могут быть ±Infinity,
+    и они должны вернуться в ES без изменений
+    :param after: значения сортировки последнего документа страницы (search_after)
+    :param page: номер следующей страницы
+    :param params: хеш параметров запроса (hash_params), для которых выдан курсор
+    :param pit: id снимка индекса (point in time);
+        None — снимок откроется при переходе по курсору
+    :return: курсор в base64
+    """
+    payload = json.dumps({"after": after, "page": page, "params": params, "pit": pit})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, params: str) -> dict:
+    """
+    :param cursor: курсор из encode_cursor
+    :param params: хеш параметров текущего запроса (hash_params)
+    :return: словарь с ключами after, page, params и pit
+    """
+    try:
+        decoded: dict = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(decoded.get("after"), list) or decoded["page"] < 1:
+            raise ValueError
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        """Курсор повреждён или изменён клиентом"""
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="invalid cursor")
+    if decoded.get("params") != params:
+        """Курсор выдан для другой сортировки или других фильтров"""
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="cursor does not match request parameters",
+        )
+    return decoded
+
+
+def is_last_page(docs: dict, page: int, page_size: int) -> bool:
+    """
+    :param docs: ответ Elasticsearch
+    :param page: номер текущей страницы
+    :param page_size: размер страницы
+    :return: True, если следующей страницы нет
+    """
+    hits: list = docs.get("hits").get("hits")
+    total: dict = docs.get("hits").get("total")
+    if len(hits) < page_size:
+        return True
+    """Если общее число известно точно (меньше track_total_hits), проверяем и его"""
+    return total.get("relation") == "eq" and page * page_size >= total.get("value")
+
+
+def get_next_cursor(
+    docs: dict, page: int, page_size: int, params: str
+) -> Optional[str]:
+    """
+    :param docs: ответ Elasticsearch, запрошенный с сортировкой
+    :param page: номер текущей страницы
+    :param page_size: размер страницы
+    :param params: хеш параметров запроса (hash_params)
+    :return: курсор следующей страницы или None, если страница последняя
+    """
+    if is_last_page(docs=docs, page=page, page_size=page_size):
+        return None
+    return encode_cursor(
+        after=docs.get("hits").get("hits")[-1]["sort"],
+        page=page + 1,
+        params=params,
+        pit=docs.get("pit_id"),
+    )
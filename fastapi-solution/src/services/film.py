@@ -1,17 +1,20 @@
 from functools import lru_cache
 from typing import Optional
 
-import orjson
 from aioredis import Redis
+from db.cache import get_cache
 from db.elastic import get_elastic
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from models.film import ESFilm, ListResponseFilm
+from services.cache import TwoTierCache
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import (create_hash_key, get_hits,
-                            get_params_films_to_elastic)
+from services.cursor import decode_cursor, get_next_cursor
+from services.keys import hash_params
+from services.utils import (dump_page, get_hits, get_params_films_to_elastic,
+                            get_sort_to_elastic, load_page)
 
 
 class FilmService(ServiceMixin):
@@ -22,29 +25,33 @@ class FilmService(ServiceMixin):
         sorting: str = None,
         query: str = None,
         genre: str = None,
+        cursor: str = None,
     ) -> Optional[dict]:
         """Производим полнотекстовый поиск по фильмам в Elasticsearch."""
         _source: tuple = ("id", "title", "imdb_rating", "genre")
-        """ Получаем число фильмов из стейт """
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{page_size}{query}{genre}"
-        """ Пытаемся получить данные из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        """ Курсор действителен только для тех же сортировки и фильтров """
+        params: str = hash_params(
+            prefix="films", page_size=page_size, sort=sorting, query=query, genre=genre
         )
-        if not instance:
+
+        async def load(
+            after: Optional[dict] = None,
+        ) -> Optional[tuple[int, list[ListResponseFilm], Optional[str]]]:
             """Если данных нет в кеше, то ищем его в Elasticsearch"""
             body: dict = get_params_films_to_elastic(
                 page_size=page_size, page=page, genre=genre, query=query
             )
-            docs: Optional[dict] = await self.search_in_elastic(
-                body=body, _source=_source, sort=sorting
+            docs: Optional[dict] = await self.search_page(
+                body=body,
+                sort=get_sort_to_elastic(sorting=sorting, query=query),
+                cursor=after,
+                _source=_source,
             )
             if not docs:
                 return None
             """ Получаем фильмы из ES """
             hits = get_hits(docs=docs, schema=ESFilm)
-            """ Получаем число фильмов """
+            """ Получаем число фильмов, оно хранится в кеше вместе со страницей """
             total: int = int(docs.get("hits").get("total").get("value", 0))
             """ Прогоняем данные через pydantic """
             films: list[ListResponseFilm] = [
@@ -53,30 +60,49 @@ class FilmService(ServiceMixin):
                 )
                 for row in hits
             ]
-            """ Сохраняем фильмы в кеш """
-            data = orjson.dumps([i.dict() for i in films])
-            new_param: str = f"{total}{page}{page_size}{query}{genre}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
+            next_cursor = get_next_cursor(
+                docs=docs, page=page, page_size=page_size, params=params
             )
-            """ Сохраняем число фильмов в стейт """
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="films",
-                db_objects=films,
-                total=total,
+            return total, films, next_cursor
+
+        if cursor:
+            """ Страница после курсора читается из снимка индекса и не кешируется """
+            after: dict = decode_cursor(cursor, params=params)
+            page = after["page"]
+            result = await load(after)
+        else:
+            self._track(
+                self.get_all_films,
                 page=page,
                 page_size=page_size,
+                sorting=sorting,
+                query=query,
+                genre=genre,
+            )
+            """ Пытаемся получить данные из кэша, одновременные промахи ждут один запрос к ES """
+            result = await self._get_or_load(
+                key=await self._cache_key(
+                    prefix=self.index,
+                    page=page,
+                    page_size=page_size,
+                    sort=sorting,
+                    query=query,
+                    genre=genre,
+                ),
+                load=load,
+                dumps=dump_page,
+                loads=lambda data: load_page(data, ListResponseFilm),
             )
-        films_from_cache: list[ListResponseFilm] = [
-            ListResponseFilm(**row) for row in orjson.loads(instance)
-        ]
+        if result is None:
+            return None
+        total, films, next_cursor = result
         return get_by_pagination(
             name="films",
-            db_objects=films_from_cache,
-            total=state_total,
+            db_objects=films,
+            total=total,
             page=page,
             page_size=page_size,
+            next_cursor=next_cursor,
         )
 
 
@@ -85,5 +111,6 @@ class FilmService(ServiceMixin):
 def get_film_service(
     redis: Redis = Depends(get_redis),
     elastic: AsyncElasticsearch = Depends(get_elastic),
+    cache: TwoTierCache = Depends(get_cache),
 ) -> FilmService:
-    return FilmService(redis=redis, elastic=elastic, index="movies")
+    return FilmService(redis=redis, elastic=elastic, index="movies", cache=cache)
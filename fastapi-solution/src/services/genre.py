@@ -1,68 +1,81 @@
 from functools import lru_cache
 from typing import Optional
 
-import orjson
 from aioredis import Redis
+from db.cache import get_cache
 from db.elastic import get_elastic
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from models.genre import ElasticGenre, FilmGenre
+from services.cache import TwoTierCache
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import create_hash_key, get_hits
+from services.cursor import decode_cursor, get_next_cursor
+from services.keys import hash_params
+from services.utils import dump_page, get_hits, get_sort_to_elastic, load_page
 
 
 class GenreService(ServiceMixin):
 
     # get_genres_list возвращает список объектов жанра
-    async def get_genres_list(self, page: int, page_size: int) -> Optional[dict]:
-        body: dict = {
-            "size": page_size,
-            "from": (page - 1) * page_size,
-            "query": {"match_all": {}},
-        }
-        """ Получаем число фильмов из стейт """
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{body}{page_size}"
-        """ Пытаемся получить данные из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
-        )
-        if not instance:
-            docs: Optional[dict] = await self.search_in_elastic(body=body)
+    async def get_genres_list(
+        self, page: int, page_size: int, cursor: str = None
+    ) -> Optional[dict]:
+        params: str = hash_params(prefix="genres", page_size=page_size)
+
+        async def load(
+            after: Optional[dict] = None,
+        ) -> Optional[tuple[int, list[FilmGenre], Optional[str]]]:
+            body: dict = {
+                "size": page_size,
+                "from": (page - 1) * page_size,
+                "query": {"match_all": {}},
+            }
+            docs: Optional[dict] = await self.search_page(
+                body=body, sort=get_sort_to_elastic(), cursor=after
+            )
             if not docs:
                 return None
             """ Получаем жанры из ES """
             hits = get_hits(docs=docs, schema=ElasticGenre)
-            """ Получаем число жанров """
+            """ Получаем число жанров, оно хранится в кеше вместе со страницей """
             total: int = int(docs.get("hits").get("total").get("value", 0))
             """ Прогоняем данные через pydantic """
             genres: list[FilmGenre] = [
                 FilmGenre(uuid=es_genre.id, name=es_genre.name) for es_genre in hits
             ]
-            """ Сохраняем жанры в кеш """
-            data = orjson.dumps([i.dict() for i in genres])
-            new_param: str = f"{total}{page}{body}{page_size}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
+            next_cursor = get_next_cursor(
+                docs=docs, page=page, page_size=page_size, params=params
             )
-            """ Сохраняем число жанров в стейт """
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="genres",
-                db_objects=genres,
-                total=total,
-                page=page,
-                page_size=page_size,
+            return total, genres, next_cursor
+
+        if cursor:
+            """ Страница после курсора читается из снимка индекса и не кешируется """
+            after: dict = decode_cursor(cursor, params=params)
+            page = after["page"]
+            result = await load(after)
+        else:
+            self._track(self.get_genres_list, page=page, page_size=page_size)
+            """ Пытаемся получить данные из кэша """
+            result = await self._get_or_load(
+                key=await self._cache_key(
+                    prefix=self.index, page=page, page_size=page_size
+                ),
+                load=load,
+                dumps=dump_page,
+                loads=lambda data: load_page(data, FilmGenre),
             )
-        genres: list[FilmGenre] = [FilmGenre(**row) for row in orjson.loads(instance)]
+        if result is None:
+            return None
+        total, genres, next_cursor = result
         return get_by_pagination(
             name="genres",
             db_objects=genres,
-            total=state_total,
+            total=total,
             page=page,
             page_size=page_size,
+            next_cursor=next_cursor,
         )
 
 
@@ -71,5 +84,6 @@ class GenreService(ServiceMixin):
 def get_genre_service(
     redis: Redis = Depends(get_redis),
     elastic: AsyncElasticsearch = Depends(get_elastic),
+    cache: TwoTierCache = Depends(get_cache),
 ) -> GenreService:
-    return GenreService(redis=redis, elastic=elastic, index="genres")
+    return GenreService(redis=redis, elastic=elastic, index="genres", cache=cache)
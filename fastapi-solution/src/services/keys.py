@@ -0,0 +1,41 @@
+import hashlib
+from typing import Any
+
+import orjson
+
+
+def create_cache_key(prefix: str, generation: str, **params) -> str:
+    """
+    Канонический ключ кеша: одинаковые по смыслу запросы получают один ключ.
+    Параметры со значением None не учитываются, порядок параметров не важен,
+    пробелы в строках схлопываются, последовательности (например, sort) разворачиваются
+    :param prefix: префикс ключа, обычно индекс в elasticsearch
+    :param generation: поколение данных, которое ETL увеличивает после каждой загрузки
+    :param params: параметры запроса
+    :return: ключ вида prefix:generation:md5
+    """
+    return f"{prefix}:{generation}:{hash_params(**params)}"
+
+
+def hash_params(**params) -> str:
+    """
+    :param params: параметры запроса, нормализуются как в create_cache_key
+    :return: md5 нормализованных параметров
+    """
+    normalized: dict = {}
+    for name, value in params.items():
+        value = _normalize(value)
+        if value is not None:
+            normalized[name] = value
+    return hashlib.md5(
+        orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (tuple, list)):
+        items = [item for item in map(_normalize, value) if item is not None]
+        return items or None
+    if isinstance(value, str):
+        return " ".join(value.split()) or None
+    return value
@@ -1,28 +1,33 @@
-from typing import Optional, Union
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Optional, Union
 
 from aioredis import Redis
-from core.config import CACHE_EXPIRE_IN_SECONDS
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from core import config
+from elasticsearch import AsyncElasticsearch, NotFoundError, RequestError
+from fastapi import HTTPException
 from models.film import ESFilm
 from models.genre import ElasticGenre
 from models.person import ElasticPerson
+from services.cache import TwoTierCache
+from services.cursor import is_last_page
+from services.keys import create_cache_key
 
 Schemas: tuple = (ESFilm, ElasticGenre, ElasticPerson)
 ES_schemas = Union[Schemas]
 
 
 class ServiceMixin:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch, index: str):
+    def __init__(
+        self,
+        redis: Redis,
+        elastic: AsyncElasticsearch,
+        index: str,
+        cache: TwoTierCache,
+    ):
         self.redis = redis
         self.elastic = elastic
         self.index = index
-        self.total_count: int = 0
-
-    async def get_total_count(self) -> int:
-        return self.total_count
-
-    async def set_total_count(self, value: int):
-        self.total_count = value
+        self.cache = cache
 
     async def search_in_elastic(
         self, body: dict, _source=None, sort=None, _index=None
@@ -41,20 +46,87 @@ class ServiceMixin:
         except NotFoundError:
             return None
 
+    async def search_page(
+        self,
+        body: dict,
+        sort: list,
+        cursor: Optional[dict] = None,
+        _source=None,
+        _index=None,
+    ) -> Optional[dict]:
+        """
+        Страница результатов: по номеру (from/size) или после курсора (search_after).
+        Страница после курсора читается из снимка индекса (point in time), поэтому
+        её стоимость не зависит от глубины, а документы не сдвигаются между страницами.
+        После последней страницы снимок закрывается, не дожидаясь keep_alive
+        :param body: запрос к Elasticsearch с size и from
+        :param sort: сортировка, однозначная для search_after
+        :param cursor: разобранный курсор; None — страница по номеру
+        :param _source: возвращаемые поля
+        :param _index: индекс; по умолчанию индекс сервиса
+        """
+        if not _index:
+            _index = self.index
+        if cursor is None:
+            return await self.search_in_elastic(
+                body={**body, "sort": sort}, _source=_source, _index=_index
+            )
+
+        body = {key: value for key, value in body.items() if key != "from"}
+        body.update(sort=sort, search_after=cursor["after"])
+        try:
+            try:
+                docs = await self._search_in_pit(
+                    body, cursor.get("pit"), _source, _index
+                )
+            except NotFoundError:
+                if cursor.get("pit") is None:
+                    raise
+                """Снимок истёк: открываем новый и продолжаем с того же места"""
+                docs = await self._search_in_pit(body, None, _source, _index)
+        except NotFoundError:
+            return None
+        except RequestError:
+            """Значения search_after не подходят к сортировке: курсор изменён"""
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST, detail="invalid cursor"
+            )
+        if is_last_page(docs=docs, page=cursor["page"], page_size=body["size"]):
+            await self._close_pit(docs.get("pit_id"))
+        return docs
+
+    async def _search_in_pit(
+        self, body: dict, pit: Optional[str], _source, _index: str
+    ) -> dict:
+        """Поиск в снимке индекса; без pit открываем новый снимок"""
+        if pit is None:
+            pit = (
+                await self.elastic.open_point_in_time(
+                    index=_index, keep_alive=config.CURSOR_KEEP_ALIVE
+                )
+            )["id"]
+        body = {**body, "pit": {"id": pit, "keep_alive": config.CURSOR_KEEP_ALIVE}}
+        return await self.elastic.search(body=body, _source=_source)
+
+    async def _close_pit(self, pit: Optional[str]) -> None:
+        """Закрываем снимок индекса; уже истёкший снимок не ошибка"""
+        if pit is None:
+            return
+        try:
+            await self.elastic.close_point_in_time(body={"id": pit})
+        except NotFoundError:
+            pass
+
     async def get_by_id(self, target_id: str, schema: Schemas) -> Optional[ES_schemas]:
         """Пытаемся получить данные из кеша, потому что оно работает быстрее"""
-        instance = await self._get_result_from_cache(key=target_id)
-        if not instance:
-            """Если данных нет в кеше, то ищем его в Elasticsearch"""
-            instance = await self._get_data_from_elastic_by_id(
+        return await self._get_or_load(
+            key=target_id,
+            load=lambda: self._get_data_from_elastic_by_id(
                 target_id=target_id, schema=schema
-            )
-            if not instance:
-                return None
-            """ Сохраняем фильм в кеш """
-            await self._put_data_to_cache(key=instance.id, instance=instance.json())
-            return instance
-        return schema.parse_raw(instance)
+            ),
+            dumps=lambda instance: instance.json(),
+            loads=schema.parse_raw,
+        )
 
     async def _get_data_from_elastic_by_id(
         self, target_id: str, schema: Schemas
@@ -66,11 +138,54 @@ class ServiceMixin:
         except NotFoundError:
             return None
 
-    async def _get_result_from_cache(self, key: str) -> Optional[bytes]:
-        """Пытаемся получить данные об объекте из кеша"""
-        data = await self.redis.get(key=key)
-        return data or None
+    async def _cache_key(self, prefix: str, indexes: tuple = (), **params) -> str:
+        """
+        Ключ кеша по нормализованным параметрам запроса и поколениям индексов
+        :param prefix: префикс ключа
+        :param indexes: индексы, из которых собраны данные; по умолчанию индекс сервиса
+        :param params: параметры запроса
+        """
+        generation = ".".join(
+            [
+                str(await self.cache.generation(index))
+                for index in indexes or (self.index,)
+            ]
+        )
+        return create_cache_key(prefix=prefix, generation=generation, **params)
+
+    def _track(
+        self, method: Callable[..., Awaitable[Any]], indexes: tuple = (), **params
+    ) -> None:
+        """
+        Учитываем запрос списка, чтобы прогреть его кеш после загрузки ETL
+        :param method: метод сервиса, выполняющий запрос
+        :param indexes: индексы, из которых собраны данные; по умолчанию индекс сервиса
+        :param params: аргументы метода
+        """
+        self.cache.track(indexes=indexes or (self.index,), method=method, params=params)
 
-    async def _put_data_to_cache(self, key: str, instance: Union[bytes, str]) -> None:
-        """Сохраняем данные об объекте в кеш, время жизни кеша — 5 минут"""
-        await self.redis.set(key=key, value=instance, expire=CACHE_EXPIRE_IN_SECONDS)
+    async def _get_or_load(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        dumps: Callable[[Any], Union[bytes, str]],
+        loads: Callable[[bytes], Any],
+        namespace: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        Получаем данные из кеша, а при промахе — из Elasticsearch через load.
+        Одновременные промахи по ключу выполняют один запрос к ES,
+        устаревшие данные отдаются сразу и обновляются в фоне
+        :param key: ключ кеша
+        :param load: получает данные из Elasticsearch; None не кешируется
+        :param dumps: сериализует данные для Redis
+        :param loads: разбирает данные из Redis в объект
+        :param namespace: индекс, от которого зависят данные; по умолчанию индекс сервиса
+        """
+        return await self.cache.get_or_load(
+            namespace=namespace or self.index,
+            key=key,
+            load=load,
+            dumps=dumps,
+            loads=loads,
+        )
@@ -2,7 +2,12 @@ import math
 
 
 def get_by_pagination(
-    name: str, db_objects, total: int, page: int = 1, page_size: int = 20
+    name: str,
+    db_objects,
+    total: int,
+    page: int = 1,
+    page_size: int = 20,
+    next_cursor: str = None,
 ) -> dict:
     """
     This method will try to paginate objects by page number
@@ -11,6 +16,7 @@ def get_by_pagination(
     :param total: total query count
     :param page: selected page number
     :param page_size: page size
+    :param next_cursor: opaque cursor of the next page
     :return: dict containing: (
         list of invitations,
         selected page number,
@@ -18,7 +24,8 @@ def get_by_pagination(
         previous page number,
         next page number,
         total available pages,
-        total objects number
+        total objects number,
+        cursor of the next page
     )
     """
     next_page, previous_page = None, None
@@ -36,4 +43,5 @@ def get_by_pagination(
         "next_page": next_page,
         "available_pages": pages,
         "total": total,
+        "next_cursor": next_cursor,
     }
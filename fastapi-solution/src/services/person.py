@@ -2,30 +2,23 @@ from functools import lru_cache
 from http import HTTPStatus
 from typing import Optional
 
-import orjson
 from aioredis import Redis
+from db.cache import get_cache
 from db.elastic import get_elastic
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends, HTTPException
 from models.film import ESFilm, ListResponseFilm
 from models.person import DetailResponsePerson, ElasticPerson
+from services.cache import TwoTierCache
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import create_hash_key, get_hits
+from services.cursor import decode_cursor, get_next_cursor
+from services.keys import hash_params
+from services.utils import dump_page, get_hits, get_sort_to_elastic, load_page
 
 
 class PersonService(ServiceMixin):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.person_films: int = 0
-
-    async def get_person_films_count(self) -> int:
-        return self.person_films
-
-    async def set_person_films_count(self, value: int):
-        self.person_films = value
-
     async def get_person(self, person_id: str):
         person = await self.get_by_id(target_id=person_id, schema=ElasticPerson)
         if not person:
@@ -36,10 +29,8 @@ class PersonService(ServiceMixin):
         return person
 
     async def get_person_films(
-        self, person_id: str, page: int, page_size: int
+        self, person_id: str, page: int, page_size: int, cursor: str = None
     ) -> Optional[dict]:
-        """Получаем число фильмов персоны из стейт"""
-        state_total: int = await self.get_person_films_count()
         body: dict = {
             "size": page_size,
             "from": (page - 1) * page_size,
@@ -58,19 +49,22 @@ class PersonService(ServiceMixin):
                 }
             }
         }
-        state_key: str = "person_films"
-        params: str = f"{state_total}{page}{page_size}{body}"
-        """ Пытаемся получить фильмы персоны из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        """ Курсор действителен только для фильмов той же персоны """
+        params: str = hash_params(
+            prefix="person_films", person_id=person_id, page_size=page_size
         )
-        if not instance:
-            docs: Optional[dict] = await self.search_in_elastic(
-                body=body, _index="movies"
+
+        async def load(
+            after: Optional[dict] = None,
+        ) -> Optional[tuple[int, list[ListResponseFilm], Optional[str]]]:
+            docs: Optional[dict] = await self.search_page(
+                body=body, sort=get_sort_to_elastic(), cursor=after, _index="movies"
             )
+            if not docs:
+                return None
             """ Получаем фильмы персоны из ES """
             hits = get_hits(docs=docs, schema=ESFilm)
-            """ Получаем число фильмов персоны """
+            """ Получаем число фильмов персоны, оно хранится в кеше вместе со страницей """
             total: int = int(docs.get("hits").get("total").get("value", 0))
             """ Прогоняем данные через pydantic """
             person_films: list[ListResponseFilm] = [
@@ -79,37 +73,52 @@ class PersonService(ServiceMixin):
                 )
                 for film in hits
             ]
-            data = orjson.dumps([i.dict() for i in person_films])
-            new_param: str = f"{total}{page}{body}{page_size}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=state_key, params=new_param), instance=data
+            next_cursor = get_next_cursor(
+                docs=docs, page=page, page_size=page_size, params=params
             )
-            """ Сохраняем число персон в стейт """
-            await self.set_person_films_count(value=total)
-            return get_by_pagination(
-                name="films",
-                db_objects=person_films,
-                total=total,
+            return total, person_films, next_cursor
+
+        if cursor:
+            """ Страница после курсора читается из снимка индекса и не кешируется """
+            after: dict = decode_cursor(cursor, params=params)
+            page = after["page"]
+            result = await load(after)
+        else:
+            self._track(
+                self.get_person_films,
+                indexes=("movies",),
+                person_id=person_id,
                 page=page,
                 page_size=page_size,
             )
-        person_films: list[ListResponseFilm] = [
-            ListResponseFilm(**row) for row in orjson.loads(instance)
-        ]
+            """ Пытаемся получить фильмы персоны из кэша, они зависят от индекса фильмов """
+            result = await self._get_or_load(
+                key=await self._cache_key(
+                    prefix="person_films",
+                    indexes=("movies",),
+                    person_id=person_id,
+                    page=page,
+                    page_size=page_size,
+                ),
+                load=load,
+                dumps=dump_page,
+                loads=lambda data: load_page(data, ListResponseFilm),
+                namespace="movies",
+            )
+        if result is None:
+            return None
+        total, person_films, next_cursor = result
         return get_by_pagination(
             name="films",
             db_objects=person_films,
-            total=state_total,
+            total=total,
             page=page,
             page_size=page_size,
+            next_cursor=next_cursor,
         )
 
     async def get_person_detail(self, person_id):
-        instance = await self._get_result_from_cache(
-            key=person_id
-        )
-
-        if not instance:
+        async def load() -> Optional[ElasticPerson]:
             body: dict = {
                 "query": {
                     "nested": {
@@ -148,21 +157,35 @@ class PersonService(ServiceMixin):
                     if str(person.id) == director_dict['id'] and 'director' not in role:
                         role.append('director')
 
-            instance = ElasticPerson(
+            return ElasticPerson(
                 id=person.id,
                 full_name=person.full_name,
                 roles=role,
                 film_ids=film_ids
             )
 
-            await self._put_data_to_cache(key=instance.id, instance=instance.json())
-            return instance
-
-        return ElasticPerson.parse_raw(instance)
+        """ Ключ отличается от ключа get_by_id: там персона без ролей и фильмов """
+        return await self._get_or_load(
+            key=await self._cache_key(
+                prefix="person_detail",
+                indexes=(self.index, "movies"),
+                person_id=person_id,
+            ),
+            load=load,
+            dumps=lambda instance: instance.json(),
+            loads=ElasticPerson.parse_raw,
+        )
 
     async def search_person(
         self, query: str, page: int, page_size: int
     ) -> Optional[dict]:
+        self._track(
+            self.search_person,
+            indexes=(self.index, "movies"),
+            query=query,
+            page=page,
+            page_size=page_size,
+        )
         person_body = {
                         "query": {
                             "bool": {
@@ -185,15 +208,8 @@ class PersonService(ServiceMixin):
                 }
             }
         }
-        """ Получаем число персон из стейт """
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{page_size}{body}"
-        """ Пытаемся получить данные из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
-        )
 
-        if not instance:
+        async def load() -> Optional[tuple[int, list[DetailResponsePerson]]]:
             persons_docs: Optional[dict] = await self.search_in_elastic(body=person_body, _index="persons")
             docs: Optional[dict] = await self.search_in_elastic(body=body, _index="movies")
             if not docs:
@@ -225,31 +241,30 @@ class PersonService(ServiceMixin):
                             person.film_ids.append(es_person.id)
                             person.role = 'Director'
 
-            """ Получаем число персон """
+            """ Получаем число персон, оно хранится в кеше вместе со страницей """
             total: int = int(persons_docs.get("hits").get("total").get("value", 0))
+            return total, persons, None
 
-            """ Сохраняем персон в кеш """
-            data = orjson.dumps([i.dict() for i in persons])
-            new_param: str = f"{total}{page}{body}{page_size}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
-            )
-            """ Сохраняем число персон в стейт """
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="persons",
-                db_objects=persons,
-                total=total,
+        """ Пытаемся получить данные из кэша, роли персон зависят от индекса фильмов """
+        result = await self._get_or_load(
+            key=await self._cache_key(
+                prefix=self.index,
+                indexes=(self.index, "movies"),
+                query=query,
                 page=page,
                 page_size=page_size,
-            )
-        persons: list[DetailResponsePerson] = [
-            DetailResponsePerson(**row) for row in orjson.loads(instance)
-        ]
+            ),
+            load=load,
+            dumps=dump_page,
+            loads=lambda data: load_page(data, DetailResponsePerson),
+        )
+        if result is None:
+            return None
+        total, persons, _ = result
         return get_by_pagination(
             name="persons",
             db_objects=persons,
-            total=state_total,
+            total=total,
             page=page,
             page_size=page_size,
         )
@@ -260,5 +275,6 @@ class PersonService(ServiceMixin):
 def get_person_service(
     redis: Redis = Depends(get_redis),
     elastic: AsyncElasticsearch = Depends(get_elastic),
+    cache: TwoTierCache = Depends(get_cache),
 ) -> PersonService:
-    return PersonService(redis=redis, elastic=elastic, index="persons")
+    return PersonService(redis=redis, elastic=elastic, index="persons", cache=cache)
@@ -1,7 +1,7 @@
-import hashlib
-from typing import Optional
+from typing import Optional, Type
 
-from pydantic import parse_obj_as
+import orjson
+from pydantic import BaseModel, parse_obj_as
 from services.mixins import Schemas
 
 
@@ -45,6 +45,24 @@ def get_params_films_to_elastic(
     return body
 
 
+def get_sort_to_elastic(sorting: Optional[tuple] = None, query: str = None) -> list:
+    """
+    :param sorting: поле сортировки, -field для сортировки по убыванию
+    :param query: полнотекстовый запрос; без sorting сортируем по релевантности
+    :return: сортировка для Elasticsearch;
+        id в конце делает порядок однозначным для search_after
+    """
+    sort_field = sorting[0] if not isinstance(sorting, str) and sorting else sorting
+    sort: list = []
+    if sort_field:
+        order = "desc" if sort_field.startswith("-") else "asc"
+        sort.append({sort_field.removeprefix("-"): order})
+    elif query:
+        sort.append({"_score": "desc"})
+    sort.append({"id": "asc"})
+    return sort
+
+
 def get_hits(docs: Optional[dict], schema: Schemas):
     hits: dict = docs.get("hits").get("hits")
     data: list = [row.get("_source") for row in hits]
@@ -52,11 +70,32 @@ def get_hits(docs: Optional[dict], schema: Schemas):
     return parse_data
 
 
-def create_hash_key(index: str, params: str) -> str:
+def dump_page(page: tuple[int, list[BaseModel], Optional[str]]) -> bytes:
+    """
+    :param page: число найденных объектов, объекты страницы и курсор следующей страницы
+    :return: страница для кеша вместе с числом найденных объектов и курсором
+    """
+    total, items, next_cursor = page
+    return orjson.dumps(
+        {
+            "total": total,
+            "items": [item.dict() for item in items],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def load_page(
+    data: bytes, schema: Type[BaseModel]
+) -> tuple[int, list, Optional[str]]:
     """
-    :param index: индекс в elasticsearch
-    :param params: параметры запроса
-    :return: хешированый ключ в md5
+    :param data: страница из кеша
+    :param schema: модель объектов страницы
+    :return: число найденных объектов, объекты страницы и курсор следующей страницы
     """
-    hash_key = hashlib.md5(params.encode()).hexdigest()
-    return f"{index}:{hash_key}"
+    page: dict = orjson.loads(data)
+    return (
+        page["total"],
+        [schema(**row) for row in page["items"]],
+        page.get("next_cursor"),
+    )